@@ -0,0 +1,155 @@
+import asyncio
+import re
+import time
+from datetime import datetime
+from urllib.parse import parse_qsl
+
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import parse_etags, quote_etag
+
+from app.config import Config
+from app import cache_contas, ciclo_de_vida, metricas, shards
+from app.assincrono.banco import criar_banco_assincrono
+from app.assincrono.consultas import ConsultasAssincronas
+from app.assincrono.ponte_wsgi import PonteWSGI
+from app.services.conta_service import ContaService
+from app.services.snapshot_service import SnapshotService
+
+ROTA_EXTRATO = re.compile(r"^/conta/conta/(\d+)/extrato$")
+ROTA_SALDO = re.compile(r"^/conta/conta/(\d+)/saldo$")
+
+
+class Requisicao:
+    def __init__(self, scope):
+        self.args = MultiDict(parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True))
+        self.headers = {nome.decode("latin-1").lower(): valor.decode("latin-1") for nome, valor in scope["headers"]}
+
+
+class AplicacaoASGI:
+    # As rotas de leitura mais acessadas (extrato em JSON e saldo) rodam direto no
+    # event loop, com driver assíncrono; todas as outras seguem para o Flask pela ponte WSGI.
+    def __init__(self, app_flask):
+        self.app_flask = app_flask
+        self.banco = criar_banco_assincrono()
+        self.banco_iniciado = False
+        self.ponte = PonteWSGI(app_flask, Config.ASGI_WSGI_THREADS)
+        self.rotas = (
+            (ROTA_EXTRATO, "conta.mostrar_extrato", self.mostrar_extrato),
+            (ROTA_SALDO, "conta.saldo_historico", self.saldo_historico),
+        )
+        # O driver assíncrono só conhece o banco principal; com shards, tudo vai pela ponte.
+        if shards.ativo():
+            self.rotas = ()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.ciclo_de_vida(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        if scope["method"] == "GET":
+            for padrao, endpoint, rota in self.rotas:
+                encontrado = padrao.match(scope["path"])
+                if encontrado:
+                    requisicao = Requisicao(scope)
+                    # Os formatos em stream do extrato continuam no Flask.
+                    if endpoint == "conta.mostrar_extrato" and requisicao.args.get("formato", "json").lower() != "json":
+                        break
+                    await self.responder(endpoint, rota, int(encontrado.group(1)), requisicao, send)
+                    return
+
+        await self.ponte(scope, receive, send)
+
+    async def ciclo_de_vida(self, receive, send):
+        while True:
+            mensagem = await receive()
+            if mensagem["type"] == "lifespan.startup":
+                try:
+                    await self.iniciar_banco()
+                    await asyncio.to_thread(ciclo_de_vida.aquecer, self.app_flask)
+                except Exception as err:
+                    await send({"type": "lifespan.startup.failed", "message": str(err)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif mensagem["type"] == "lifespan.shutdown":
+                ciclo_de_vida.marcar_encerrando()
+                await asyncio.to_thread(self.ponte.fechar)
+                await self.banco.fechar()
+                await asyncio.to_thread(ciclo_de_vida.encerrar, Config.SERVIDOR_TIMEOUT_ENCERRAMENTO)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def iniciar_banco(self):
+        if not self.banco_iniciado:
+            await self.banco.iniciar()
+            self.banco_iniciado = True
+
+    async def responder(self, endpoint, rota, id, requisicao, send):
+        inicio = time.perf_counter()
+        await self.iniciar_banco()
+        status, corpo, cabecalhos = await rota(id, requisicao)
+        if corpo is not None:
+            # Mesmo serializador do jsonify: o corpo sai idêntico ao do modo WSGI.
+            resposta = self.app_flask.json.response(corpo)
+            dados = resposta.get_data()
+            cabecalhos = {**cabecalhos, "Content-Type": resposta.mimetype}
+        else:
+            dados = b""
+        cabecalhos["Content-Length"] = str(len(dados))
+
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(nome.lower().encode("latin-1"), valor.encode("latin-1")) for nome, valor in cabecalhos.items()],
+        })
+        await send({"type": "http.response.body", "body": dados})
+        metricas.observar("banco_http_requisicao_duracao_segundos",
+                          (("rota", endpoint), ("metodo", "GET"), ("status", str(status))),
+                          time.perf_counter() - inicio)
+
+    async def mostrar_extrato(self, id, requisicao):
+        try:
+            parametros = ContaService.validar_parametros_extrato(requisicao.args)
+        except Exception as err:
+            return 400, {"erro": str(err)}, {}
+
+        try:
+            versao = await ConsultasAssincronas.versao_extrato(self.banco, id)
+            if not versao:
+                return 404, {"erro": f"Conta com id {id} não encontrada"}, {}
+
+            etag = ContaService.etag_extrato(versao, requisicao.args)
+            cabecalhos = {"ETag": quote_etag(etag), "Cache-Control": "private, no-cache"}
+            if parse_etags(requisicao.headers.get("if-none-match")).contains(etag):
+                return 304, None, cabecalhos
+
+            conta = {"id": versao["id"], "saldo": versao["saldo"]}
+            totais = await ConsultasAssincronas.buscar_totais(self.banco, id)
+            historico, proximo_cursor = await ConsultasAssincronas.pegar_dados_do_extrato(
+                self.banco, id, parametros["limite"], parametros["apos"], parametros["de"], parametros["ate"])
+
+            extrato = ContaService.retorno_extrato(conta, historico, totais, id)
+            extrato["proximo_cursor"] = proximo_cursor
+            return 200, extrato, cabecalhos
+
+        except Exception as err:
+            return 500, {"erro": f"Ocorreu um erro inesperado: {err}"}, {}
+
+    async def saldo_historico(self, id, requisicao):
+        try:
+            momento = SnapshotService.validar_momento(requisicao.args.get("em"), "em", padrao=datetime.now())
+        except Exception as err:
+            return 400, {"erro": str(err)}, {}
+
+        try:
+            carregar = lambda id_conta: ConsultasAssincronas.buscar_conta(self.banco, id_conta)
+            conta = await cache_contas.obter_assincrono(id, carregar)
+            if not conta:
+                return 404, {"erro": f"Conta com id {id} não encontrada"}, {}
+
+            saldo = await ConsultasAssincronas.saldo_em(self.banco, id, momento)
+            return 200, {"conta_id": id, "em": momento.isoformat(), "saldo": saldo}, {}
+
+        except Exception as err:
+            return 500, {"erro": f"Ocorreu um erro inesperado: {err}"}, {}
@@ -0,0 +1,82 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from app.config import Config
+from app.database import get_pool
+
+
+class BancoMySQLAssincrono:
+    # Pool do aiomysql: as consultas esperam no event loop, sem prender uma thread.
+    def __init__(self):
+        self.pool = None
+
+    async def iniciar(self):
+        try:
+            import aiomysql
+        except ImportError:
+            raise Exception("O modo ASGI com MySQL exige o pacote 'aiomysql' (pip install aiomysql).")
+        self.aiomysql = aiomysql
+        self.pool = await aiomysql.create_pool(
+            host = Config.DB_HOST,
+            user = Config.DB_USER,
+            password = Config.DB_PASSWORD or "",
+            db = Config.DB_NAME,
+            minsize = Config.ASGI_DB_POOL_MIN,
+            maxsize = Config.ASGI_DB_POOL_MAX,
+            pool_recycle = Config.DB_POOL_MAX_LIFETIME,
+            autocommit = True,
+        )
+
+    async def fechar(self):
+        if self.pool is not None:
+            self.pool.close()
+            await self.pool.wait_closed()
+            self.pool = None
+
+    @asynccontextmanager
+    async def cursor(self, dictionary=False):
+        classe = self.aiomysql.DictCursor if dictionary else self.aiomysql.Cursor
+        async with self.pool.acquire() as conexao:
+            async with conexao.cursor(classe) as cursor:
+                yield cursor
+
+
+class CursorEmThread:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    async def execute(self, operation, params=None):
+        await asyncio.to_thread(self._cursor.execute, operation, params)
+
+    async def fetchone(self):
+        return self._cursor.fetchone()
+
+    async def fetchall(self):
+        return self._cursor.fetchall()
+
+
+class BancoSQLiteAssincrono:
+    # O SQLite é um arquivo local e não tem driver de rede para esperar: as consultas
+    # rodam em threads, com as conexões do pool síncrono.
+    async def iniciar(self):
+        pass
+
+    async def fechar(self):
+        pass
+
+    @asynccontextmanager
+    async def cursor(self, dictionary=False):
+        pool = get_pool()
+        conexao = await asyncio.to_thread(pool.obter)
+        cursor = conexao.cursor(dictionary=dictionary)
+        try:
+            yield CursorEmThread(cursor)
+        finally:
+            cursor.close()
+            pool.devolver(conexao)
+
+
+def criar_banco_assincrono():
+    if Config.DB_BACKEND == "sqlite":
+        return BancoSQLiteAssincrono()
+    return BancoMySQLAssincrono()
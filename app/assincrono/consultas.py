@@ -0,0 +1,54 @@
+import asyncio
+
+from app.services.arquivo_service import ArquivoService
+from app.services.auth_service import CONSULTA_CONTA
+from app.services.conta_service import ContaService, CONSULTA_VERSAO_EXTRATO
+from app.services.fatias_service import FatiasService
+from app.services.totais_service import TotaisService, CONSULTA_TOTAIS_CONTA
+from app.services.snapshot_service import SnapshotService, CONSULTA_ULTIMO_SNAPSHOT
+
+
+class ConsultasAssincronas:
+    # Versões com await das leituras usadas pelas rotas de extrato e saldo; o SQL
+    # e o tratamento das linhas são os mesmos dos serviços síncronos.
+    @staticmethod
+    async def buscar_conta(banco, id):
+        async with banco.cursor(dictionary=True) as cursor:
+            await cursor.execute(CONSULTA_CONTA, (id,))
+            return FatiasService.somar_fatias(await cursor.fetchone())
+
+    @staticmethod
+    async def versao_extrato(banco, id):
+        async with banco.cursor(dictionary=True) as cursor:
+            await cursor.execute(CONSULTA_VERSAO_EXTRATO, (id,))
+            return FatiasService.somar_fatias(await cursor.fetchone())
+
+    @staticmethod
+    async def buscar_totais(banco, id):
+        async with banco.cursor(dictionary=True) as cursor:
+            await cursor.execute(CONSULTA_TOTAIS_CONTA, (id, id))
+            return TotaisService.totais_ou_zeros(await cursor.fetchone())
+
+    @staticmethod
+    async def pegar_dados_do_extrato(banco, id, limite, apos=None, de=None, ate=None):
+        async with banco.cursor() as cursor:
+            consulta, parametros = ContaService.montar_consulta_extrato(
+                id, limite + 1, apos, ArquivoService.inicio_quente(id, de), ate)
+            await cursor.execute(consulta, parametros)
+            linhas = list(await cursor.fetchall())
+        # Os segmentos arquivados são lidos do disco fora do event loop, e só quando a página chega neles.
+        if ArquivoService.precisa_completar(id, linhas, limite + 1, de):
+            linhas = await asyncio.to_thread(ArquivoService.completar_extrato, id, linhas, limite + 1, apos, de, ate)
+        return ContaService.paginar_extrato(linhas, limite)
+
+    @staticmethod
+    async def saldo_em(banco, id, momento):
+        async with banco.cursor() as cursor:
+            await cursor.execute(CONSULTA_ULTIMO_SNAPSHOT, (id, momento.date()))
+            saldo, inicio = SnapshotService.ponto_de_partida(await cursor.fetchone())
+            await cursor.execute(*SnapshotService.montar_consulta_variacao(id, ArquivoService.inicio_quente(id, inicio), momento))
+            saldo += (await cursor.fetchone())[0] or 0
+        arquivado = SnapshotService.intervalo_arquivado(id, inicio, momento)
+        if arquivado:
+            saldo += await asyncio.to_thread(ArquivoService.variacao, id, *arquivado)
+        return saldo
@@ -0,0 +1,124 @@
+import asyncio
+import io
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+FIM = object()
+
+
+def montar_environ(scope, corpo):
+    servidor = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": servidor[0],
+        "SERVER_PORT": str(servidor[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": scope["client"][0] if scope.get("client") else "",
+        "CONTENT_LENGTH": str(len(corpo)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(corpo),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for nome, valor in scope["headers"]:
+        nome = nome.decode("latin-1").upper().replace("-", "_")
+        valor = valor.decode("latin-1")
+        if nome == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = valor
+            continue
+        if nome == "CONTENT_LENGTH":
+            continue
+        chave = f"HTTP_{nome}"
+        environ[chave] = f"{environ[chave]},{valor}" if chave in environ else valor
+    return environ
+
+
+class PonteWSGI:
+    # Serve a aplicação Flask dentro do servidor ASGI. Cada requisição roda inteira
+    # (inclusive a iteração do corpo, que pode ser um stream) em uma única thread do
+    # pool, porque os contextos do Flask não podem trocar de thread no meio do caminho.
+    def __init__(self, app_wsgi, threads):
+        self.app_wsgi = app_wsgi
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="wsgi")
+
+    def fechar(self):
+        self.executor.shutdown(wait=True)
+
+    async def __call__(self, scope, receive, send):
+        corpo = bytearray()
+        while True:
+            mensagem = await receive()
+            if mensagem["type"] == "http.disconnect":
+                return
+            corpo += mensagem.get("body", b"")
+            if not mensagem.get("more_body"):
+                break
+
+        loop = asyncio.get_running_loop()
+        # Fila limitada: se o cliente lê devagar, a thread espera em vez de acumular o corpo.
+        fila = asyncio.Queue(maxsize=16)
+        desconectado = threading.Event()
+
+        def entregar(item):
+            asyncio.run_coroutine_threadsafe(fila.put(item), loop).result()
+
+        def executar():
+            def start_response(status, cabecalhos, exc_info=None):
+                entregar(("inicio", int(status.split(" ", 1)[0]), cabecalhos))
+
+            try:
+                resultado = self.app_wsgi(montar_environ(scope, bytes(corpo)), start_response)
+                try:
+                    for parte in resultado:
+                        if desconectado.is_set():
+                            break
+                        if parte:
+                            entregar(("corpo", parte))
+                finally:
+                    if hasattr(resultado, "close"):
+                        resultado.close()
+            finally:
+                entregar(FIM)
+
+        async def aguardar_desconexao():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            desconectado.set()
+
+        vigia = asyncio.ensure_future(aguardar_desconexao())
+        tarefa = loop.run_in_executor(self.executor, executar)
+        terminou = False
+        try:
+            while True:
+                item = await fila.get()
+                if item is FIM:
+                    terminou = True
+                    break
+                if desconectado.is_set():
+                    # Continua esvaziando a fila até a thread terminar.
+                    continue
+                if item[0] == "inicio":
+                    await send({
+                        "type": "http.response.start",
+                        "status": item[1],
+                        "headers": [(nome.lower().encode("latin-1"), valor.encode("latin-1")) for nome, valor in item[2]],
+                    })
+                else:
+                    await send({"type": "http.response.body", "body": item[1], "more_body": True})
+            if not desconectado.is_set():
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            vigia.cancel()
+            if not terminou:
+                # O envio falhou no meio: avisa a thread e esvazia a fila até ela terminar.
+                desconectado.set()
+                while await fila.get() is not FIM:
+                    pass
+            await tarefa
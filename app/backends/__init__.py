@@ -0,0 +1,17 @@
+from app.config import Config
+from app import replicas
+
+
+def get_backend(shard=None, replica=None):
+    # shard: posição em Config.DB_SHARDS; None é o banco principal. replica: posição
+    # entre as réplicas desse banco; None é o primário.
+    destino = Config.DB_SHARDS[shard] if shard is not None else None
+    if replica is not None:
+        destino = replicas.do_banco(shard)[replica]
+    if Config.DB_BACKEND == "sqlite":
+        from app.backends.sqlite import BackendSQLite
+        return BackendSQLite(destino)
+    if Config.DB_BACKEND == "mysql":
+        from app.backends.mysql import BackendMySQL
+        return BackendMySQL(destino)
+    raise Exception(f"DB_BACKEND inválido: '{Config.DB_BACKEND}'. Use 'mysql' ou 'sqlite'.")
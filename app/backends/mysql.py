@@ -0,0 +1,88 @@
+import mysql.connector
+
+from app.config import Config
+from app import migracoes
+
+
+def ler_destino(destino):
+    # "host[:porta]/banco", como em DB_SHARDS e DB_REPLICAS.
+    endereco, _, banco = destino.partition("/")
+    host, _, porta = endereco.partition(":")
+    if not host or not banco:
+        raise Exception(f"Destino MySQL inválido: '{destino}'. Use host[:porta]/banco.")
+    return host, int(porta) if porta else 3306, banco
+
+
+class BackendMySQL:
+    nome = "mysql"
+
+    def __init__(self, destino=None):
+        if destino:
+            self.host, self.porta, self.banco = ler_destino(destino)
+        else:
+            self.host, self.porta, self.banco = Config.DB_HOST, 3306, Config.DB_NAME
+
+    def conectar(self):
+        return mysql.connector.connect(
+            host = self.host,
+            port = self.porta,
+            user = Config.DB_USER,
+            password = Config.DB_PASSWORD,
+            database = self.banco
+        )
+
+    def abrir_conexao(self):
+        # O schema do MySQL não é criado aqui: rode 'flask --app main db migrar'.
+        return self.conectar()
+
+    def conectar_replica(self):
+        conexao = self.conectar()
+        cursor = conexao.cursor()
+        try:
+            cursor.execute("SET SESSION TRANSACTION READ ONLY")
+        finally:
+            cursor.close()
+        return conexao
+
+    def atraso_replica(self, conexao):
+        # Segundos de atraso da replicação; None se ela estiver parada. Um servidor
+        # que não replica de ninguém (ex.: atrás de um proxy) conta como em dia.
+        cursor = conexao.cursor(dictionary=True)
+        try:
+            try:
+                cursor.execute("SHOW REPLICA STATUS")
+                coluna = "Seconds_Behind_Source"
+            except mysql.connector.Error:
+                # Antes do MySQL 8.0.22.
+                cursor.execute("SHOW SLAVE STATUS")
+                coluna = "Seconds_Behind_Master"
+            estado = cursor.fetchone()
+            cursor.fetchall()
+        finally:
+            cursor.close()
+        if estado is None:
+            return 0.0
+        atraso = estado.get(coluna)
+        return float(atraso) if atraso is not None else None
+
+    def criar_banco(self):
+        conexao = mysql.connector.connect(
+            host = self.host,
+            port = self.porta,
+            user = Config.DB_USER,
+            password = Config.DB_PASSWORD
+        )
+        try:
+            cursor = conexao.cursor()
+            cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{self.banco}`")
+            cursor.close()
+        finally:
+            conexao.close()
+
+    def migrar(self, ate=None):
+        self.criar_banco()
+        conexao = self.conectar()
+        try:
+            return migracoes.migrar(conexao, self.nome, ate)
+        finally:
+            conexao.close()
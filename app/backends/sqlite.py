@@ -0,0 +1,181 @@
+import re
+import sqlite3
+import threading
+from datetime import date, datetime
+
+from app.config import Config
+from app import migracoes
+
+# Traduções do dialeto MySQL usado pelos serviços para o SQLite. Só cobrem as
+# construções que os serviços realmente usam; SQL novo deve continuar nesse subconjunto.
+TRADUCOES = (
+    (re.compile(r"\s+FOR UPDATE\b", re.IGNORECASE), ""),
+    (re.compile(r"\s+LOCK IN SHARE MODE\b", re.IGNORECASE), ""),
+    (re.compile(r"\bON DUPLICATE KEY UPDATE\b", re.IGNORECASE), "ON CONFLICT DO UPDATE SET"),
+    (re.compile(r"\bVALUES\((\w+)\)", re.IGNORECASE), r"excluded.\1"),
+    (re.compile(r"\bGREATEST\(", re.IGNORECASE), "MAX("),
+    (re.compile(r"%s"), "?"),
+)
+UPDATE_COM_ORDER_BY = re.compile(r"^(\s*UPDATE\b.*?)\s+ORDER BY\s+[\w\s,]+$", re.IGNORECASE | re.DOTALL)
+
+_traducoes_cache = {}
+
+
+def traduzir_sql(sql):
+    traduzido = _traducoes_cache.get(sql)
+    if traduzido is None:
+        traduzido = sql
+        for padrao, substituto in TRADUCOES:
+            traduzido = padrao.sub(substituto, traduzido)
+        # O SQLite só aceita ORDER BY em UPDATE quando compilado com uma flag opcional;
+        # como ele serializa as escritas, a ordem de travamento não importa aqui.
+        traduzido = UPDATE_COM_ORDER_BY.sub(r"\1", traduzido.strip())
+        _traducoes_cache[sql] = traduzido
+    return traduzido
+
+
+sqlite3.register_adapter(datetime, lambda valor: valor.isoformat(" "))
+sqlite3.register_adapter(date, lambda valor: valor.isoformat())
+sqlite3.register_converter("TIMESTAMP", lambda valor: datetime.fromisoformat(valor.decode()))
+sqlite3.register_converter("DATE", lambda valor: date.fromisoformat(valor.decode()))
+
+
+class CursorSQLite:
+    def __init__(self, conexao, dictionary=False):
+        self._cursor = conexao.cursor()
+        self._dictionary = dictionary
+        self.lastrowid = None
+        self.rowcount = -1
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def _linha(self, linha):
+        if linha is None or not self._dictionary:
+            return linha
+        return dict(zip([coluna[0] for coluna in self._cursor.description], linha))
+
+    def execute(self, operation, params=None):
+        self._cursor.execute(traduzir_sql(operation), tuple(params or ()))
+        self.lastrowid = self._cursor.lastrowid
+        self.rowcount = self._cursor.rowcount
+
+    def executemany(self, operation, seq_params):
+        # Como no mysql-connector, lastrowid aponta para a primeira linha inserida.
+        sql = traduzir_sql(operation)
+        primeiro_id = None
+        total = 0
+        for params in seq_params:
+            self._cursor.execute(sql, tuple(params))
+            if primeiro_id is None:
+                primeiro_id = self._cursor.lastrowid
+            total += self._cursor.rowcount
+        self.lastrowid = primeiro_id
+        self.rowcount = total
+
+    def fetchone(self):
+        return self._linha(self._cursor.fetchone())
+
+    def fetchmany(self, size=1):
+        return [self._linha(linha) for linha in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._linha(linha) for linha in self._cursor.fetchall()]
+
+    def close(self):
+        self._cursor.close()
+
+
+class ConexaoSQLite:
+    def __init__(self, conexao):
+        self._conexao = conexao
+
+    def cursor(self, dictionary=False, buffered=None):
+        return CursorSQLite(self._conexao, dictionary)
+
+    @property
+    def in_transaction(self):
+        return self._conexao.in_transaction
+
+    def start_transaction(self):
+        if not self._conexao.in_transaction:
+            self._conexao.execute("BEGIN IMMEDIATE")
+
+    def commit(self):
+        self._conexao.commit()
+
+    def rollback(self):
+        self._conexao.rollback()
+
+    def is_connected(self):
+        try:
+            self._conexao.execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def close(self):
+        self._conexao.close()
+
+
+class BackendSQLite:
+    nome = "sqlite"
+    _schema_lock = threading.Lock()
+    _schema_criado = set()
+
+    def __init__(self, caminho=None):
+        self._caminho = caminho
+
+    @property
+    def caminho(self):
+        return self._caminho or Config.SQLITE_PATH
+
+    def conectar(self):
+        conexao = sqlite3.connect(
+            self.caminho,
+            timeout=Config.SQLITE_BUSY_TIMEOUT,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            isolation_level="IMMEDIATE",
+            check_same_thread=False,
+        )
+        conexao.execute("PRAGMA journal_mode=WAL")
+        conexao.execute("PRAGMA synchronous=NORMAL")
+        conexao.execute("PRAGMA foreign_keys=ON")
+        return ConexaoSQLite(conexao)
+
+    def conectar_replica(self):
+        # A cópia é mantida por uma ferramenta externa; a aplicação nunca escreve nela.
+        conexao = self.conectar()
+        cursor = conexao.cursor()
+        cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+        return conexao
+
+    def atraso_replica(self, conexao):
+        # O SQLite não expõe o atraso da cópia: ela é sempre considerada em dia.
+        return 0.0
+
+    def abrir_conexao(self):
+        conexao = self.conectar()
+        self.criar_schema(conexao)
+        return conexao
+
+    def criar_schema(self, conexao):
+        # O banco embutido é migrado sozinho, na primeira conexão de cada processo.
+        with BackendSQLite._schema_lock:
+            if self.caminho in BackendSQLite._schema_criado:
+                return
+            migracoes.migrar(conexao, self.nome)
+            BackendSQLite._schema_criado.add(self.caminho)
+        # Migrações que reconstroem tabelas desligam as chaves estrangeiras.
+        cursor = conexao.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+    def migrar(self, ate=None):
+        conexao = self.conectar()
+        try:
+            return migracoes.migrar(conexao, self.nome, ate)
+        finally:
+            conexao.close()
@@ -0,0 +1,55 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheLRU:
+    def __init__(self, tamanho_max, ttl_segundos):
+        self.tamanho_max = tamanho_max
+        self.ttl_segundos = ttl_segundos
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+    def obter(self, chave):
+        agora = time.time()
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                self.falhas += 1
+                return None
+            valor, expira_em = item
+            if expira_em <= agora:
+                del self._itens[chave]
+                self.falhas += 1
+                return None
+            self._itens.move_to_end(chave)
+            self.acertos += 1
+            return valor
+
+    def definir(self, chave, valor, expira_em=None):
+        # O item vence no que ocorrer primeiro: o TTL do cache ou expira_em.
+        limite = time.time() + self.ttl_segundos
+        expira_em = min(limite, expira_em) if expira_em is not None else limite
+        with self._lock:
+            self._itens[chave] = (valor, expira_em)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.tamanho_max:
+                self._itens.popitem(last=False)
+
+    def invalidar(self, chave):
+        with self._lock:
+            self._itens.pop(chave, None)
+
+    def invalidar_se(self, predicado):
+        with self._lock:
+            for chave in [chave for chave, (valor, _) in self._itens.items() if predicado(valor)]:
+                del self._itens[chave]
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+    def __len__(self):
+        return len(self._itens)
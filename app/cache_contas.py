@@ -0,0 +1,189 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from flask import g, has_request_context
+
+from app.cache import CacheLRU
+from app.config import Config
+from app import metricas, replicas
+
+logger = logging.getLogger("app.cache_contas")
+
+# Cache de leitura de contas (id, saldo, status). Só serve leituras consultivas,
+# como checagens de 404 e o cabeçalho do extrato; decisões sobre saldo continuam
+# sendo tomadas pelo banco, dentro da transação.
+cache_contas = CacheLRU(Config.CONTA_CACHE_TAMANHO, Config.CONTA_CACHE_TTL_SEGUNDOS)
+
+# Uma leitura que começou antes de uma invalidação não pode repovoar o cache com
+# o valor antigo: cada faixa de ids tem uma geração, incrementada a cada invalidação.
+FAIXAS_GERACAO = 1024
+_geracoes = [0] * FAIXAS_GERACAO
+_geracoes_lock = threading.Lock()
+
+_origem = uuid.uuid4().hex
+# Funções chamadas com os ids de usuários cujos tokens foram revogados em outro
+# processo, ou com None quando mensagens do canal podem ter sido perdidas.
+_ouvintes_usuarios = []
+_canal = None
+_canal_pid = None
+_canal_lock = threading.Lock()
+
+
+def obter(id, carregar):
+    id = int(id)
+    conta = cache_contas.obter(id)
+    if conta is not None:
+        return dict(conta)
+
+    iniciar_canal()
+    geracao = _geracoes[id % FAIXAS_GERACAO]
+    conta = carregar(id)
+    if conta is not None:
+        with _geracoes_lock:
+            if _geracoes[id % FAIXAS_GERACAO] == geracao:
+                cache_contas.definir(id, dict(conta))
+    return conta
+
+
+async def obter_assincrono(id, carregar):
+    # Mesma lógica de obter(), para o modo ASGI, em que carregar é uma corrotina.
+    id = int(id)
+    conta = cache_contas.obter(id)
+    if conta is not None:
+        return dict(conta)
+
+    iniciar_canal()
+    geracao = _geracoes[id % FAIXAS_GERACAO]
+    conta = await carregar(id)
+    if conta is not None:
+        with _geracoes_lock:
+            if _geracoes[id % FAIXAS_GERACAO] == geracao:
+                cache_contas.definir(id, dict(conta))
+    return conta
+
+
+def invalidar_local(ids):
+    with _geracoes_lock:
+        for id in ids:
+            _geracoes[id % FAIXAS_GERACAO] += 1
+            cache_contas.invalidar(id)
+    # A mesma notificação (local ou vinda do canal) abre a janela de leitura no primário.
+    replicas.marcar_contas(ids)
+
+
+def registrar_ouvinte_usuarios(funcao):
+    _ouvintes_usuarios.append(funcao)
+    return funcao
+
+
+def avisar_ouvintes_usuarios(usuarios):
+    for funcao in _ouvintes_usuarios:
+        funcao(usuarios)
+
+
+def invalidar_usuarios(*usuarios):
+    # Os tokens são invalidados no processo pelo próprio chamador; o canal leva o aviso aos outros.
+    canal = iniciar_canal()
+    if canal is not None:
+        canal.publicar([], sorted({int(usuario) for usuario in usuarios}))
+
+
+def invalidar(*ids):
+    ids = sorted({int(id) for id in ids})
+    if not ids:
+        return
+    invalidar_local(ids)
+    canal = iniciar_canal()
+    if canal is not None:
+        canal.publicar(ids)
+
+
+def invalidar_apos_commit(*ids):
+    # Dentro de uma requisição, a invalidação espera o commit: antes dele, uma
+    # leitura concorrente ainda veria o valor antigo no banco e o recolocaria no cache.
+    if not has_request_context():
+        invalidar(*ids)
+        return
+    pendentes = g.setdefault("contas_alteradas", set())
+    pendentes.update(int(id) for id in ids)
+
+
+def aplicar_pendentes():
+    if not has_request_context():
+        return
+    pendentes = g.pop("contas_alteradas", None)
+    if pendentes:
+        invalidar(*pendentes)
+
+
+class CanalRedis:
+    # Propaga invalidações entre processos (vários workers ou máquinas) via pub/sub.
+    def __init__(self, url, nome):
+        try:
+            import redis
+        except ImportError:
+            raise Exception("CONTA_CACHE_REDIS_URL exige o pacote 'redis' (pip install redis).")
+        self.nome = nome
+        self.cliente = redis.Redis.from_url(url)
+        self.thread = threading.Thread(target=self.escutar, name="cache-contas-invalidacoes", daemon=True)
+        self.thread.start()
+
+    def publicar(self, ids, usuarios=()):
+        try:
+            mensagem = {"origem": _origem, "ids": ids}
+            if usuarios:
+                mensagem["usuarios"] = list(usuarios)
+            self.cliente.publish(self.nome, json.dumps(mensagem))
+        except Exception as err:
+            # Sem o canal, os outros processos só enxergam a mudança quando o TTL vencer.
+            logger.warning("Falha ao publicar invalidação de contas: %s", err)
+
+    def escutar(self):
+        while True:
+            try:
+                assinatura = self.cliente.pubsub(ignore_subscribe_messages=True)
+                assinatura.subscribe(self.nome)
+                # Mensagens perdidas enquanto a assinatura estava fora não voltam.
+                cache_contas.limpar()
+                avisar_ouvintes_usuarios(None)
+                for mensagem in assinatura.listen():
+                    dados = json.loads(mensagem["data"])
+                    if dados["origem"] != _origem:
+                        if dados["ids"]:
+                            invalidar_local(dados["ids"])
+                        if dados.get("usuarios"):
+                            avisar_ouvintes_usuarios(dados["usuarios"])
+            except Exception as err:
+                logger.warning("Canal de invalidação de contas indisponível: %s", err)
+                cache_contas.limpar()
+                avisar_ouvintes_usuarios(None)
+                time.sleep(1)
+
+
+def iniciar_canal():
+    global _canal, _canal_pid
+    if not Config.CONTA_CACHE_REDIS_URL:
+        return None
+    # Um canal (e uma thread de escuta) por processo; após um fork, o do pai é ignorado.
+    if _canal is None or _canal_pid != os.getpid():
+        with _canal_lock:
+            if _canal is None or _canal_pid != os.getpid():
+                cache_contas.limpar()
+                _canal = CanalRedis(Config.CONTA_CACHE_REDIS_URL, Config.CONTA_CACHE_CANAL)
+                _canal_pid = os.getpid()
+    return _canal
+
+
+@metricas.registrar_coletor
+def coletar_metricas_cache():
+    return [
+        ("banco_cache_contas_consultas_total", "counter", "Consultas ao cache de contas por resultado.", [
+            ((("resultado", "acerto"),), cache_contas.acertos),
+            ((("resultado", "falha"),), cache_contas.falhas),
+        ]),
+        ("banco_cache_contas_itens", "gauge", "Contas atualmente no cache.", [((), len(cache_contas))]),
+    ]
@@ -0,0 +1,118 @@
+import functools
+import logging
+import threading
+import time
+
+from jose import jwt
+
+from app.config import Config
+from app import database, shards
+from app.services.auth_service import AuthService
+from app.services.senha_service import SenhaService, encerrar_executor
+from app.services.group_commit import get_group_commit
+from app.services.fatias_service import FatiasService, get_consolidador
+from app.services.transferencias_service import get_recuperador
+
+logger = logging.getLogger("app.ciclo_de_vida")
+
+_estado = {"pronto": False, "encerrando": False}
+_operacoes_em_andamento = 0
+_operacoes_condicao = threading.Condition()
+
+
+def aquecer(app):
+    inicio = time.perf_counter()
+
+    # JWT: falha já na subida se a SECRET_KEY estiver faltando e deixa o backend
+    # de criptografia carregado.
+    token = AuthService.criar_token_acesso(0)
+    jwt.decode(token, Config.SECRET_KEY, algorithms=[Config.ALGORITHM])
+
+    SenhaService.aquecer()
+    for banco in shards.todos_os_bancos():
+        database.get_pool(banco).preencher(Config.DB_POOL_PREENCHER)
+    if Config.GROUP_COMMIT_ATIVO:
+        for shard in shards.indices():
+            get_group_commit(shard)
+    if shards.ativo() and Config.SHARD_RECUPERACAO_SEGUNDOS > 0:
+        get_recuperador(app)
+    if Config.SALDO_FATIADO_CONTAS:
+        FatiasService.preparar()
+        if Config.SALDO_FATIADO_CONSOLIDAR_SEGUNDOS > 0:
+            get_consolidador()
+
+    # Uma primeira requisição interna inicializa o roteamento e as extensões do Flask.
+    app.test_client().get("/saude/vivo")
+
+    _estado["pronto"] = True
+    logger.info("Aquecimento concluído em %.3fs", time.perf_counter() - inicio)
+
+
+def marcar_encerrando():
+    _estado["encerrando"] = True
+
+
+def esta_pronto():
+    return _estado["pronto"] and not _estado["encerrando"]
+
+
+def esta_encerrando():
+    return _estado["encerrando"]
+
+
+def banco_disponivel():
+    # Com shards, o processo só está saudável se alcança o diretório e todos os shards.
+    return all(pool_disponivel(database.get_pool(banco)) for banco in shards.todos_os_bancos())
+
+
+def pool_disponivel(pool):
+    try:
+        conexao = pool.obter()
+    except Exception:
+        return False
+    try:
+        cursor = conexao.cursor()
+        cursor.execute("SELECT 1")
+        cursor.fetchall()
+        cursor.close()
+    except database.ErroBanco:
+        pool.devolver(conexao, descartar=True)
+        return False
+    pool.devolver(conexao)
+    return True
+
+
+def rastrear_operacao(funcao):
+    # Marca rotas que movimentam dinheiro: no encerramento, o processo espera que
+    # terminem antes de fechar o pool de conexões.
+    @functools.wraps(funcao)
+    def executar(*args, **kwargs):
+        global _operacoes_em_andamento
+        with _operacoes_condicao:
+            _operacoes_em_andamento += 1
+        try:
+            return funcao(*args, **kwargs)
+        finally:
+            with _operacoes_condicao:
+                _operacoes_em_andamento -= 1
+                _operacoes_condicao.notify_all()
+    return executar
+
+
+def aguardar_operacoes(timeout):
+    limite = time.monotonic() + timeout
+    with _operacoes_condicao:
+        while _operacoes_em_andamento > 0:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                return False
+            _operacoes_condicao.wait(restante)
+    return True
+
+
+def encerrar(timeout):
+    marcar_encerrando()
+    if not aguardar_operacoes(timeout):
+        logger.warning("Encerrando com %d operação(ões) ainda em andamento", _operacoes_em_andamento)
+    database.fechar_pool()
+    encerrar_executor()
@@ -0,0 +1,166 @@
+import json
+
+import click
+from flask.cli import AppGroup
+
+from app.services.auth_service import AuthService
+from app.services.totais_service import TotaisService
+from app.services.snapshot_service import SnapshotService
+from app.services.fatias_service import FatiasService
+from app.services.particoes_service import ParticoesService
+from app.services.arquivo_service import ArquivoService
+from app.services.transferencias_service import TransferenciasService
+from app.backends import get_backend
+from app.database import usando_shard
+from app import migracoes, shards
+
+totais_cli = AppGroup("totais", help="Manutenção da tabela totais_conta.")
+snapshots_cli = AppGroup("snapshots", help="Snapshots diários de saldo.")
+fatias_cli = AppGroup("fatias", help="Saldo fatiado das contas quentes.")
+db_cli = AppGroup("db", help="Migrações do schema do banco.")
+particoes_cli = AppGroup("particoes", help="Partições mensais da tabela transacoes.")
+arquivo_cli = AppGroup("arquivo", help="Arquivamento de transações antigas em segmentos.")
+shards_cli = AppGroup("shards", help="Shards de contas e transferências entre shards.")
+usuarios_cli = AppGroup("usuarios", help="Acesso dos usuários.")
+
+
+def shards_alvo(conta_id):
+    # Jobs por conta rodam só no shard dela; os demais percorrem todos os shards.
+    if conta_id is not None:
+        return [shards.shard_da_conta(conta_id)]
+    return shards.indices()
+
+
+def rotulo(banco):
+    if not shards.ativo():
+        return ""
+    return "[diretório] " if banco is None else f"[shard {banco}] "
+
+
+@totais_cli.command("reconstruir")
+@click.option("--conta", "conta_id", type=int, default=None, help="Reconstrói apenas esta conta.")
+@click.option("--bloco", "tamanho_bloco", type=int, default=500, show_default=True, help="Contas travadas por transação.")
+def reconstruir_totais(conta_id, tamanho_bloco):
+    reconstruidas = 0
+    for shard in shards_alvo(conta_id):
+        with usando_shard(shard):
+            reconstruidas += TotaisService.reconstruir(conta_id, tamanho_bloco)
+    click.echo(f"Totais reconstruídos para {reconstruidas} conta(s).")
+
+
+@totais_cli.command("verificar")
+@click.option("--conta", "conta_id", type=int, default=None, help="Verifica apenas esta conta.")
+@click.option("--bloco", "tamanho_bloco", type=int, default=500, show_default=True, help="Contas verificadas por consulta.")
+def verificar_totais(conta_id, tamanho_bloco):
+    divergencias = []
+    for shard in shards_alvo(conta_id):
+        with usando_shard(shard):
+            divergencias += TotaisService.verificar(conta_id, tamanho_bloco)
+    for divergencia in divergencias:
+        click.echo(json.dumps(divergencia))
+    if divergencias:
+        raise click.ClickException(f"{len(divergencias)} conta(s) com totais divergentes.")
+    click.echo("Todos os totais conferem.")
+
+
+@snapshots_cli.command("gerar")
+@click.option("--ate", "ate_dia", type=click.DateTime(formats=["%Y-%m-%d"]), default=None, help="Último dia a fechar (padrão: ontem).")
+def gerar_snapshots(ate_dia):
+    processados = []
+    for shard in shards.indices():
+        with usando_shard(shard):
+            dias = SnapshotService.gerar_snapshots(ate_dia.date() if ate_dia else None)
+        for dia in dias:
+            click.echo(rotulo(shard) + json.dumps(dia))
+        processados += dias
+    click.echo(f"{len(processados)} dia(s) processado(s).")
+
+
+@fatias_cli.command("preparar")
+def preparar_fatias():
+    criadas = FatiasService.preparar()
+    click.echo(f"Fatias prontas para {criadas} conta(s).")
+
+
+@fatias_cli.command("consolidar")
+@click.option("--conta", "conta_id", type=int, default=None, help="Consolida apenas esta conta.")
+def consolidar_fatias(conta_id):
+    consolidadas = FatiasService.consolidar_todas(conta_id)
+    click.echo(f"Fatias consolidadas em {consolidadas} conta(s).")
+
+
+@db_cli.command("migrar")
+@click.option("--ate", "ate_versao", type=int, default=None, help="Última versão a aplicar.")
+def migrar_banco(ate_versao):
+    # Com shards, o diretório e cada shard têm o mesmo schema e são migrados juntos.
+    aplicadas = 0
+    for banco in shards.todos_os_bancos():
+        for versao, nome in get_backend(banco).migrar(ate_versao):
+            click.echo(f"{rotulo(banco)}{versao:04d} {nome}")
+            aplicadas += 1
+    click.echo(f"{aplicadas} migração(ões) aplicada(s).")
+
+
+@db_cli.command("status")
+def status_banco():
+    for banco in shards.todos_os_bancos():
+        backend = get_backend(banco)
+        conexao = backend.conectar()
+        try:
+            for migracao in migracoes.situacao(conexao, backend.nome):
+                estado = "aplicada" if migracao["aplicada"] else "pendente"
+                click.echo(f"{rotulo(banco)}{migracao['versao']:04d} {migracao['nome']} {estado}")
+        finally:
+            conexao.close()
+
+
+@particoes_cli.command("manter")
+def manter_particoes():
+    for shard in shards.indices():
+        try:
+            resultado = ParticoesService.manter(shard=shard)
+        except Exception as err:
+            raise click.ClickException(rotulo(shard) + str(err))
+        click.echo(rotulo(shard) + json.dumps(resultado))
+
+
+@arquivo_cli.command("arquivar")
+def arquivar_transacoes():
+    arquivados = 0
+    for shard in shards.indices():
+        try:
+            meses = ArquivoService.arquivar(shard=shard)
+        except Exception as err:
+            raise click.ClickException(rotulo(shard) + str(err))
+        for mes in meses:
+            click.echo(rotulo(shard) + json.dumps(mes))
+        arquivados += len(meses)
+    click.echo(f"{arquivados} mês(es) arquivado(s).")
+
+
+@shards_cli.command("recuperar")
+def recuperar_transferencias():
+    if not shards.ativo():
+        raise click.ClickException("Shards desligados: defina DB_SHARDS.")
+    resultado = TransferenciasService.recuperar()
+    click.echo(json.dumps(resultado))
+
+
+@usuarios_cli.command("revogar-tokens")
+@click.argument("usuario_id", type=int)
+def revogar_tokens(usuario_id):
+    # Para quando o role de um usuário é trocado direto no banco ou o acesso dele precisa cair.
+    if not AuthService.revogar_tokens_usuario(usuario_id):
+        raise click.ClickException(f"Usuário {usuario_id} não encontrado.")
+    click.echo(f"Tokens do usuário {usuario_id} emitidos até agora foram revogados.")
+
+
+def registrar_comandos(app):
+    app.cli.add_command(totais_cli)
+    app.cli.add_command(snapshots_cli)
+    app.cli.add_command(fatias_cli)
+    app.cli.add_command(db_cli)
+    app.cli.add_command(particoes_cli)
+    app.cli.add_command(arquivo_cli)
+    app.cli.add_command(shards_cli)
+    app.cli.add_command(usuarios_cli)
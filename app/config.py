@@ -10,8 +10,94 @@ class Config:
 
     ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+    DB_BACKEND = os.getenv("DB_BACKEND", "mysql").lower()
+    SQLITE_PATH = os.getenv("SQLITE_PATH", "banco_simulador.db")
+    SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", 30))
+
     DB_HOST = "localhost"
     DB_USER = "root"
     DB_PASSWORD = os.getenv("DB_PASSWORD") 
     DB_NAME = "banco_simulador"
-    
\ No newline at end of file
+
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 5))
+    DB_POOL_MAX_LIFETIME = int(os.getenv("DB_POOL_MAX_LIFETIME", 1800))
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+    # host[:porta]/banco no MySQL ou caminhos de arquivo no SQLite, separados por vírgula.
+    DB_SHARDS = [destino.strip() for destino in os.getenv("DB_SHARDS", "").split(",") if destino.strip()]
+    SHARD_TIMEOUT_TRANSFERENCIA_SEGUNDOS = float(os.getenv("SHARD_TIMEOUT_TRANSFERENCIA_SEGUNDOS", 30))
+    SHARD_RECUPERACAO_SEGUNDOS = float(os.getenv("SHARD_RECUPERACAO_SEGUNDOS", 10))
+
+    # Réplicas de leitura no mesmo formato de DB_SHARDS; "N=destino" é uma réplica do shard N.
+    DB_REPLICAS = [destino.strip() for destino in os.getenv("DB_REPLICAS", "").split(",") if destino.strip()]
+    REPLICA_ATRASO_MAX_SEGUNDOS = float(os.getenv("REPLICA_ATRASO_MAX_SEGUNDOS", 2))
+    REPLICA_VERIFICACAO_SEGUNDOS = float(os.getenv("REPLICA_VERIFICACAO_SEGUNDOS", 1))
+    REPLICA_LEITURA_PROPRIA_SEGUNDOS = float(os.getenv("REPLICA_LEITURA_PROPRIA_SEGUNDOS", 5))
+    REPLICA_COOKIE = os.getenv("REPLICA_COOKIE", "ultima_escrita")
+
+    TRANSFERENCIA_LOTE_MAX_ITENS = int(os.getenv("TRANSFERENCIA_LOTE_MAX_ITENS", 50000))
+    TRANSFERENCIA_LOTE_TAMANHO_BLOCO = int(os.getenv("TRANSFERENCIA_LOTE_TAMANHO_BLOCO", 1000))
+
+    EXTRATO_LIMITE_PADRAO = int(os.getenv("EXTRATO_LIMITE_PADRAO", 100))
+    EXTRATO_LIMITE_MAX = int(os.getenv("EXTRATO_LIMITE_MAX", 1000))
+    EXTRATO_TAMANHO_PAGINA_STREAM = int(os.getenv("EXTRATO_TAMANHO_PAGINA_STREAM", 5000))
+    EXTRATO_TAMANHO_BLOCO_STREAM = int(os.getenv("EXTRATO_TAMANHO_BLOCO_STREAM", 500))
+
+    SNAPSHOT_MARGEM_SEGUNDOS = int(os.getenv("SNAPSHOT_MARGEM_SEGUNDOS", 300))
+
+    TRANSACOES_PARTICOES_FUTURAS = int(os.getenv("TRANSACOES_PARTICOES_FUTURAS", 3))
+    TRANSACOES_RETENCAO_MESES = int(os.getenv("TRANSACOES_RETENCAO_MESES", 0))
+    TRANSACOES_EXPIRACAO = os.getenv("TRANSACOES_EXPIRACAO", "desanexar").lower()
+
+    ARQUIVO_PASTA = os.getenv("ARQUIVO_PASTA", "arquivo")
+    ARQUIVO_HORIZONTE_MESES = int(os.getenv("ARQUIVO_HORIZONTE_MESES", 12))
+    ARQUIVO_CONTAS_POR_SEGMENTO = int(os.getenv("ARQUIVO_CONTAS_POR_SEGMENTO", 10000))
+    ARQUIVO_LINHAS_POR_BLOCO = int(os.getenv("ARQUIVO_LINHAS_POR_BLOCO", 4096))
+    ARQUIVO_CACHE_BLOCOS = int(os.getenv("ARQUIVO_CACHE_BLOCOS", 64))
+
+    TOKEN_CACHE_TAMANHO = int(os.getenv("TOKEN_CACHE_TAMANHO", 10000))
+    TOKEN_CACHE_TTL_SEGUNDOS = int(os.getenv("TOKEN_CACHE_TTL_SEGUNDOS", 300))
+
+    BCRYPT_LOG_ROUNDS = int(os.getenv("BCRYPT_LOG_ROUNDS", 12))
+    BCRYPT_USAR_PROCESSOS = os.getenv("BCRYPT_USAR_PROCESSOS", "true").lower() == "true"
+    BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", 0))
+    BCRYPT_FILA_MAX = int(os.getenv("BCRYPT_FILA_MAX", 32))
+    BCRYPT_RETRY_AFTER_SEGUNDOS = int(os.getenv("BCRYPT_RETRY_AFTER_SEGUNDOS", 1))
+
+    ADMIN_CONTAS_LIMITE_PADRAO = int(os.getenv("ADMIN_CONTAS_LIMITE_PADRAO", 100))
+    ADMIN_CONTAS_LIMITE_MAX = int(os.getenv("ADMIN_CONTAS_LIMITE_MAX", 1000))
+    ADMIN_CONTAS_BLOCO_STREAM = int(os.getenv("ADMIN_CONTAS_BLOCO_STREAM", 1000))
+
+    DB_CONSULTA_LENTA_MS = float(os.getenv("DB_CONSULTA_LENTA_MS", 200))
+
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+    GROUP_COMMIT_ATIVO = os.getenv("GROUP_COMMIT_ATIVO", "false").lower() == "true"
+    GROUP_COMMIT_JANELA_MS = float(os.getenv("GROUP_COMMIT_JANELA_MS", 5))
+    GROUP_COMMIT_TAMANHO_MAX = int(os.getenv("GROUP_COMMIT_TAMANHO_MAX", 200))
+    GROUP_COMMIT_TIMEOUT_SEGUNDOS = float(os.getenv("GROUP_COMMIT_TIMEOUT_SEGUNDOS", 10))
+
+    CONTA_CACHE_TAMANHO = int(os.getenv("CONTA_CACHE_TAMANHO", 10000))
+    CONTA_CACHE_TTL_SEGUNDOS = float(os.getenv("CONTA_CACHE_TTL_SEGUNDOS", 5))
+    CONTA_CACHE_REDIS_URL = os.getenv("CONTA_CACHE_REDIS_URL")
+    CONTA_CACHE_CANAL = os.getenv("CONTA_CACHE_CANAL", "banco_simulador:invalidacoes:contas")
+
+    SSE_BUFFER_MAX = int(os.getenv("SSE_BUFFER_MAX", 100))
+    SSE_HEARTBEAT_SEGUNDOS = float(os.getenv("SSE_HEARTBEAT_SEGUNDOS", 15))
+    SSE_MAX_ASSINATURAS = int(os.getenv("SSE_MAX_ASSINATURAS", 1000))
+
+    ASGI_DB_POOL_MIN = int(os.getenv("ASGI_DB_POOL_MIN", 1))
+    ASGI_DB_POOL_MAX = int(os.getenv("ASGI_DB_POOL_MAX", 50))
+    ASGI_WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", 32))
+
+    SERVIDOR_BIND = os.getenv("SERVIDOR_BIND", "0.0.0.0:8000")
+    SERVIDOR_WORKERS = int(os.getenv("SERVIDOR_WORKERS", os.cpu_count() or 1))
+    SERVIDOR_THREADS = int(os.getenv("SERVIDOR_THREADS", 8))
+    SERVIDOR_TIMEOUT = int(os.getenv("SERVIDOR_TIMEOUT", 30))
+    SERVIDOR_TIMEOUT_ENCERRAMENTO = int(os.getenv("SERVIDOR_TIMEOUT_ENCERRAMENTO", 30))
+    DB_POOL_PREENCHER = int(os.getenv("DB_POOL_PREENCHER", SERVIDOR_THREADS))
+
+    SALDO_FATIADO_CONTAS = {int(conta) for conta in os.getenv("SALDO_FATIADO_CONTAS", "").split(",") if conta.strip()}
+    SALDO_FATIADO_FATIAS = int(os.getenv("SALDO_FATIADO_FATIAS", 16))
+    SALDO_FATIADO_CONSOLIDAR_SEGUNDOS = float(os.getenv("SALDO_FATIADO_CONSOLIDAR_SEGUNDOS", 60))
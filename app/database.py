@@ -1,15 +1,454 @@
+import sqlite3
+import threading
+import time
+from collections import deque
+from itertools import count
+from contextlib import contextmanager
+
 import mysql.connector
+from flask import g, has_app_context
 from app.config import Config
+from app import backends, replicas, shards
+from app import instrumentacao, metricas
+
+
+class PoolEsgotadoError(Exception):
+    pass
+
+
+class PoolConexoes:
+    def __init__(self, fabrica, tamanho_max, timeout, tempo_vida_max, verificar_no_checkout=True):
+        self.fabrica = fabrica
+        self.tamanho_max = tamanho_max
+        self.timeout = timeout
+        self.tempo_vida_max = tempo_vida_max
+        self.verificar_no_checkout = verificar_no_checkout
+
+        self._livres = deque()
+        self._criado_em = {}
+        self._em_uso = 0
+        self._condicao = threading.Condition()
+
+        self._aguardando = 0
+        self._total_checkouts = 0
+        self._total_esperas = 0
+        self._tempo_espera_total = 0.0
+        self._tempo_espera_max = 0.0
+        self._recicladas = 0
+        self._descartadas = 0
+
+    def _expirada(self, conexao):
+        if not self.tempo_vida_max:
+            return False
+        return time.monotonic() - self._criado_em.get(id(conexao), 0) > self.tempo_vida_max
+
+    def _fechar(self, conexao):
+        self._criado_em.pop(id(conexao), None)
+        try:
+            conexao.close()
+        except Exception:
+            pass
+
+    def _saudavel(self, conexao):
+        if not self.verificar_no_checkout:
+            return True
+        try:
+            return conexao.is_connected()
+        except Exception:
+            return False
+
+    def _nova_conexao(self):
+        conexao = self.fabrica()
+        self._criado_em[id(conexao)] = time.monotonic()
+        return conexao
+
+    def obter(self):
+        inicio = time.monotonic()
+        limite = inicio + self.timeout
+        with self._condicao:
+            esperou = False
+            while not self._livres and self._em_uso >= self.tamanho_max:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    raise PoolEsgotadoError(
+                        f"Nenhuma conexão disponível no pool após {self.timeout}s")
+                esperou = True
+                self._aguardando += 1
+                try:
+                    self._condicao.wait(restante)
+                finally:
+                    self._aguardando -= 1
+
+            conexao = self._livres.popleft() if self._livres else None
+            self._em_uso += 1
+
+            espera = time.monotonic() - inicio
+            self._total_checkouts += 1
+            if esperou:
+                self._total_esperas += 1
+            self._tempo_espera_total += espera
+            self._tempo_espera_max = max(self._tempo_espera_max, espera)
+
+        # A abertura e o ping acontecem fora do lock para não serializar o pool.
+        try:
+            if conexao is not None and self._expirada(conexao):
+                self._fechar(conexao)
+                with self._condicao:
+                    self._recicladas += 1
+                conexao = None
+            if conexao is not None and not self._saudavel(conexao):
+                self._fechar(conexao)
+                with self._condicao:
+                    self._descartadas += 1
+                conexao = None
+            if conexao is None:
+                conexao = self._nova_conexao()
+            return conexao
+        except Exception:
+            with self._condicao:
+                self._em_uso -= 1
+                self._condicao.notify()
+            raise
+
+    def devolver(self, conexao, descartar=False):
+        if not descartar:
+            try:
+                if conexao.in_transaction:
+                    conexao.rollback()
+            except Exception:
+                descartar = True
+
+        fechada = None
+        if descartar or self._expirada(conexao):
+            self._fechar(conexao)
+            fechada = "descartada" if descartar else "reciclada"
+            conexao = None
+
+        with self._condicao:
+            if fechada == "descartada":
+                self._descartadas += 1
+            elif fechada == "reciclada":
+                self._recicladas += 1
+            self._em_uso -= 1
+            if conexao is not None:
+                self._livres.append(conexao)
+            self._condicao.notify()
+
+    def preencher(self, quantidade):
+        # Abre conexões antes do tráfego chegar (aquecimento), até `quantidade` ou o tamanho máximo.
+        quantidade = min(quantidade, self.tamanho_max)
+        while True:
+            with self._condicao:
+                if len(self._livres) + self._em_uso >= quantidade:
+                    return
+                self._em_uso += 1
+            try:
+                conexao = self._nova_conexao()
+            finally:
+                with self._condicao:
+                    self._em_uso -= 1
+                    self._condicao.notify()
+            with self._condicao:
+                self._livres.append(conexao)
+                self._condicao.notify()
+
+    def fechar_todas(self):
+        with self._condicao:
+            while self._livres:
+                self._fechar(self._livres.popleft())
+
+    def estatisticas(self):
+        with self._condicao:
+            return {
+                "tamanho_max": self.tamanho_max,
+                "em_uso": self._em_uso,
+                "livres": len(self._livres),
+                "aguardando": self._aguardando,
+                "total_checkouts": self._total_checkouts,
+                "total_esperas": self._total_esperas,
+                "tempo_espera_total_s": round(self._tempo_espera_total, 6),
+                "tempo_espera_max_s": round(self._tempo_espera_max, 6),
+                "recicladas": self._recicladas,
+                "descartadas": self._descartadas,
+            }
+
+
+ErroBanco = (mysql.connector.Error, sqlite3.Error)
+
+# Um backend e um pool por banco: shard None é o banco principal e 0, 1, ... os
+# shards; replica None é o primário e 0, 1, ... as réplicas daquele banco.
+_backends = {}
+_pools = {}
+_pool_lock = threading.Lock()
+_rodizio = count()
+
+
+def get_backend(shard=None, replica=None):
+    chave = (shard, replica)
+    backend = _backends.get(chave)
+    if backend is None:
+        backend = _backends.setdefault(chave, backends.get_backend(shard, replica))
+    return backend
+
+
+def get_pool(shard=None, replica=None):
+    chave = (shard, replica)
+    pool = _pools.get(chave)
+    if pool is None:
+        with _pool_lock:
+            pool = _pools.get(chave)
+            if pool is None:
+                backend = get_backend(shard, replica)
+                pool = PoolConexoes(
+                    backend.abrir_conexao if replica is None else backend.conectar_replica,
+                    tamanho_max = Config.DB_POOL_SIZE,
+                    timeout = Config.DB_POOL_TIMEOUT,
+                    tempo_vida_max = Config.DB_POOL_MAX_LIFETIME,
+                    verificar_no_checkout = Config.DB_POOL_PRE_PING
+                )
+                _pools[chave] = pool
+    return pool
+
+
+def estatisticas_do_banco(banco):
+    estatisticas = get_pool(banco).estatisticas()
+    if replicas.ativo(banco):
+        estatisticas["replicas"] = [
+            {**get_pool(banco, posicao).estatisticas(), "atraso_s": replicas.atraso(banco, posicao)}
+            for posicao in range(len(replicas.do_banco(banco)))
+        ]
+    return estatisticas
+
+
+def estatisticas_pools():
+    if not shards.ativo():
+        return estatisticas_do_banco(None)
+    return {
+        "diretorio": estatisticas_do_banco(None),
+        "shards": [estatisticas_do_banco(shard) for shard in shards.indices()],
+    }
+
+
+def somar_estatisticas(lista):
+    soma = dict(lista[0])
+    for estatisticas in lista[1:]:
+        for chave, valor in estatisticas.items():
+            soma[chave] = max(soma[chave], valor) if chave == "tempo_espera_max_s" else soma[chave] + valor
+    return soma
+
+
+@metricas.registrar_coletor
+def coletar_metricas_pool():
+    pools = list(_pools.values())
+    if not pools:
+        return []
+    # Com shards, as séries somam os pools de todos os bancos.
+    estatisticas = somar_estatisticas([pool.estatisticas() for pool in pools])
+    return [
+        ("banco_db_conexoes", "gauge", "Conexões do pool por estado.", [
+            ((("estado", "em_uso"),), estatisticas["em_uso"]),
+            ((("estado", "livre"),), estatisticas["livres"]),
+        ]),
+        ("banco_db_pool_tamanho_max", "gauge", "Tamanho máximo do pool de conexões.", [((), estatisticas["tamanho_max"])]),
+        ("banco_db_pool_aguardando", "gauge", "Requisições aguardando uma conexão do pool.", [((), estatisticas["aguardando"])]),
+        ("banco_db_pool_checkouts_total", "counter", "Conexões retiradas do pool.", [((), estatisticas["total_checkouts"])]),
+        ("banco_db_pool_espera_segundos_total", "counter", "Tempo total de espera por conexões do pool.", [((), estatisticas["tempo_espera_total_s"])]),
+        ("banco_db_pool_conexoes_fechadas_total", "counter", "Conexões fechadas pelo pool.", [
+            ((("motivo", "reciclada"),), estatisticas["recicladas"]),
+            ((("motivo", "descartada"),), estatisticas["descartadas"]),
+        ]),
+    ]
+
+
+def shard_atual():
+    return g.get("shard_atual") if has_app_context() else None
+
+
+@contextmanager
+def usando_shard(shard):
+    # Para jobs e comandos que percorrem os shards: dentro do bloco, get_conexão_db()
+    # sem conta devolve a conexão deste shard em vez da do banco principal.
+    anterior = g.get("shard_atual")
+    g.shard_atual = shard
+    try:
+        yield
+    finally:
+        g.shard_atual = anterior
+
+
+def get_conexão_db(conta_id=None):
+    # Dentro de uma requisição todos os serviços compartilham a mesma conexão,
+    # retirada do pool na primeira chamada e devolvida no teardown. Com shards,
+    # há uma conexão por banco usado, e conta_id escolhe o shard da conta.
+    shard = shards.shard_da_conta(conta_id) if conta_id is not None else shard_atual()
+    if has_app_context():
+        conexoes = g.setdefault("db_shards", {}) if shard is not None else None
+        conexao = g.get("db") if shard is None else conexoes.get(shard)
+        if conexao is None:
+            inicio = time.perf_counter()
+            bruta = get_pool(shard).obter()
+            instrumentacao.registrar_aquisicao(time.perf_counter() - inicio)
+            conexao = instrumentacao.ConexaoInstrumentada(bruta)
+            if shard is None:
+                g.db = conexao
+            else:
+                conexoes[shard] = conexao
+        return conexao
 
-def get_conexão_db():
     try:
-        connection = mysql.connector.connect(
-            host = Config.DB_HOST,
-            user = Config.DB_USER,
-            password = Config.DB_PASSWORD, 
-            database = Config.DB_NAME
-        )
-        return connection
-    except mysql.connector.Error as err:
+        return get_backend(shard).abrir_conexao()
+    except ErroBanco as err:
         print(f"Erro ao conectar ao banco de dados: {err}")
-        return None
\ No newline at end of file
+        return None
+
+
+def obter_replica(banco):
+    # Uma conexão de réplica em dia com o primário, ou None. A busca começa em uma
+    # réplica diferente a cada chamada, para espalhar a carga entre elas.
+    destinos = replicas.do_banco(banco)
+    inicio = next(_rodizio) % len(destinos)
+    for passo in range(len(destinos)):
+        posicao = (inicio + passo) % len(destinos)
+        medir = replicas.precisa_medir(banco, posicao)
+        if not medir and not replicas.em_dia(banco, posicao):
+            continue
+        pool = get_pool(banco, posicao)
+        try:
+            conexao = pool.obter()
+        except (PoolEsgotadoError, *ErroBanco):
+            if medir:
+                replicas.registrar_atraso(banco, posicao, None)
+            continue
+        if medir:
+            try:
+                replicas.registrar_atraso(banco, posicao, get_backend(banco, posicao).atraso_replica(conexao))
+            except ErroBanco:
+                replicas.registrar_atraso(banco, posicao, None)
+                pool.devolver(conexao, descartar=True)
+                continue
+        if replicas.em_dia(banco, posicao):
+            return posicao, conexao
+        pool.devolver(conexao)
+    return None
+
+
+def get_conexão_leitura(conta_id=None):
+    # Para leituras consultivas: uma réplica em dia, se houver e se a leitura não
+    # precisar do primário (escritas, transações abertas e leitura das próprias escritas).
+    banco = shards.shard_da_conta(conta_id) if conta_id is not None else shard_atual()
+    motivo = replicas.motivo_primario(banco, conta_id)
+    if motivo is not None:
+        if motivo != "sem_replicas":
+            replicas.contar_leitura("primario", motivo)
+        return get_conexão_db(conta_id)
+
+    abertas = g.setdefault("db_replicas", {})
+    if banco in abertas:
+        replicas.contar_leitura("replica")
+        return abertas[banco][1]
+
+    inicio = time.perf_counter()
+    escolhida = obter_replica(banco)
+    if escolhida is None:
+        replicas.contar_leitura("primario", "atraso")
+        return get_conexão_db(conta_id)
+    instrumentacao.registrar_aquisicao(time.perf_counter() - inicio)
+    posicao, bruta = escolhida
+    conexao = instrumentacao.ConexaoInstrumentada(bruta)
+    abertas[banco] = (posicao, conexao)
+    replicas.contar_leitura("replica")
+    return conexao
+
+
+def conexoes_abertas():
+    # As conexões desta requisição: a do banco principal primeiro, depois as dos shards.
+    conexoes = [g.db] if "db" in g else []
+    conexoes.extend(conexao for _, conexao in sorted(g.get("db_shards", {}).items()))
+    return conexoes
+
+
+@contextmanager
+def conexao_do_pool(shard=None):
+    # Para threads auxiliares, que não têm o g da requisição.
+    pool = get_pool(shard)
+    conexao = pool.obter()
+    descartar = False
+    try:
+        yield conexao
+    except ErroBanco:
+        descartar = True
+        raise
+    finally:
+        pool.devolver(conexao, descartar=descartar)
+
+
+@contextmanager
+def conexao_de_leitura_do_pool(shard=None, usar_replica=False):
+    # Para threads auxiliares de uma requisição: quem decide se a réplica serve é a
+    # thread da requisição (com motivo_primario), que enxerga os cookies e o g.
+    escolhida = obter_replica(shard) if usar_replica else None
+    if escolhida is None:
+        with conexao_do_pool(shard) as conexao:
+            yield conexao
+        return
+
+    posicao, conexao = escolhida
+    pool = get_pool(shard, posicao)
+    descartar = False
+    try:
+        yield conexao
+    except ErroBanco:
+        descartar = True
+        raise
+    finally:
+        pool.devolver(conexao, descartar=descartar)
+
+
+def executar_em_transacao(funcao, *args, shard=None):
+    # Para as rotinas de fundo, que rodam fora de uma requisição (sem g.db).
+    with conexao_do_pool(shard) as db:
+        cursor = db.cursor()
+        try:
+            if db.in_transaction:
+                db.rollback()
+            db.start_transaction()
+            resultado = funcao(cursor, *args)
+            db.commit()
+            return resultado
+        except ErroBanco:
+            try:
+                db.rollback()
+            except ErroBanco:
+                pass
+            raise
+        finally:
+            cursor.close()
+
+
+def reiniciar_apos_fork():
+    # Conexões herdadas do processo pai não podem ser usadas nem fechadas no filho,
+    # porque o socket é compartilhado: o filho simplesmente começa com pools novos.
+    global _pools
+    _pools = {}
+
+
+def fechar_pool():
+    for pool in list(_pools.values()):
+        pool.fechar_todas()
+
+
+def liberar_conexao_db(exception=None):
+    descartar = isinstance(exception, ErroBanco)
+    db = g.pop("db", None)
+    if db is not None:
+        get_pool().devolver(db.conexao, descartar=descartar)
+    for shard, db in g.pop("db_shards", {}).items():
+        get_pool(shard).devolver(db.conexao, descartar=descartar)
+    for banco, (posicao, db) in g.pop("db_replicas", {}).items():
+        get_pool(banco, posicao).devolver(db.conexao, descartar=descartar)
+
+
+def init_app(app):
+    app.teardown_appcontext(liberar_conexao_db)
+    replicas.init_app(app)
+    instrumentacao.init_app(app)
@@ -0,0 +1,164 @@
+import logging
+import threading
+
+from flask import g, has_request_context
+
+from app.config import Config
+from app.database import get_conexão_db
+from app import metricas
+from app.services.fatias_service import FatiasService, SUBCONSULTA_SALDO_FATIAS
+
+logger = logging.getLogger("app.eventos")
+
+# Pub/sub em processo das transações já commitadas, por conta. Alimenta o feed SSE.
+RESSINCRONIZAR = "ressincronizar"
+
+_assinaturas = {}
+_total_assinaturas = 0
+_assinaturas_lock = threading.Lock()
+
+
+class LimiteAssinaturasError(Exception):
+    pass
+
+
+class Assinatura:
+    def __init__(self, conta_id, tamanho_max):
+        self.conta_id = conta_id
+        self.tamanho_max = tamanho_max
+        self.eventos = []
+        self.dessincronizada = False
+        self.condicao = threading.Condition()
+
+    def entregar(self, evento):
+        with self.condicao:
+            if self.dessincronizada:
+                return
+            if len(self.eventos) >= self.tamanho_max:
+                # Consumidor lento: o buffer não cresce; ele perde o que estava
+                # pendente e é avisado para recarregar o extrato.
+                self.eventos.clear()
+                self.dessincronizada = True
+                metricas.somar("banco_sse_ressincronizacoes_total")
+            else:
+                self.eventos.append(evento)
+            self.condicao.notify()
+
+    def aguardar(self, timeout):
+        with self.condicao:
+            if not self.eventos and not self.dessincronizada:
+                self.condicao.wait(timeout)
+            if self.dessincronizada:
+                self.dessincronizada = False
+                return RESSINCRONIZAR
+            eventos, self.eventos = self.eventos, []
+            return eventos
+
+
+def assinar(conta_id):
+    global _total_assinaturas
+    with _assinaturas_lock:
+        if _total_assinaturas >= Config.SSE_MAX_ASSINATURAS:
+            raise LimiteAssinaturasError("Limite de assinaturas de eventos atingido. Tente novamente mais tarde.")
+        assinatura = Assinatura(int(conta_id), Config.SSE_BUFFER_MAX)
+        _assinaturas.setdefault(assinatura.conta_id, set()).add(assinatura)
+        _total_assinaturas += 1
+    return assinatura
+
+
+def cancelar(assinatura):
+    global _total_assinaturas
+    with _assinaturas_lock:
+        da_conta = _assinaturas.get(assinatura.conta_id)
+        if da_conta is None or assinatura not in da_conta:
+            return
+        da_conta.discard(assinatura)
+        if not da_conta:
+            del _assinaturas[assinatura.conta_id]
+        _total_assinaturas -= 1
+
+
+def linha_para_transacao(linha):
+    data_hora = linha["data_hora"]
+    return {
+        "id": linha["id"],
+        "tipo": linha["tipo"],
+        "valor": linha["valor"],
+        "conta_id": linha["conta_id"],
+        "conta_destino_id": linha["conta_destino_id"],
+        "data_hora": data_hora.isoformat() if hasattr(data_hora, "isoformat") else data_hora,
+    }
+
+
+def publicar(transacoes, db=None):
+    # transacoes: [(id_transacao, conta_id, conta_destino_id), ...], já commitadas.
+    # Sem assinantes nas contas envolvidas, não há nenhuma consulta extra.
+    with _assinaturas_lock:
+        interessadas = {
+            conta for _, origem, destino in transacoes for conta in (origem, destino)
+            if conta is not None and conta in _assinaturas
+        }
+    if not interessadas:
+        return
+
+    ids = sorted({id_transacao for id_transacao, origem, destino in transacoes
+                  if origem in interessadas or destino in interessadas})
+    contas = sorted(interessadas)
+    # Quem publica sem conexão própria passa transações de um único shard.
+    db = db or get_conexão_db(contas[0])
+    cursor = db.cursor(dictionary=True)
+    try:
+        cursor.execute(
+            f"SELECT id, tipo, valor, conta_id, conta_destino_id, data_hora FROM transacoes "
+            f"WHERE id IN ({', '.join(['%s'] * len(ids))}) ORDER BY id",
+            tuple(ids))
+        linhas = cursor.fetchall()
+        cursor.execute(
+            f"SELECT c.id, c.saldo, {SUBCONSULTA_SALDO_FATIAS} AS saldo_fatias FROM contas c "
+            f"WHERE c.id IN ({', '.join(['%s'] * len(contas))})",
+            tuple(contas))
+        saldos = {linha["id"]: FatiasService.somar_fatias(linha)["saldo"] for linha in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+    for linha in linhas:
+        transacao = linha_para_transacao(linha)
+        for conta in {linha["conta_id"], linha["conta_destino_id"]}:
+            if conta not in interessadas:
+                continue
+            evento = {"conta_id": conta, "saldo": saldos.get(conta), "transacao": transacao}
+            with _assinaturas_lock:
+                destinatarios = list(_assinaturas.get(conta, ()))
+            for assinatura in destinatarios:
+                assinatura.entregar(evento)
+
+
+def registrar_apos_commit(id_transacao, conta_id, conta_destino_id=None):
+    # Como no cache de contas, a publicação espera o commit da requisição.
+    if not has_request_context():
+        return
+    g.setdefault("eventos_pendentes", []).append(
+        (id_transacao, int(conta_id), int(conta_destino_id) if conta_destino_id is not None else None))
+
+
+def publicar_pendentes():
+    if not has_request_context():
+        return
+    pendentes = g.pop("eventos_pendentes", None)
+    if pendentes:
+        publicar_sem_falhar(pendentes)
+
+
+def publicar_sem_falhar(transacoes, db=None):
+    try:
+        publicar(transacoes, db)
+    except Exception as err:
+        # A operação já foi commitada; uma falha aqui não pode virar erro para o cliente.
+        logger.warning("Falha ao publicar eventos de transações: %s", err)
+
+
+@metricas.registrar_coletor
+def coletar_metricas_eventos():
+    with _assinaturas_lock:
+        total = _total_assinaturas
+    return [("banco_sse_assinaturas", "gauge", "Assinaturas ativas do feed de eventos.", [((), total)])]
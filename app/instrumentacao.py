@@ -0,0 +1,182 @@
+import json
+import logging
+import threading
+import time
+
+from flask import g, has_request_context, request
+from app.config import Config
+
+logger_consultas_lentas = logging.getLogger("app.db.consultas_lentas")
+
+_por_endpoint = {}
+_por_endpoint_lock = threading.Lock()
+
+
+class EstatisticasRequisicao:
+    def __init__(self):
+        self.consultas = 0
+        self.tempo_db = 0.0
+        self.tempo_aquisicao = 0.0
+        self.mais_lenta_sql = None
+        self.mais_lenta_tempo = 0.0
+
+    def registrar_consulta(self, sql, duracao):
+        self.consultas += 1
+        self.tempo_db += duracao
+        if duracao > self.mais_lenta_tempo:
+            self.mais_lenta_tempo = duracao
+            self.mais_lenta_sql = sql
+
+    def registrar_leitura(self, duracao):
+        self.tempo_db += duracao
+
+
+def estatisticas_atuais():
+    if not has_request_context():
+        return None
+    if "db_estatisticas" not in g:
+        g.db_estatisticas = EstatisticasRequisicao()
+    return g.db_estatisticas
+
+
+def normalizar_sql(sql):
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+    return " ".join(str(sql).split())
+
+
+def registrar_consulta(sql, duracao, parametros_lote=None):
+    estatisticas = estatisticas_atuais()
+    if estatisticas is not None:
+        estatisticas.registrar_consulta(sql, duracao)
+
+    if duracao * 1000 >= Config.DB_CONSULTA_LENTA_MS:
+        registro = {
+            "evento": "consulta_lenta",
+            "duracao_ms": round(duracao * 1000, 3),
+            "sql": normalizar_sql(sql),
+        }
+        if parametros_lote is not None:
+            registro["linhas_lote"] = parametros_lote
+        if has_request_context():
+            registro["endpoint"] = request.endpoint
+            registro["metodo"] = request.method
+            registro["caminho"] = request.path
+        logger_consultas_lentas.warning(json.dumps(registro, ensure_ascii=False))
+
+
+class CursorInstrumentado:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            registrar_consulta(operation, time.perf_counter() - inicio)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        seq_params = list(seq_params)
+        inicio = time.perf_counter()
+        try:
+            return self._cursor.executemany(operation, seq_params, *args, **kwargs)
+        finally:
+            registrar_consulta(operation, time.perf_counter() - inicio, len(seq_params))
+
+    def _ler(self, metodo, *args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return metodo(*args, **kwargs)
+        finally:
+            estatisticas = estatisticas_atuais()
+            if estatisticas is not None:
+                estatisticas.registrar_leitura(time.perf_counter() - inicio)
+
+    def fetchone(self):
+        return self._ler(self._cursor.fetchone)
+
+    def fetchmany(self, *args, **kwargs):
+        return self._ler(self._cursor.fetchmany, *args, **kwargs)
+
+    def fetchall(self):
+        return self._ler(self._cursor.fetchall)
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __getattr__(self, nome):
+        return getattr(self._cursor, nome)
+
+
+class ConexaoInstrumentada:
+    def __init__(self, conexao):
+        self.conexao = conexao
+
+    def cursor(self, *args, **kwargs):
+        return CursorInstrumentado(self.conexao.cursor(*args, **kwargs))
+
+    def __getattr__(self, nome):
+        return getattr(self.conexao, nome)
+
+
+def registrar_aquisicao(duracao):
+    estatisticas = estatisticas_atuais()
+    if estatisticas is not None:
+        estatisticas.tempo_aquisicao += duracao
+
+
+def adicionar_server_timing(response):
+    estatisticas = g.get("db_estatisticas")
+    if estatisticas is None:
+        return response
+    metricas = [
+        f'db;dur={estatisticas.tempo_db * 1000:.3f};desc="{estatisticas.consultas} consultas"',
+        f"db-conexao;dur={estatisticas.tempo_aquisicao * 1000:.3f}",
+    ]
+    if estatisticas.mais_lenta_sql is not None:
+        metricas.append(f"db-mais-lenta;dur={estatisticas.mais_lenta_tempo * 1000:.3f}")
+    existente = response.headers.get("Server-Timing")
+    response.headers["Server-Timing"] = ", ".join(([existente] if existente else []) + metricas)
+    return response
+
+
+def agregar_por_endpoint(exception=None):
+    estatisticas = g.get("db_estatisticas")
+    if estatisticas is None:
+        return
+    endpoint = request.endpoint or "desconhecido"
+    with _por_endpoint_lock:
+        agregado = _por_endpoint.setdefault(endpoint, {
+            "requisicoes": 0,
+            "consultas": 0,
+            "tempo_db_s": 0.0,
+            "tempo_aquisicao_s": 0.0,
+            "max_consultas": 0,
+            "mais_lenta_ms": 0.0,
+            "mais_lenta_sql": None,
+        })
+        agregado["requisicoes"] += 1
+        agregado["consultas"] += estatisticas.consultas
+        agregado["tempo_db_s"] += estatisticas.tempo_db
+        agregado["tempo_aquisicao_s"] += estatisticas.tempo_aquisicao
+        agregado["max_consultas"] = max(agregado["max_consultas"], estatisticas.consultas)
+        if estatisticas.mais_lenta_tempo * 1000 > agregado["mais_lenta_ms"]:
+            agregado["mais_lenta_ms"] = estatisticas.mais_lenta_tempo * 1000
+            agregado["mais_lenta_sql"] = normalizar_sql(estatisticas.mais_lenta_sql)
+
+
+def resumo_por_endpoint():
+    with _por_endpoint_lock:
+        resumo = {}
+        for endpoint, agregado in _por_endpoint.items():
+            item = dict(agregado)
+            item["consultas_por_requisicao"] = round(item["consultas"] / item["requisicoes"], 3)
+            item["tempo_db_medio_ms"] = round(item["tempo_db_s"] * 1000 / item["requisicoes"], 3)
+            resumo[endpoint] = item
+        return resumo
+
+
+def init_app(app):
+    app.after_request(adicionar_server_timing)
+    app.teardown_request(agregar_por_endpoint)
@@ -0,0 +1,226 @@
+import threading
+import time
+import weakref
+
+from flask import g, request
+
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_BCRYPT = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+DESCRICOES = {
+    "banco_http_requisicao_duracao_segundos": ("histogram", "Latência das requisições HTTP por rota e status."),
+    "banco_http_requisicoes_em_andamento": ("gauge", "Requisições HTTP em andamento por blueprint."),
+    "banco_db_duracao_segundos": ("histogram", "Tempo de banco de dados por requisição, por rota."),
+    "banco_db_consultas_total": ("counter", "Consultas SQL executadas, por rota."),
+    "banco_db_aquisicao_conexao_segundos_total": ("counter", "Tempo gasto aguardando conexões do pool, por rota."),
+    "banco_bcrypt_duracao_segundos": ("histogram", "Duração das operações de bcrypt, incluindo a espera na fila."),
+    "banco_bcrypt_rejeicoes_total": ("counter", "Operações de bcrypt recusadas por fila cheia."),
+    "banco_group_commit_tamanho_lote": ("histogram", "Operações aplicadas por commit no modo group commit."),
+    "banco_group_commit_expiradas_total": ("counter", "Operações retiradas da fila do group commit por tempo esgotado."),
+    "banco_sse_ressincronizacoes_total": ("counter", "Assinantes lentos que perderam eventos e foram mandados ressincronizar."),
+    "banco_saldo_fatiado_varreduras_total": ("counter", "Débitos em contas fatiadas que precisaram juntar todas as fatias."),
+    "banco_saldo_fatiado_consolidacoes_total": ("counter", "Contas cujas fatias foram devolvidas à linha da conta pelo consolidador."),
+    "banco_arquivo_segmentos_lidos_total": ("counter", "Segmentos de transações arquivadas lidos por extratos e saldos históricos."),
+    "banco_transferencias_distribuidas_total": ("counter", "Transferências entre shards, pela decisão tomada."),
+    "banco_transferencias_distribuidas_recuperadas_total": ("counter", "Transferências entre shards terminadas pelo recuperador."),
+    "banco_db_leituras_total": ("counter", "Leituras consultivas por destino (réplica ou primário) e motivo de irem ao primário."),
+}
+
+
+class Acumulador:
+    # Cada thread escreve só no próprio acumulador, sem lock; a coleta soma todos.
+    def __init__(self):
+        self.contadores = {}
+        self.histogramas = {}
+
+    def somar(self, nome, rotulos, valor=1):
+        chave = (nome, rotulos)
+        self.contadores[chave] = self.contadores.get(chave, 0) + valor
+
+    def observar(self, nome, rotulos, valor, buckets):
+        chave = (nome, rotulos)
+        histograma = self.histogramas.get(chave)
+        if histograma is None:
+            histograma = self.histogramas[chave] = [[0] * len(buckets), 0.0, 0, buckets]
+        for posicao, limite in enumerate(buckets):
+            if valor <= limite:
+                histograma[0][posicao] += 1
+                break
+        histograma[1] += valor
+        histograma[2] += 1
+
+    def absorver(self, outro):
+        for chave, valor in outro.contadores.items():
+            self.contadores[chave] = self.contadores.get(chave, 0) + valor
+        for chave, (buckets, soma, contagem, limites) in outro.histogramas.items():
+            histograma = self.histogramas.get(chave)
+            if histograma is None:
+                histograma = self.histogramas[chave] = [[0] * len(limites), 0.0, 0, limites]
+            for posicao, quantidade in enumerate(buckets):
+                histograma[0][posicao] += quantidade
+            histograma[1] += soma
+            histograma[2] += contagem
+
+
+_local = threading.local()
+# [(weakref da thread dona, Acumulador)] das threads vivas.
+_acumuladores = []
+# Números das threads que já terminaram; só muda com _acumuladores_lock.
+_aposentado = Acumulador()
+_acumuladores_lock = threading.Lock()
+_coletores = []
+
+
+def acumulador():
+    atual = getattr(_local, "acumulador", None)
+    if atual is None:
+        atual = _local.acumulador = Acumulador()
+        with _acumuladores_lock:
+            aposentar_encerradas()
+            _acumuladores.append((weakref.ref(threading.current_thread()), atual))
+    return atual
+
+
+def aposentar_encerradas():
+    # Chamada com _acumuladores_lock. Threads de requisição, do executor do modo
+    # ASGI e do SSE vêm e vão: uma thread encerrada não escreve mais, então os
+    # números dela vão para _aposentado e a lista guarda só as vivas.
+    vivos = []
+    for thread, atual in _acumuladores:
+        dona = thread()
+        if dona is not None and dona.is_alive():
+            vivos.append((thread, atual))
+        else:
+            _aposentado.absorver(atual)
+    _acumuladores[:] = vivos
+
+
+def somar(nome, rotulos=(), valor=1):
+    acumulador().somar(nome, tuple(rotulos), valor)
+
+
+def observar(nome, rotulos, valor, buckets=BUCKETS_LATENCIA):
+    acumulador().observar(nome, tuple(rotulos), valor, buckets)
+
+
+def registrar_coletor(funcao):
+    # Coletores devolvem (nome, tipo, descricao, [(rotulos, valor), ...]) na hora da coleta.
+    _coletores.append(funcao)
+    return funcao
+
+
+def iniciar_requisicao():
+    g.metricas_inicio = time.perf_counter()
+    g.metricas_blueprint = request.blueprint
+    somar("banco_http_requisicoes_em_andamento", (("blueprint", request.blueprint),), 1)
+
+
+def guardar_status(response):
+    g.metricas_status = response.status_code
+    return response
+
+
+def finalizar_requisicao(exception=None):
+    inicio = g.pop("metricas_inicio", None)
+    if inicio is None:
+        return
+    duracao = time.perf_counter() - inicio
+    rota = request.endpoint or "desconhecido"
+    status = str(g.get("metricas_status", 500))
+
+    somar("banco_http_requisicoes_em_andamento", (("blueprint", g.get("metricas_blueprint")),), -1)
+    observar("banco_http_requisicao_duracao_segundos",
+             (("rota", rota), ("metodo", request.method), ("status", status)), duracao)
+
+    estatisticas = g.get("db_estatisticas")
+    if estatisticas is not None:
+        observar("banco_db_duracao_segundos", (("rota", rota),), estatisticas.tempo_db)
+        somar("banco_db_consultas_total", (("rota", rota),), estatisticas.consultas)
+        somar("banco_db_aquisicao_conexao_segundos_total", (("rota", rota),), estatisticas.tempo_aquisicao)
+
+
+def instrumentar_blueprint(blueprint):
+    blueprint.before_request(iniciar_requisicao)
+    blueprint.after_request(guardar_status)
+    blueprint.teardown_request(finalizar_requisicao)
+
+
+def formatar_rotulos(rotulos):
+    if not rotulos:
+        return ""
+    pares = []
+    for nome, valor in rotulos:
+        valor = str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pares.append(f'{nome}="{valor}"')
+    return "{" + ",".join(pares) + "}"
+
+
+def formatar_numero(valor):
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return repr(valor) if isinstance(valor, float) else str(valor)
+
+
+def copiar_itens(dicionario):
+    while True:
+        try:
+            return list(dicionario.items())
+        except RuntimeError:
+            # A thread dona inseriu uma chave durante a cópia; tenta de novo.
+            continue
+
+
+def coletar():
+    with _acumuladores_lock:
+        aposentar_encerradas()
+        aposentado = Acumulador()
+        aposentado.absorver(_aposentado)
+        acumuladores = [aposentado] + [atual for _, atual in _acumuladores]
+
+    contadores = {}
+    histogramas = {}
+    for atual in acumuladores:
+        # Cópias rasas: a thread dona pode continuar escrevendo durante a coleta.
+        for chave, valor in copiar_itens(atual.contadores):
+            contadores[chave] = contadores.get(chave, 0) + valor
+        for chave, (buckets, soma, contagem, limites) in copiar_itens(atual.histogramas):
+            total = histogramas.get(chave)
+            if total is None:
+                total = histogramas[chave] = [[0] * len(limites), 0.0, 0, limites]
+            for posicao, quantidade in enumerate(list(buckets)):
+                total[0][posicao] += quantidade
+            total[1] += soma
+            total[2] += contagem
+
+    linhas = []
+    por_nome = {}
+    for (nome, rotulos), valor in contadores.items():
+        por_nome.setdefault(nome, []).append(("valor", rotulos, valor))
+    for (nome, rotulos), histograma in histogramas.items():
+        por_nome.setdefault(nome, []).append(("histograma", rotulos, histograma))
+
+    for nome in sorted(por_nome):
+        tipo, descricao = DESCRICOES.get(nome, ("untyped", nome))
+        linhas.append(f"# HELP {nome} {descricao}")
+        linhas.append(f"# TYPE {nome} {tipo}")
+        for especie, rotulos, dados in sorted(por_nome[nome], key=lambda item: item[1]):
+            if especie == "valor":
+                linhas.append(f"{nome}{formatar_rotulos(rotulos)} {formatar_numero(dados)}")
+                continue
+            buckets, soma, contagem, limites = dados
+            acumulado = 0
+            for limite, quantidade in zip(limites, buckets):
+                acumulado += quantidade
+                linhas.append(f"{nome}_bucket{formatar_rotulos(rotulos + (('le', limite),))} {acumulado}")
+            linhas.append(f"{nome}_bucket{formatar_rotulos(rotulos + (('le', '+Inf'),))} {max(acumulado, contagem)}")
+            linhas.append(f"{nome}_sum{formatar_rotulos(rotulos)} {formatar_numero(soma)}")
+            linhas.append(f"{nome}_count{formatar_rotulos(rotulos)} {contagem}")
+
+    for coletor in _coletores:
+        for nome, tipo, descricao, amostras in coletor():
+            linhas.append(f"# HELP {nome} {descricao}")
+            linhas.append(f"# TYPE {nome} {tipo}")
+            for rotulos, valor in amostras:
+                linhas.append(f"{nome}{formatar_rotulos(rotulos)} {formatar_numero(valor)}")
+
+    return "\n".join(linhas) + "\n"
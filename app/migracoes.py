@@ -0,0 +1,101 @@
+import importlib.util
+import os
+import re
+
+PASTA_MIGRACOES = os.path.join(os.path.dirname(os.path.dirname(__file__)), "migracoes")
+
+# 0001_schema_inicial.sql, 0002_particionar_transacoes.py, ...
+NOME_MIGRACAO = re.compile(r"^(\d+)_(\w+)\.(sql|py)$")
+
+CRIAR_TABELA_VERSOES = """
+    CREATE TABLE IF NOT EXISTS schema_migracoes (
+        versao INT PRIMARY KEY,
+        nome VARCHAR(255) NOT NULL,
+        aplicada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+def listar_migracoes(backend):
+    pasta = os.path.join(PASTA_MIGRACOES, backend)
+    migracoes = []
+    for arquivo in os.listdir(pasta):
+        encontrado = NOME_MIGRACAO.match(arquivo)
+        if encontrado:
+            migracoes.append((int(encontrado.group(1)), encontrado.group(2), os.path.join(pasta, arquivo)))
+    migracoes.sort()
+
+    versoes = [versao for versao, _, _ in migracoes]
+    if len(versoes) != len(set(versoes)):
+        raise Exception(f"Há migrações com a mesma versão em {pasta}.")
+    return migracoes
+
+
+def dividir_comandos(sql):
+    # Os arquivos .sql têm um comando por bloco, terminado por ';' no fim da linha.
+    comandos = []
+    atual = []
+    for linha in sql.splitlines():
+        if not atual and (not linha.strip() or linha.strip().startswith("--")):
+            continue
+        atual.append(linha)
+        if linha.rstrip().endswith(";"):
+            comandos.append("\n".join(atual).rstrip().rstrip(";"))
+            atual = []
+    if "".join(atual).strip():
+        comandos.append("\n".join(atual))
+    return comandos
+
+
+def versoes_aplicadas(cursor):
+    cursor.execute(CRIAR_TABELA_VERSOES)
+    cursor.execute("SELECT versao FROM schema_migracoes")
+    return {versao for versao, in cursor.fetchall()}
+
+
+def aplicar_migracao(cursor, caminho):
+    if caminho.endswith(".sql"):
+        with open(caminho, encoding="utf-8") as arquivo:
+            for comando in dividir_comandos(arquivo.read()):
+                cursor.execute(comando)
+        return
+
+    # Migrações em Python recebem o cursor e decidem os comandos em tempo de execução.
+    spec = importlib.util.spec_from_file_location(f"migracao_{os.path.basename(caminho)[:-3]}", caminho)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    modulo.aplicar(cursor)
+
+
+def migrar(conexao, backend, ate=None):
+    aplicadas = []
+    cursor = conexao.cursor()
+    try:
+        ja_aplicadas = versoes_aplicadas(cursor)
+        conexao.commit()
+        for versao, nome, caminho in listar_migracoes(backend):
+            if versao in ja_aplicadas or (ate is not None and versao > ate):
+                continue
+            # No MySQL cada DDL faz commit sozinho: uma migração que falha no meio não é
+            # desfeita, por isso as migrações conferem o estado antes de cada passo.
+            aplicar_migracao(cursor, caminho)
+            cursor.execute("INSERT INTO schema_migracoes (versao, nome) VALUES (%s, %s)", (versao, nome))
+            conexao.commit()
+            aplicadas.append((versao, nome))
+    except Exception:
+        conexao.rollback()
+        raise
+    finally:
+        cursor.close()
+    return aplicadas
+
+
+def situacao(conexao, backend):
+    cursor = conexao.cursor()
+    try:
+        ja_aplicadas = versoes_aplicadas(cursor)
+        conexao.commit()
+    finally:
+        cursor.close()
+    return [{"versao": versao, "nome": nome, "aplicada": versao in ja_aplicadas}
+            for versao, nome, _ in listar_migracoes(backend)]
@@ -0,0 +1,155 @@
+import math
+import threading
+import time
+
+from flask import g, has_request_context, request
+
+from app.cache import CacheLRU
+from app.config import Config
+from app import metricas
+
+# Com DB_REPLICAS preenchido, as leituras consultivas (extrato, totais, listagem
+# administrativa, perfil) podem ir para réplicas do banco. Escritas, leituras
+# dentro de uma transação e leituras de quem acabou de escrever ficam no primário.
+
+_por_banco = {"entradas": None, "replicas": {}}
+
+# {(banco, posicao): (medido_em, atraso em segundos ou None se indisponível)}
+_atrasos = {}
+_atrasos_lock = threading.Lock()
+_medindo = set()
+
+# Contas alteradas há menos de REPLICA_LEITURA_PROPRIA_SEGUNDOS, neste processo
+# ou (com o canal do cache de contas) em qualquer outro.
+_contas_escritas = CacheLRU(Config.CONTA_CACHE_TAMANHO, Config.REPLICA_LEITURA_PROPRIA_SEGUNDOS)
+
+
+def ler_replicas(entradas):
+    replicas = {}
+    for entrada in entradas:
+        banco, separador, destino = entrada.partition("=")
+        if not separador:
+            banco, destino = None, entrada
+        else:
+            try:
+                banco = int(banco)
+            except ValueError:
+                raise Exception(f"Réplica inválida: '{entrada}'. Use destino ou N=destino.")
+            if not 0 <= banco < len(Config.DB_SHARDS):
+                raise Exception(f"Réplica '{entrada}' aponta para um shard que não existe.")
+        replicas.setdefault(banco, []).append(destino.strip())
+    return replicas
+
+
+def do_banco(banco):
+    # banco: None para o principal, ou a posição do shard.
+    if _por_banco["entradas"] != Config.DB_REPLICAS:
+        _por_banco["replicas"] = ler_replicas(Config.DB_REPLICAS)
+        _por_banco["entradas"] = list(Config.DB_REPLICAS)
+    return _por_banco["replicas"].get(banco, [])
+
+
+def ativo(banco=None):
+    return bool(do_banco(banco))
+
+
+def precisa_medir(banco, posicao):
+    # Só uma requisição por vez mede cada réplica; as outras usam a última medida.
+    chave = (banco, posicao)
+    with _atrasos_lock:
+        medida = _atrasos.get(chave)
+        if medida is not None and time.monotonic() - medida[0] < Config.REPLICA_VERIFICACAO_SEGUNDOS:
+            return False
+        if chave in _medindo:
+            return False
+        _medindo.add(chave)
+        return True
+
+
+def registrar_atraso(banco, posicao, atraso):
+    chave = (banco, posicao)
+    with _atrasos_lock:
+        _atrasos[chave] = (time.monotonic(), atraso)
+        _medindo.discard(chave)
+
+
+def em_dia(banco, posicao):
+    medida = _atrasos.get((banco, posicao))
+    return medida is not None and medida[1] is not None and medida[1] <= Config.REPLICA_ATRASO_MAX_SEGUNDOS
+
+
+def atraso(banco, posicao):
+    medida = _atrasos.get((banco, posicao))
+    return medida[1] if medida else None
+
+
+def marcar_contas(ids):
+    if not Config.DB_REPLICAS:
+        return
+    for id in ids:
+        _contas_escritas.definir(int(id), True)
+
+
+def conta_escrita_recentemente(conta_id):
+    return conta_id is not None and _contas_escritas.obter(int(conta_id)) is not None
+
+
+def sessao_escreveu_recentemente():
+    # O cookie vale para qualquer worker ou máquina que atender a próxima requisição.
+    try:
+        escrita_em = float(request.cookies.get(Config.REPLICA_COOKIE, ""))
+    except ValueError:
+        return False
+    return time.time() - escrita_em < Config.REPLICA_LEITURA_PROPRIA_SEGUNDOS
+
+
+def motivo_primario(banco, conta_id=None):
+    # Por que esta leitura precisa ir ao primário; None quando uma réplica serve.
+    if not ativo(banco):
+        return "sem_replicas"
+    if not has_request_context():
+        return "fora_de_requisicao"
+    if request.method not in ("GET", "HEAD"):
+        return "escrita"
+    primaria = g.get("db") if banco is None else g.get("db_shards", {}).get(banco)
+    if primaria is not None and primaria.in_transaction:
+        return "transacao"
+    if sessao_escreveu_recentemente():
+        return "sessao"
+    if conta_escrita_recentemente(conta_id):
+        return "conta"
+    return None
+
+
+def contar_leitura(destino, motivo=None):
+    rotulos = (("destino", destino),) if motivo is None else (("destino", destino), ("motivo", motivo))
+    metricas.somar("banco_db_leituras_total", rotulos)
+
+
+def marcar_sessao(resposta):
+    # Depois de uma escrita bem-sucedida, as leituras desta sessão vão ao primário
+    # por REPLICA_LEITURA_PROPRIA_SEGUNDOS.
+    if Config.DB_REPLICAS and request.method not in ("GET", "HEAD", "OPTIONS") and resposta.status_code < 400:
+        resposta.set_cookie(
+            Config.REPLICA_COOKIE, f"{time.time():.3f}",
+            max_age=math.ceil(Config.REPLICA_LEITURA_PROPRIA_SEGUNDOS), httponly=True, samesite="Lax")
+    return resposta
+
+
+@metricas.registrar_coletor
+def coletar_metricas_replicas():
+    with _atrasos_lock:
+        medidas = sorted(_atrasos.items(), key=lambda item: (item[0][0] is not None, item[0]))
+    if not medidas:
+        return []
+    return [
+        ("banco_db_replica_atraso_segundos", "gauge", "Último atraso medido de cada réplica (-1: indisponível).", [
+            ((("banco", "principal" if banco is None else f"shard_{banco}"), ("replica", posicao)),
+             -1 if valor is None else valor)
+            for (banco, posicao), (_, valor) in medidas
+        ]),
+    ]
+
+
+def init_app(app):
+    app.after_request(marcar_sessao)
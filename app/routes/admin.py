@@ -1,8 +1,16 @@
-from flask import Blueprint, request, jsonify
+import csv
+import hmac
+import io
+
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from app.services.auth_service import AuthService
+from app.services.senha_service import SobrecargaError
 from app.services.admin_service import AdminService
+from app import database, instrumentacao, metricas, serializacao
+from app.config import Config
 
 admin_bp = Blueprint("admin", __name__, url_prefix="/admin")
+metricas.instrumentar_blueprint(admin_bp)
 
 @admin_bp.route("/contas", methods=["GET"])
 def listar_todas_as_contas():
@@ -12,12 +20,80 @@ def listar_todas_as_contas():
     
     if not AuthService.confirmacao_admin(user_id):
         return jsonify({"erro":"Acesso negado. Somente administradores podem ter acesso a lista geral de contas."}), 401
+
     try:
-        contas = AdminService.listar_todas_as_contas()
-        return jsonify(contas), 200
+        filtros = AdminService.validar_filtros_contas(request.args)
+    except Exception as err:
+        return jsonify({"erro": str(err)}), 400
+
+    try:
+        if filtros["formato"] == "ndjson":
+            colunas, linhas = AdminService.iterar_contas(filtros)
+            return Response(stream_with_context(gerar_contas_ndjson(colunas, linhas)), mimetype="application/x-ndjson"), 200
+
+        if filtros["formato"] == "csv":
+            colunas, linhas = AdminService.iterar_contas(filtros)
+            return Response(stream_with_context(gerar_contas_csv(colunas, linhas)), mimetype="text/csv",
+                            headers={"Content-Disposition": "attachment; filename=contas.csv"}), 200
+
+        contas, proximo_cursor = AdminService.listar_todas_as_contas(filtros)
+        cabecalhos = {"X-Proximo-Cursor": str(proximo_cursor)} if proximo_cursor is not None else {}
+        return jsonify(contas), 200, cabecalhos
     except Exception as err:
         return jsonify({"erro": f"Ocorreu um erro inesperado: {err}"}), 500
 
+def gerar_contas_ndjson(colunas, linhas):
+    for linha in linhas:
+        yield serializacao.codificar(dict(zip(colunas, linha))) + b"\n"
+
+def gerar_contas_csv(colunas, linhas):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(colunas)
+    for linha in linhas:
+        escritor.writerow(linha)
+        if buffer.tell() >= 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+@admin_bp.route("/pool", methods=["GET"])
+def estatisticas_pool():
+    user_id = AuthService.autenticar_usuario()
+    if not user_id:
+        return jsonify({"erro":"Não autenticado"}), 401
+
+    if not AuthService.confirmacao_admin(user_id):
+        return jsonify({"erro":"Acesso negado. Somente administradores podem ver as estatísticas do pool."}), 403
+
+    return jsonify(database.estatisticas_pools()), 200
+
+@admin_bp.route("/db", methods=["GET"])
+def estatisticas_db():
+    user_id = AuthService.autenticar_usuario()
+    if not user_id:
+        return jsonify({"erro":"Não autenticado"}), 401
+
+    if not AuthService.confirmacao_admin(user_id):
+        return jsonify({"erro":"Acesso negado. Somente administradores podem ver as estatísticas do banco."}), 403
+
+    return jsonify(instrumentacao.resumo_por_endpoint()), 200
+
+@admin_bp.route("/metrics", methods=["GET"])
+def exportar_metricas():
+    token = request.headers.get("Authorization", "")
+    token_metricas = Config.METRICS_TOKEN and hmac.compare_digest(token, f"Bearer {Config.METRICS_TOKEN}")
+    if not token_metricas:
+        user_id = AuthService.autenticar_usuario()
+        if not user_id:
+            return jsonify({"erro":"Não autenticado"}), 401
+
+        if not AuthService.confirmacao_admin(user_id):
+            return jsonify({"erro":"Acesso negado. Somente administradores podem ver as métricas."}), 403
+
+    return Response(metricas.coletar(), mimetype="text/plain; version=0.0.4"), 200
+
 @admin_bp.route("/criar", methods=["POST"])
 def criar_admins():
     user_id = AuthService.autenticar_usuario()
@@ -46,5 +122,7 @@ def criar_admins():
         AuthService.commitar_na_db()
         return jsonify({"mensagem":"Conta de aministrador criado com sucesso!"}), 201
 
+    except SobrecargaError as err:
+        return jsonify({"erro": str(err)}), 503, {"Retry-After": str(err.retry_after)}
     except Exception as err:
         return jsonify({"erro": f"Ocorreu um erro inesperado: {err}"}), 500 
\ No newline at end of file
@@ -1,7 +1,10 @@
 from flask import Blueprint, request, jsonify
 from app.services.auth_service import AuthService
+from app import metricas
+from app.services.senha_service import SobrecargaError
 
 auth_bp = Blueprint("auth", __name__, url_prefix="/auth")
+metricas.instrumentar_blueprint(auth_bp)
 
 @auth_bp.route("/login", methods=["POST"])
 def login():
@@ -18,9 +21,13 @@ def login():
         if not usuario or not AuthService.verificar_senha(usuario["senha_hash"], senha):
             return jsonify({"erro":"Credenciais inválidas"}), 401
         
-        token = AuthService.criar_token_acesso(usuario["id"])
+        AuthService.atualizar_hash_se_necessario(usuario["id"], usuario["senha_hash"], senha)
+
+        token = AuthService.criar_token_acesso(usuario["id"], usuario["role"])
         return jsonify(AuthService.formatar_resposta_token(token)), 200
 
+    except SobrecargaError as err:
+        return jsonify({"erro": str(err)}), 503, {"Retry-After": str(err.retry_after)}
     except Exception as err:
         return jsonify({"erro": f"Ocorreu um erro inesperado: {err}"}), 500
     
@@ -43,11 +50,13 @@ def registrar():
 
         usuario_id = AuthService.inserir_usuario_na_db(username, senha_hash)
 
-        AuthService.inserir_conta_na_db(nome, usuario_id)
+        conta_id = AuthService.inserir_conta_na_db(nome, usuario_id)
 
         AuthService.commitar_na_db()
-        return jsonify({"mensagem":"Usuário registrado com sucesso! Sua conta foi criada!"}), 201
+        return jsonify({"mensagem":"Usuário registrado com sucesso! Sua conta foi criada!", "conta_id": conta_id}), 201
 
+    except SobrecargaError as err:
+        return jsonify({"erro": str(err)}), 503, {"Retry-After": str(err.retry_after)}
     except Exception as err:
         return jsonify({"erro": f"Ocorreu um erro inesperado: {err}"}), 500  
 
@@ -1,29 +1,199 @@
-from flask import Blueprint, request, jsonify
+from datetime import datetime
+
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from app.config import Config
 from app.services.auth_service import AuthService
-from app.services.conta_service import ContaService
+from app import ciclo_de_vida, database, eventos, metricas, serializacao
+from app.services.snapshot_service import SnapshotService
+from app.services.conta_service import (
+    ContaService,
+    TRANSFERENCIA_ORIGEM_INEXISTENTE,
+    TRANSFERENCIA_DESTINO_INEXISTENTE,
+    TRANSFERENCIA_SALDO_INSUFICIENTE,
+    TRANSFERENCIA_ABORTADA,
+)
+from app.services.group_commit import OPERACAO_CONTA_INEXISTENTE, OPERACAO_SALDO_INSUFICIENTE, OPERACAO_EXPIRADA
 
 conta_bp = Blueprint('conta', __name__, url_prefix="/conta")
+metricas.instrumentar_blueprint(conta_bp)
 
 @conta_bp.route("/conta/<int:id>/extrato", methods=["GET"])
 def mostrar_extrato(id):
+    try:
+        parametros = ContaService.validar_parametros_extrato(request.args)
+    except Exception as err:
+        return jsonify({"erro": str(err)}), 400
+
     try:    
-        conta = AuthService.verificar_existencia_conta(id)
-        if not conta:
+        versao = ContaService.versao_extrato(id)
+        if not versao:
             return jsonify({"erro": f"Conta com id {id} não encontrada"}), 404
- 
-        
-        historico = ContaService.pegar_dados_do_extrato(id)
-        
+
+        etag = ContaService.etag_extrato(versao, request.args)
+        if request.if_none_match.contains(etag):
+            resposta = Response(status=304)
+            resposta.set_etag(etag)
+            resposta.headers["Cache-Control"] = "private, no-cache"
+            return resposta
+
+        conta = {"id": versao["id"], "saldo": versao["saldo"]}
         totais = ContaService.somas_totais(id)
-        
-        extrato = ContaService.retorno_extrato(conta, historico, totais, id)
 
-        return jsonify(extrato), 200
+        if parametros["formato"] != "json":
+            cabecalho = ContaService.retorno_extrato(conta, [], totais, id)
+            del cabecalho["transacoes"]
+            linhas = ContaService.iterar_extrato(
+                id, parametros["apos"], parametros["de"], parametros["ate"], request.args.get("limit", type=int))
+            if parametros["formato"] == "ndjson":
+                gerador = gerar_extrato_ndjson(cabecalho, linhas)
+                tipo = "application/x-ndjson"
+            else:
+                gerador = gerar_extrato_json(cabecalho, linhas)
+                tipo = "application/json"
+            resposta = Response(stream_with_context(gerador), mimetype=tipo)
+        else:
+            historico, proximo_cursor = ContaService.pegar_dados_do_extrato(
+                id, parametros["limite"], parametros["apos"], parametros["de"], parametros["ate"])
+
+            extrato = ContaService.retorno_extrato(conta, historico, totais, id)
+            extrato["proximo_cursor"] = proximo_cursor
+            resposta = jsonify(extrato)
+
+        resposta.set_etag(etag)
+        resposta.headers["Cache-Control"] = "private, no-cache"
+        return resposta, 200
             
     except Exception as err:
         return jsonify({"erro": f"Ocorreu um erro inesperado: {err}"}), 500
+
+def gerar_extrato_ndjson(cabecalho, linhas):
+    yield serializacao.codificar(cabecalho) + b"\n"
+    for linha in linhas:
+        yield serializacao.codificar(ContaService.linha_extrato_para_dict(linha)) + b"\n"
+
+def gerar_extrato_json(cabecalho, linhas):
+    yield serializacao.codificar(cabecalho)[:-1] + b',"transacoes":['
+    separador = b""
+    for linha in linhas:
+        yield separador + serializacao.codificar(ContaService.linha_extrato_para_dict(linha))
+        separador = b","
+    yield b"]}"
     
+@conta_bp.route("/conta/<int:id>/eventos", methods=["GET"])
+def eventos_conta(id):
+    user_id = AuthService.autenticar_usuario()
+    if not user_id:
+        return jsonify({"erro": "Não autenticado"}), 401
+
+    try:
+        # Assina antes de ler o estado inicial, para não perder nada entre os dois.
+        assinatura = eventos.assinar(id)
+    except eventos.LimiteAssinaturasError as err:
+        return jsonify({"erro": str(err)}), 503
+
+    try:
+        versao = ContaService.versao_extrato(id)
+    except Exception as err:
+        eventos.cancelar(assinatura)
+        return jsonify({"erro": f"Ocorreu um erro inesperado: {err}"}), 500
+    if not versao:
+        eventos.cancelar(assinatura)
+        return jsonify({"erro": f"Conta com id {id} não encontrada"}), 404
+
+    # Uma assinatura pode durar horas: a conexão volta ao pool antes do stream.
+    database.liberar_conexao_db()
+
+    inicial = {
+        "conta_id": id,
+        "saldo": versao["saldo"],
+        "ultima_transacao_id": versao["ultima_transacao_id"],
+    }
+    gerador = gerar_eventos_sse(assinatura, inicial, request.headers.get("Last-Event-ID"))
+    return Response(gerador, mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+def formatar_evento_sse(tipo, dados, id_evento=None):
+    linhas = [f"event: {tipo}"]
+    if id_evento is not None:
+        linhas.append(f"id: {id_evento}")
+    linhas.append(f"data: {serializacao.codificar(dados).decode('utf-8')}")
+    return "\n".join(linhas) + "\n\n"
+
+def gerar_eventos_sse(assinatura, inicial, ultimo_evento_id):
+    try:
+        yield formatar_evento_sse("saldo", inicial)
+        # Numa reconexão, o cliente pode ter perdido transações enquanto estava fora.
+        if ultimo_evento_id is not None and ultimo_evento_id != str(inicial["ultima_transacao_id"]):
+            yield formatar_evento_sse(eventos.RESSINCRONIZAR, {"conta_id": inicial["conta_id"]})
+
+        while True:
+            recebidos = assinatura.aguardar(Config.SSE_HEARTBEAT_SEGUNDOS)
+            if recebidos == eventos.RESSINCRONIZAR:
+                yield formatar_evento_sse(eventos.RESSINCRONIZAR, {"conta_id": inicial["conta_id"]})
+                continue
+            if not recebidos:
+                # Mantém a conexão viva e revela clientes que já foram embora.
+                yield ": ping\n\n"
+                continue
+            for evento in recebidos:
+                yield formatar_evento_sse("transacao", evento, evento["transacao"]["id"])
+    finally:
+        eventos.cancelar(assinatura)
+
+@conta_bp.route("/conta/<int:id>/saldo", methods=["GET"])
+def saldo_historico(id):
+    try:
+        momento = SnapshotService.validar_momento(request.args.get("em"), "em", padrao=datetime.now())
+    except Exception as err:
+        return jsonify({"erro": str(err)}), 400
+
+    try:
+        conta = AuthService.verificar_existencia_conta(id)
+        if not conta:
+            return jsonify({"erro": f"Conta com id {id} não encontrada"}), 404
+
+        saldo = SnapshotService.saldo_em(id, momento)
+        return jsonify({"conta_id": id, "em": momento.isoformat(), "saldo": saldo}), 200
+
+    except Exception as err:
+        return jsonify({"erro": f"Ocorreu um erro inesperado: {err}"}), 500
+
+@conta_bp.route("/conta/<int:id>/extrato/periodo", methods=["GET"])
+def extrato_periodo(id):
+    try:
+        de = SnapshotService.validar_momento(request.args.get("de"), "de")
+        ate = SnapshotService.validar_momento(request.args.get("ate"), "ate")
+        if ate <= de:
+            raise Exception("O parâmetro 'ate' precisa ser posterior a 'de'.")
+        parametros = ContaService.validar_parametros_extrato(request.args)
+    except Exception as err:
+        return jsonify({"erro": str(err)}), 400
+
+    try:
+        conta = AuthService.verificar_existencia_conta(id)
+        if not conta:
+            return jsonify({"erro": f"Conta com id {id} não encontrada"}), 404
+
+        historico, proximo_cursor = ContaService.pegar_dados_do_extrato(
+            id, parametros["limite"], parametros["apos"], de, ate)
+
+        return jsonify({
+            "conta_id": id,
+            "de": de.isoformat(),
+            "ate": ate.isoformat(),
+            "saldo_inicial": SnapshotService.saldo_em(id, de),
+            "saldo_final": SnapshotService.saldo_em(id, ate),
+            "transacoes": historico,
+            "proximo_cursor": proximo_cursor
+        }), 200
+
+    except Exception as err:
+        return jsonify({"erro": f"Ocorreu um erro inesperado: {err}"}), 500
+
 @conta_bp.route("/conta/<int:id>/depositar", methods=["PUT"])
+@ciclo_de_vida.rastrear_operacao
 def depositar(id):
     user_id = AuthService.autenticar_usuario()
     if not user_id:
@@ -37,6 +207,14 @@ def depositar(id):
     deposito = ContaService.validar_numero_positivo(deposito, "deposito")
 
     try:
+        if Config.GROUP_COMMIT_ATIVO:
+            resultado = ContaService.enfileirar_operacao("deposito", deposito, id)
+            if resultado == OPERACAO_CONTA_INEXISTENTE:
+                return jsonify({"erro": f"Conta com id {id} não encontrada"}), 404
+            if resultado == OPERACAO_EXPIRADA:
+                return jsonify({"erro": "A operação não foi aplicada: tempo esgotado na fila. Tente novamente."}), 503
+            return jsonify({"mensagem":f"Depósito de R$ {int(deposito)} realizado com sucesso na conta de id: {id}"})
+
         conta = AuthService.verificar_existencia_conta(id)
         if not conta:
             return jsonify({"erro": f"Conta com id {id} não encontrada"}), 404
@@ -51,6 +229,7 @@ def depositar(id):
         return jsonify({"erro": f"Ocorreu um erro inesperado: {err}"}), 500
     
 @conta_bp.route("/conta/<int:id>/sacar", methods=["PUT"])
+@ciclo_de_vida.rastrear_operacao
 def sacar(id):
     user_id = AuthService.autenticar_usuario()
     if not user_id:
@@ -64,14 +243,22 @@ def sacar(id):
 
     saque = ContaService.validar_numero_positivo(saque, "saque")
     try:
+        if Config.GROUP_COMMIT_ATIVO:
+            resultado = ContaService.enfileirar_operacao("saque", saque, id)
+            if resultado == OPERACAO_CONTA_INEXISTENTE:
+                return jsonify({"erro": f"Conta com id {id} não encontrada"}), 404
+            if resultado == OPERACAO_SALDO_INSUFICIENTE:
+                return jsonify({"erro":"Seu saque está maior que seu saldo."}), 400
+            if resultado == OPERACAO_EXPIRADA:
+                return jsonify({"erro": "A operação não foi aplicada: tempo esgotado na fila. Tente novamente."}), 503
+            return jsonify({"mensagem":f"A quantidade de R$ {saque} foi sacada da conta de id {id}"})
+
         saldo = ContaService.verificar_saldo_conta(id)
         if not saldo:
             return jsonify({"erro": f"Conta com id {id} não encontrada"}), 404
 
-        if saque > saldo["saldo"]:
+        if not ContaService.executar_saque(saque, id):
             return jsonify({"erro":"Seu saque está maior que seu saldo."}), 400
-        
-        ContaService.executar_saque(saque, id)
 
         ContaService.registrar_saque(saque, id)
         AuthService.commitar_na_db()
@@ -83,6 +270,7 @@ def sacar(id):
     
 
 @conta_bp.route("/conta/transferir", methods=["POST"])
+@ciclo_de_vida.rastrear_operacao
 def transferir():
     user_id = AuthService.autenticar_usuario()
     if not user_id:
@@ -98,31 +286,65 @@ def transferir():
 
     
     valor = ContaService.validar_numero_positivo(valor, "valor")
+
+    if conta_origem == conta_destino:
+        return jsonify({"erro":"A conta de origem e a de destino precisam ser diferentes."}), 400
     
     try:
-        ContaService.iniciar_transacao()
+        resultado = ContaService.executar_transferencia(valor, conta_origem, conta_destino)
 
-        saldo_origem = ContaService.verificar_saldo_conta(conta_origem)
-        if not saldo_origem:
+        if resultado == TRANSFERENCIA_ORIGEM_INEXISTENTE:
             return jsonify({"erro":"Usuário de origem não encontrado."}), 404
 
-        if valor > saldo_origem[0]:
-            return jsonify({"erro":"Saldo insuficiente."}), 400
-
-        conta_destino = AuthService.verificar_existencia_conta(conta_destino)
-        if not conta_destino:
+        if resultado == TRANSFERENCIA_DESTINO_INEXISTENTE:
             return jsonify({"erro":"Conta de destino não encontrada."}), 404
 
-        ContaService.realizar_transferencias(valor, conta_origem, conta_destino)
+        if resultado == TRANSFERENCIA_SALDO_INSUFICIENTE:
+            return jsonify({"erro":"Saldo insuficiente."}), 400
 
-        ContaService.registrar_transferencias(valor, conta_origem, conta_destino)     
+        if resultado == TRANSFERENCIA_ABORTADA:
+            return jsonify({"erro":"A transferência não pôde ser concluída e foi desfeita. Tente novamente."}), 503
 
-        AuthService.commitar_na_db()
         return jsonify({"mensagem":f"Transferência de R$ {valor:.2f} realizada com sucesso da conta {conta_origem} para {conta_destino}"})
 
     except Exception as err:
         return jsonify({"erro": f"Ocorreu um erro inesperado: {err}"}), 500
     
+@conta_bp.route("/conta/transferir/lote", methods=["POST"])
+@ciclo_de_vida.rastrear_operacao
+def transferir_lote():
+    user_id = AuthService.autenticar_usuario()
+    if not user_id:
+        return jsonify({"erro": "Não autenticado"}), 401
+
+    try:
+        if request.mimetype in ("application/x-ndjson", "application/jsonlines"):
+            itens = [serializacao.decodificar(linha) for linha in request.stream if linha.strip()]
+        else:
+            dados = request.get_json()
+            itens = dados.get("transferencias") if isinstance(dados, dict) else dados
+    except ValueError:
+        return jsonify({"erro": "Corpo da requisição inválido."}), 400
+
+    if not isinstance(itens, list) or not itens:
+        return jsonify({"erro": "Envie uma lista de transferências."}), 400
+
+    if len(itens) > Config.TRANSFERENCIA_LOTE_MAX_ITENS:
+        return jsonify({"erro": f"O lote pode ter no máximo {Config.TRANSFERENCIA_LOTE_MAX_ITENS} transferências."}), 413
+
+    try:
+        resultados = ContaService.executar_transferencias_em_lote(itens)
+        sucesso = sum(1 for resultado in resultados if resultado["status"] == "ok")
+        return jsonify({
+            "total": len(resultados),
+            "sucesso": sucesso,
+            "falhas": len(resultados) - sucesso,
+            "resultados": resultados
+        }), 200
+
+    except Exception as err:
+        return jsonify({"erro": f"Ocorreu um erro inesperado: {err}"}), 500
+
 @conta_bp.route("/conta/deletar/<int:id>", methods=["DELETE"])
 def deletar_conta(id):
     try:
@@ -0,0 +1,23 @@
+from flask import Blueprint, jsonify
+from app import ciclo_de_vida
+
+saude_bp = Blueprint("saude", __name__, url_prefix="/saude")
+
+@saude_bp.route("/vivo", methods=["GET"])
+def vivo():
+    # Liveness: o processo responde. Não depende do banco, para que uma queda do
+    # MySQL não faça o orquestrador reiniciar todos os workers.
+    return jsonify({"status": "vivo"}), 200
+
+@saude_bp.route("/pronto", methods=["GET"])
+def pronto():
+    if ciclo_de_vida.esta_encerrando():
+        return jsonify({"status": "encerrando"}), 503
+
+    if not ciclo_de_vida.esta_pronto():
+        return jsonify({"status": "aquecendo"}), 503
+
+    if not ciclo_de_vida.banco_disponivel():
+        return jsonify({"status": "banco indisponível"}), 503
+
+    return jsonify({"status": "pronto"}), 200
@@ -0,0 +1,209 @@
+import json
+import os
+import struct
+import sys
+import zlib
+from array import array
+from datetime import datetime, timedelta
+from itertools import accumulate, chain
+
+from app.cache import CacheLRU
+from app.config import Config
+
+# Arquivo de segmento: MAGICO, tamanho do cabeçalho (uint32), cabeçalho em JSON
+# comprimido e, em seguida, os blocos. Cada bloco guarda até LINHAS_POR_BLOCO
+# linhas, coluna por coluna, cada coluna comprimida separadamente.
+MAGICO = b"BSEG1"
+NIVEL_COMPRESSAO = 6
+
+EPOCA = datetime(1970, 1, 1)
+UM_MICROSSEGUNDO = timedelta(microseconds=1)
+
+# (nome, typecode do array, gravada como diferença para a linha anterior). As
+# linhas ficam ordenadas por conta e data, então conta, data_hora e id viram
+# números pequenos e repetidos, que comprimem bem.
+COLUNAS = (
+    ("conta", "q", True),
+    ("data_hora", "q", True),
+    ("id", "q", True),
+    ("tipo", "B", False),
+    ("valor", "d", False),
+    ("origem", "q", False),
+    ("destino", "q", False),
+)
+
+_blocos = CacheLRU(Config.ARQUIVO_CACHE_BLOCOS, 3600)
+
+
+def para_micros(data_hora):
+    return (data_hora - EPOCA) // UM_MICROSSEGUNDO
+
+
+def de_micros(micros):
+    return EPOCA + timedelta(microseconds=micros)
+
+
+def _codificar_coluna(valores, typecode, diferencas):
+    if diferencas:
+        valores = [atual - anterior for anterior, atual in zip(chain((0,), valores), valores)]
+    dados = array(typecode, valores)
+    if sys.byteorder != "little":
+        dados.byteswap()
+    return zlib.compress(dados.tobytes(), NIVEL_COMPRESSAO)
+
+
+def _decodificar_coluna(bruto, typecode, diferencas):
+    dados = array(typecode)
+    dados.frombytes(zlib.decompress(bruto))
+    if sys.byteorder != "little":
+        dados.byteswap()
+    return list(accumulate(dados)) if diferencas else dados.tolist()
+
+
+def totais_da_linha(conta, tipo, valor, origem, destino):
+    # Mesma regra de TotaisService: a linha conta uma vez para cada lado que a conta ocupa.
+    totais = [0, 0, 0, 0, 0]
+    if origem == conta:
+        if tipo == "deposito":
+            totais[0] = valor
+        elif tipo == "saque":
+            totais[1] = valor
+        elif tipo == "transferencia":
+            totais[2] = valor
+        totais[4] += 1
+    if destino == conta:
+        if tipo == "transferencia":
+            totais[3] = valor
+        totais[4] += 1
+    return totais
+
+
+def escrever_segmento(caminho, linhas, atributos, linhas_por_bloco):
+    # linhas: (conta, data_hora em micros, id, tipo, valor, origem, destino); origem
+    # e destino nulos viram 0, que nunca é id de conta.
+    linhas.sort(key=lambda linha: (linha[0], -linha[1], -linha[2]))
+    tipos = sorted({linha[3] for linha in linhas})
+    codigo_tipo = {tipo: posicao for posicao, tipo in enumerate(tipos)}
+
+    # Índice: por conta, a primeira linha, a quantidade e os totais já somados.
+    indice = []
+    for posicao, (conta, _, id_transacao, tipo, valor, origem, destino) in enumerate(linhas):
+        if not indice or indice[-1][0] != conta:
+            indice.append([conta, posicao, 0, 0, 0, 0, 0, 0, id_transacao])
+        entrada = indice[-1]
+        entrada[2] += 1
+        for coluna, parcela in enumerate(totais_da_linha(conta, tipo, valor, origem, destino)):
+            entrada[3 + coluna] += parcela
+        entrada[8] = max(entrada[8], id_transacao)
+
+    blocos = []
+    partes = []
+    deslocamento = 0
+    for inicio in range(0, len(linhas), linhas_por_bloco):
+        fatia = linhas[inicio:inicio + linhas_por_bloco]
+        colunas = {}
+        for numero, (nome, typecode, diferencas) in enumerate(COLUNAS):
+            valores = [linha[numero] for linha in fatia]
+            if nome == "tipo":
+                valores = [codigo_tipo[valor] for valor in valores]
+            bruto = _codificar_coluna(valores, typecode, diferencas)
+            colunas[nome] = [deslocamento, len(bruto)]
+            partes.append(bruto)
+            deslocamento += len(bruto)
+        blocos.append(colunas)
+
+    cabecalho = zlib.compress(json.dumps({
+        **atributos,
+        "linhas": len(linhas),
+        "linhas_por_bloco": linhas_por_bloco,
+        "tipos": tipos,
+        "blocos": blocos,
+        "indice": indice,
+    }).encode("utf-8"), NIVEL_COMPRESSAO)
+
+    # Grava ao lado e renomeia: quem lê nunca vê um segmento pela metade.
+    temporario = caminho + ".tmp"
+    with open(temporario, "wb") as arquivo:
+        arquivo.write(MAGICO)
+        arquivo.write(struct.pack("<I", len(cabecalho)))
+        arquivo.write(cabecalho)
+        for parte in partes:
+            arquivo.write(parte)
+        arquivo.flush()
+        os.fsync(arquivo.fileno())
+    os.replace(temporario, caminho)
+    return len(linhas)
+
+
+class Segmento:
+    def __init__(self, caminho, versao):
+        self.caminho = caminho
+        self.versao = versao
+        with open(caminho, "rb") as arquivo:
+            if arquivo.read(len(MAGICO)) != MAGICO:
+                raise Exception(f"{caminho} não é um segmento de transações.")
+            tamanho, = struct.unpack("<I", arquivo.read(4))
+            self.cabecalho = json.loads(zlib.decompress(arquivo.read(tamanho)))
+        self.inicio_dados = len(MAGICO) + 4 + tamanho
+        self.indice = {entrada[0]: entrada[1:] for entrada in self.cabecalho["indice"]}
+
+    def ler_bloco(self, numero):
+        chave = (self.caminho, self.versao, numero)
+        bloco = _blocos.obter(chave)
+        if bloco is None:
+            colunas = self.cabecalho["blocos"][numero]
+            bloco = {}
+            with open(self.caminho, "rb") as arquivo:
+                for nome, typecode, diferencas in COLUNAS:
+                    deslocamento, tamanho = colunas[nome]
+                    arquivo.seek(self.inicio_dados + deslocamento)
+                    bloco[nome] = _decodificar_coluna(arquivo.read(tamanho), typecode, diferencas)
+            _blocos.definir(chave, bloco)
+        return bloco
+
+    def linhas_da_conta(self, conta):
+        # Em ordem decrescente de (data_hora, id): (data_hora, id, tipo, valor, origem, destino).
+        entrada = self.indice.get(conta)
+        if entrada is None:
+            return
+        primeira, quantidade = entrada[0], entrada[1]
+        por_bloco = self.cabecalho["linhas_por_bloco"]
+        tipos = self.cabecalho["tipos"]
+        posicao = primeira
+        while posicao < primeira + quantidade:
+            numero, inicio = divmod(posicao, por_bloco)
+            fim = min(por_bloco, inicio + primeira + quantidade - posicao)
+            bloco = self.ler_bloco(numero)
+            for linha in range(inicio, fim):
+                yield (
+                    de_micros(bloco["data_hora"][linha]),
+                    bloco["id"][linha],
+                    tipos[bloco["tipo"][linha]],
+                    bloco["valor"][linha],
+                    bloco["origem"][linha] or None,
+                    bloco["destino"][linha] or None,
+                )
+            posicao += fim - inicio
+
+    def totais(self, primeira_conta, ultima_conta):
+        # (conta, [depositos, saques, enviadas, recebidas, quantidade, ultima_transacao_id])
+        for conta, entrada in self.indice.items():
+            if primeira_conta <= conta <= ultima_conta:
+                yield conta, entrada[2:]
+
+
+_segmentos = CacheLRU(1024, 3600)
+
+
+def abrir_segmento(caminho):
+    try:
+        estado = os.stat(caminho)
+    except FileNotFoundError:
+        return None
+    # O inode muda a cada regravação (os.replace), então a versão antiga sai do cache.
+    versao = (estado.st_ino, estado.st_mtime_ns)
+    segmento = _segmentos.obter(caminho)
+    if segmento is None or segmento.versao != versao:
+        segmento = Segmento(caminho, versao)
+        _segmentos.definir(caminho, segmento)
+    return segmento
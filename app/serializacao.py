@@ -0,0 +1,68 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class Linhas:
+    # Resultado de consulta como veio do cursor (nomes das colunas + tuplas). As
+    # rotas devolvem isto direto; cada linha só vira objeto JSON na serialização.
+    __slots__ = ("colunas", "linhas")
+
+    def __init__(self, colunas, linhas):
+        self.colunas = tuple(colunas)
+        self.linhas = linhas
+
+    def __len__(self):
+        return len(self.linhas)
+
+    def __iter__(self):
+        colunas = self.colunas
+        return (dict(zip(colunas, linha)) for linha in self.linhas)
+
+
+def _converter(obj):
+    if isinstance(obj, Linhas):
+        colunas = obj.colunas
+        return [dict(zip(colunas, linha)) for linha in obj.linhas]
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Objeto do tipo {type(obj).__name__} não é serializável em JSON")
+
+
+if orjson is not None:
+    # O orjson serializa datetime em ISO 8601 sozinho; o _converter só é chamado para o resto.
+    def codificar(obj):
+        return orjson.dumps(obj, default=_converter, option=orjson.OPT_NON_STR_KEYS)
+
+    decodificar = orjson.loads
+else:
+    # Mesma saída do orjson: sem espaços e com UTF-8 em vez de escapes \uXXXX.
+    _codificador = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=_converter)
+
+    def codificar(obj):
+        return _codificador.encode(obj).encode("utf-8")
+
+    decodificar = json.loads
+
+
+class ProvedorJSON(JSONProvider):
+    # Substitui o provedor padrão do Flask: jsonify e request.get_json passam a usar
+    # o orjson quando instalado, e a resposta é montada direto dos bytes.
+    def dumps(self, obj, **kwargs):
+        return codificar(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return decodificar(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(codificar(obj) + b"\n", mimetype="application/json")
@@ -1,30 +1,217 @@
-from app.database import get_conexão_db
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from app.database import get_conexão_db, get_conexão_leitura, conexao_de_leitura_do_pool, ErroBanco
 from app.config import Config
+from app import replicas, shards
+from app.serializacao import Linhas
+from app.services.fatias_service import FatiasService, SUBCONSULTA_SALDO_FATIAS
 from flask_bcrypt import Bcrypt
 from datetime import datetime, timedelta
 from jose import jwt, JWTError
 from flask import Blueprint, request, jsonify
-import mysql.connector
 
 bcrypt = Bcrypt()
 
 class AdminService():
     @staticmethod
-    def listar_todas_as_contas():
-        db = get_conexão_db()
+    def validar_filtros_contas(args):
+        filtros = {}
         try:
+            filtros["limite"] = int(args.get("limit", Config.ADMIN_CONTAS_LIMITE_PADRAO))
+            filtros["apos"] = int(args["after"]) if args.get("after") else None
+            filtros["saldo_min"] = float(args["saldo_min"]) if args.get("saldo_min") else None
+            filtros["saldo_max"] = float(args["saldo_max"]) if args.get("saldo_max") else None
+        except ValueError:
+            raise Exception("Os parâmetros 'limit', 'after', 'saldo_min' e 'saldo_max' precisam ser numéricos.")
+
+        if filtros["limite"] <= 0 or filtros["limite"] > Config.ADMIN_CONTAS_LIMITE_MAX:
+            raise Exception(f"O parâmetro 'limit' precisa estar entre 1 e {Config.ADMIN_CONTAS_LIMITE_MAX}.")
+
+        filtros["status"] = args.get("status")
+        if filtros["status"] and filtros["status"] not in ["ativo", "inativo"]:
+            raise Exception("Status inválido. Use 'ativo' ou 'inativo'.")
+
+        filtros["titular"] = args.get("titular")
+
+        filtros["formato"] = args.get("formato", "json").lower()
+        if filtros["formato"] not in ("json", "ndjson", "csv"):
+            raise Exception("Formato inválido. Use 'json', 'ndjson' ou 'csv'.")
+        return filtros
+
+    @staticmethod
+    def montar_consulta_contas(filtros, paginar=True):
+        condicoes = []
+        parametros = []
+        if filtros.get("status"):
+            condicoes.append("status = %s")
+            parametros.append(filtros["status"])
+        # Os filtros de saldo consideram a parte do saldo que está em fatias.
+        saldo = f"c.saldo + COALESCE({SUBCONSULTA_SALDO_FATIAS}, 0)"
+        if filtros.get("saldo_min") is not None:
+            condicoes.append(f"{saldo} >= %s")
+            parametros.append(filtros["saldo_min"])
+        if filtros.get("saldo_max") is not None:
+            condicoes.append(f"{saldo} <= %s")
+            parametros.append(filtros["saldo_max"])
+        if filtros.get("titular"):
+            prefixo = filtros["titular"].replace("!", "!!").replace("%", "!%").replace("_", "!_")
+            condicoes.append("nome_titular LIKE %s ESCAPE '!'")
+            parametros.append(prefixo + "%")
+        if filtros.get("apos") is not None:
+            condicoes.append("id > %s")
+            parametros.append(filtros["apos"])
+
+        consulta = "SELECT * FROM contas c"
+        if condicoes:
+            consulta += " WHERE " + " AND ".join(condicoes)
+        consulta += " ORDER BY id"
+        if paginar:
+            consulta += " LIMIT %s"
+            parametros.append(filtros["limite"] + 1)
+        return consulta, tuple(parametros)
+
+    @staticmethod
+    def leitura_em_replica():
+        # Decidido na thread da requisição, que enxerga o cookie de quem acabou de escrever.
+        return {shard: replicas.motivo_primario(shard) is None for shard in shards.indices()}
+
+    @staticmethod
+    def buscar_contas_no_shard(shard, filtros, usar_replica=False):
+        # Roda nas threads do fan-out, com uma conexão do pool do shard (ou de uma réplica dele).
+        with conexao_de_leitura_do_pool(shard, usar_replica) as db:
             cursor = db.cursor()
-            cursor.execute("SELECT * FROM contas;")
+            try:
+                saldos_fatias = FatiasService.saldos_em_fatias(cursor)
+                consulta, parametros = AdminService.montar_consulta_contas(filtros)
+                cursor.execute(consulta, parametros)
+                colunas = [desc[0] for desc in cursor.description]
+                dados = list(AdminService.somar_fatias_nas_linhas(colunas, cursor.fetchall(), saldos_fatias))
+            finally:
+                cursor.close()
+        return colunas, dados
+
+    @staticmethod
+    def buscar_contas_nos_shards(filtros, usar_replica=None):
+        # A mesma página é pedida a todos os shards ao mesmo tempo; cada um devolve
+        # até limite + 1 contas, já em ordem de id.
+        usar_replica = usar_replica or AdminService.leitura_em_replica()
+        with ThreadPoolExecutor(max_workers=shards.quantidade()) as executor:
+            respostas = list(executor.map(
+                lambda shard: AdminService.buscar_contas_no_shard(shard, filtros, usar_replica[shard]), shards.indices()))
+        return respostas[0][0], [dados for _, dados in respostas]
+
+    @staticmethod
+    def listar_contas_dos_shards(filtros):
+        colunas, paginas = AdminService.buscar_contas_nos_shards(filtros)
+        posicao_id = colunas.index("id")
+        # As primeiras limite + 1 contas do merge são as primeiras de todos os shards juntos.
+        dados = list(islice(heapq.merge(*paginas, key=lambda linha: linha[posicao_id]), filtros["limite"] + 1))
+        return colunas, dados
+
+    @staticmethod
+    def listar_todas_as_contas(filtros):
+        if shards.ativo():
+            colunas, dados = AdminService.listar_contas_dos_shards(filtros)
+            return AdminService.paginar_contas(colunas, dados, filtros)
+
+        db = get_conexão_leitura()
+        try:
+            cursor = db.cursor()
+            saldos_fatias = FatiasService.saldos_em_fatias(cursor)
+            consulta, parametros = AdminService.montar_consulta_contas(filtros)
+            cursor.execute(consulta, parametros)
             colunas = [desc[0] for desc in cursor.description]
             dados = cursor.fetchall()
-        
-            contas =[dict(zip(colunas,linha)) for linha in dados]
-            return contas
-        except mysql.connector.Error as err:
+            if saldos_fatias:
+                dados = list(AdminService.somar_fatias_nas_linhas(colunas, dados, saldos_fatias))
+
+            return AdminService.paginar_contas(colunas, dados, filtros)
+        except ErroBanco as err:
             raise err
         finally:
             cursor.close()
 
+    @staticmethod
+    def paginar_contas(colunas, dados, filtros):
+        proximo_cursor = None
+        if len(dados) > filtros["limite"]:
+            dados = dados[:filtros["limite"]]
+            proximo_cursor = dados[-1][colunas.index("id")]
+
+        return Linhas(colunas, dados), proximo_cursor
+
+    @staticmethod
+    def somar_fatias_nas_linhas(colunas, linhas, saldos_fatias):
+        # Só as linhas das contas com saldo em fatias são refeitas.
+        if not saldos_fatias:
+            return linhas
+        posicao_id = colunas.index("id")
+        posicao_saldo = colunas.index("saldo")
+        return (
+            linha if linha[posicao_id] not in saldos_fatias
+            else linha[:posicao_saldo]
+            + (FatiasService.saldo_visivel(linha[posicao_saldo], saldos_fatias[linha[posicao_id]]),)
+            + linha[posicao_saldo + 1:]
+            for linha in linhas
+        )
+
+    @staticmethod
+    def iterar_contas_dos_shards(filtros):
+        # Cada shard é lido em páginas de ADMIN_CONTAS_BLOCO_STREAM contas (a primeira
+        # de todos em paralelo, as seguintes conforme o merge consome).
+        bloco = dict(filtros, limite=Config.ADMIN_CONTAS_BLOCO_STREAM)
+        usar_replica = AdminService.leitura_em_replica()
+        colunas, primeiras = AdminService.buscar_contas_nos_shards(bloco, usar_replica)
+        posicao_id = colunas.index("id")
+
+        def paginas(shard, dados):
+            while True:
+                yield from dados[:bloco["limite"]]
+                if len(dados) <= bloco["limite"]:
+                    return
+                _, dados = AdminService.buscar_contas_no_shard(
+                    shard, dict(bloco, apos=dados[bloco["limite"] - 1][posicao_id]), usar_replica[shard])
+
+        geradores = [paginas(shard, dados) for shard, dados in zip(shards.indices(), primeiras)]
+        return colunas, heapq.merge(*geradores, key=lambda linha: linha[posicao_id])
+
+    @staticmethod
+    def iterar_contas(filtros):
+        if shards.ativo():
+            return AdminService.iterar_contas_dos_shards(filtros)
+
+        # Cursor não bufferizado: as linhas chegam do servidor conforme são lidas,
+        # então a memória fica constante qualquer que seja o tamanho da tabela.
+        db = get_conexão_leitura()
+        cursor = db.cursor()
+        try:
+            saldos_fatias = FatiasService.saldos_em_fatias(cursor)
+        finally:
+            cursor.close()
+
+        cursor = db.cursor(buffered=False)
+        try:
+            consulta, parametros = AdminService.montar_consulta_contas(filtros, paginar=False)
+            cursor.execute(consulta, parametros)
+        except ErroBanco as err:
+            cursor.close()
+            raise err
+        colunas = [desc[0] for desc in cursor.description]
+
+        def linhas():
+            try:
+                while True:
+                    bloco = cursor.fetchmany(Config.ADMIN_CONTAS_BLOCO_STREAM)
+                    if not bloco:
+                        break
+                    yield from AdminService.somar_fatias_nas_linhas(colunas, bloco, saldos_fatias)
+            finally:
+                cursor.close()
+
+        return colunas, linhas()
+
     @staticmethod
     def inserir_admin_na_db(username, senha_hash):
         db = get_conexão_db()
@@ -35,7 +222,7 @@ class AdminService():
             (username, senha_hash, "admin")
         )
             
-        except mysql.connector.Error as err:
+        except ErroBanco as err:
             db.rollback()
             raise err
         finally:
@@ -0,0 +1,343 @@
+import fcntl
+import json
+import logging
+import os
+import shutil
+from datetime import date, datetime, timedelta
+from itertools import islice
+
+from app.config import Config
+from app.backends import get_backend
+from app import metricas, segmentos, shards
+from app.services.particoes_service import (
+    ParticoesService, inicio_do_mes, somar_meses, nome_particao)
+
+logger = logging.getLogger("app.arquivo")
+
+ARQUIVO_ESTADO = "estado.json"
+ARQUIVO_TRAVA = ".trava"
+TAMANHO_LOTE_EXCLUSAO = 5000
+
+# Por shard: {shard: (versao, estado)}.
+_estado_cache = {}
+
+
+def pasta_do_shard(shard):
+    # Com shards, cada um arquiva as próprias contas em um subdiretório.
+    if shard is None:
+        return Config.ARQUIVO_PASTA
+    return os.path.join(Config.ARQUIVO_PASTA, f"shard_{shard}")
+
+
+def pasta_do_mes(mes, shard=None):
+    return os.path.join(pasta_do_shard(shard), f"{mes:%Y%m}")
+
+
+def caminho_do_segmento(mes, faixa, shard=None):
+    return os.path.join(pasta_do_mes(mes, shard), f"contas_{faixa:06d}.seg")
+
+
+def inicio_do_mes_em(mes):
+    return datetime(mes.year, mes.month, 1)
+
+
+def ler_estado(shard=None):
+    # estado.json: {"arquivado_ate": "AAAA-MM-01", "meses": [...], "contas_por_segmento": N}.
+    # Toda transação com data_hora < arquivado_ate está nos segmentos, e só neles
+    # é lida. O arquivo é relido apenas quando muda (um stat por consulta).
+    caminho = os.path.join(pasta_do_shard(shard), ARQUIVO_ESTADO)
+    try:
+        informacoes = os.stat(caminho)
+    except FileNotFoundError:
+        return None
+    versao = (informacoes.st_ino, informacoes.st_mtime_ns)
+    em_cache = _estado_cache.get(shard)
+    if em_cache is None or em_cache[0] != versao:
+        with open(caminho, encoding="utf-8") as arquivo:
+            bruto = json.load(arquivo)
+        em_cache = _estado_cache[shard] = (versao, {
+            "arquivado_ate": inicio_do_mes_em(date.fromisoformat(bruto["arquivado_ate"])),
+            "meses": [date.fromisoformat(mes) for mes in bruto["meses"]],
+            "contas_por_segmento": bruto["contas_por_segmento"],
+        })
+    return em_cache[1]
+
+
+def gravar_estado(arquivado_ate, meses, contas_por_segmento, shard=None):
+    caminho = os.path.join(pasta_do_shard(shard), ARQUIVO_ESTADO)
+    temporario = caminho + ".tmp"
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        json.dump({
+            "arquivado_ate": arquivado_ate.isoformat(),
+            "meses": [mes.isoformat() for mes in meses],
+            "contas_por_segmento": contas_por_segmento,
+        }, arquivo)
+        arquivo.flush()
+        os.fsync(arquivo.fileno())
+    os.replace(temporario, caminho)
+
+
+class ArquivoService():
+    # Transações mais antigas que ARQUIVO_HORIZONTE_MESES saem de transacoes para
+    # segmentos em disco, um por mês e faixa de ARQUIVO_CONTAS_POR_SEGMENTO contas.
+    # As leituras consultam o banco só a partir de arquivado_ate e descem para os
+    # segmentos quando a página ou o período pedido passa desse ponto.
+    @staticmethod
+    def limite_arquivado(shard=None):
+        estado = ler_estado(shard)
+        return estado["arquivado_ate"] if estado else None
+
+    @staticmethod
+    def inicio_quente(id, de):
+        # Início do filtro de data das consultas em transacoes: nada abaixo do limite.
+        limite = ArquivoService.limite_arquivado(shards.shard_da_conta(id))
+        if limite is None or (de is not None and de >= limite):
+            return de
+        return limite
+
+    @staticmethod
+    def iterar_linhas(id, apos=None, de=None, ate=None):
+        # Linhas arquivadas da conta, da mais nova para a mais antiga, abrindo só os
+        # segmentos dos meses que o intervalo pedido alcança.
+        shard = shards.shard_da_conta(id)
+        estado = ler_estado(shard)
+        if estado is None:
+            return
+        faixa = id // estado["contas_por_segmento"]
+        for mes in reversed(estado["meses"]):
+            inicio = inicio_do_mes_em(mes)
+            if de is not None and inicio_do_mes_em(somar_meses(mes, 1)) <= de:
+                break
+            if (ate is not None and inicio >= ate) or (apos is not None and inicio > apos[0]):
+                continue
+
+            segmento = segmentos.abrir_segmento(caminho_do_segmento(mes, faixa, shard))
+            if segmento is None or id not in segmento.indice:
+                continue
+            metricas.somar("banco_arquivo_segmentos_lidos_total")
+            for linha in segmento.linhas_da_conta(id):
+                data_hora = linha[0]
+                if de is not None and data_hora < de:
+                    return
+                if (ate is not None and data_hora >= ate) or (apos is not None and (data_hora, linha[1]) >= apos):
+                    continue
+                yield linha
+
+    @staticmethod
+    def iterar_extrato(id, apos=None, de=None, ate=None):
+        # Mesmo formato das linhas de montar_consulta_extrato.
+        for data_hora, id_transacao, tipo, valor, _, destino in ArquivoService.iterar_linhas(id, apos, de, ate):
+            yield (tipo, valor, data_hora, destino, id_transacao)
+
+    @staticmethod
+    def precisa_completar(id, linhas, quantidade, de=None):
+        limite = ArquivoService.limite_arquivado(shards.shard_da_conta(id))
+        return limite is not None and len(linhas) < quantidade and (de is None or de < limite)
+
+    @staticmethod
+    def completar_extrato(id, linhas, quantidade, apos=None, de=None, ate=None):
+        # As linhas do banco são todas posteriores ao limite e as arquivadas,
+        # anteriores: basta emendar, sem intercalar.
+        if not ArquivoService.precisa_completar(id, linhas, quantidade, de):
+            return linhas
+        arquivadas = islice(ArquivoService.iterar_extrato(id, apos, de, ate), quantidade - len(linhas))
+        return list(linhas) + list(arquivadas)
+
+    @staticmethod
+    def variacao(id, inicio, fim):
+        # Variação de saldo das linhas arquivadas em [inicio, fim), com a regra de SnapshotService.
+        total = 0
+        for _, _, tipo, valor, origem, destino in ArquivoService.iterar_linhas(id, None, inicio, fim):
+            if origem == id:
+                total += -valor if tipo == "saque" else valor
+            if destino == id:
+                total -= valor
+        return total
+
+    @staticmethod
+    def totais(primeira_conta, ultima_conta, shard=None):
+        # Totais por conta já somados no índice de cada segmento; nenhuma linha é lida.
+        estado = ler_estado(shard)
+        if estado is None:
+            return
+        por_segmento = estado["contas_por_segmento"]
+        for mes in estado["meses"]:
+            for faixa in range(primeira_conta // por_segmento, ultima_conta // por_segmento + 1):
+                segmento = segmentos.abrir_segmento(caminho_do_segmento(mes, faixa, shard))
+                if segmento is not None:
+                    yield from segmento.totais(primeira_conta, ultima_conta)
+
+    @staticmethod
+    def conta_tem_transacoes(id):
+        return any(True for _ in ArquivoService.totais(id, id, shards.shard_da_conta(id)))
+
+    @staticmethod
+    def meses_a_arquivar(cursor, hoje, shard=None):
+        # Só meses inteiros, mais antigos que o horizonte e já fechados pelos snapshots
+        # diários: o job de snapshots nunca precisa voltar aos segmentos.
+        corte = somar_meses(inicio_do_mes(hoje), -Config.ARQUIVO_HORIZONTE_MESES)
+        cursor.execute("SELECT ultimo_dia FROM snapshots_progresso WHERE id = 1")
+        linha = cursor.fetchone()
+        if linha is None:
+            logger.warning("Nenhum snapshot diário gerado ainda; nada será arquivado.")
+            return []
+        corte = min(corte, inicio_do_mes(linha[0] + timedelta(days=1)))
+
+        estado = ler_estado(shard)
+        if estado is not None:
+            primeiro = estado["arquivado_ate"].date()
+        else:
+            cursor.execute("SELECT MIN(data_hora) FROM transacoes")
+            mais_antiga = cursor.fetchone()[0]
+            candidatos = [inicio_do_mes(datetime.fromisoformat(str(mais_antiga)))] if mais_antiga else []
+            candidatos.extend(ArquivoService.tabelas_desanexadas(cursor))
+            if not candidatos:
+                return []
+            primeiro = min(candidatos)
+
+        meses = []
+        mes = primeiro
+        while mes < corte:
+            meses.append(mes)
+            mes = somar_meses(mes, 1)
+        return meses
+
+    @staticmethod
+    def tabelas_desanexadas(cursor):
+        if get_backend().nome != "mysql":
+            return {}
+        return ParticoesService.tabelas_desanexadas(cursor)
+
+    @staticmethod
+    def ler_mes(conexao, mes, tabela_desanexada, por_segmento, shard=None):
+        # Cada transação vira uma linha para a conta de origem e outra para a de
+        # destino, cada uma no segmento da faixa da sua conta. Com shards, só as
+        # contas do shard: a outra ponta de uma transferência tem a própria cópia.
+        inicio = inicio_do_mes_em(mes)
+        fim = inicio_do_mes_em(somar_meses(mes, 1))
+        consulta = "SELECT id, tipo, valor, conta_id, conta_destino_id, data_hora FROM transacoes WHERE data_hora >= %s AND data_hora < %s"
+        parametros = (inicio, fim)
+        if tabela_desanexada:
+            consulta += f" UNION ALL SELECT id, tipo, valor, conta_id, conta_destino_id, data_hora FROM {tabela_desanexada}"
+
+        faixas = {}
+        cursor = conexao.cursor(buffered=False)
+        try:
+            cursor.execute(consulta, parametros)
+            while True:
+                linhas = cursor.fetchmany(Config.EXTRATO_TAMANHO_BLOCO_STREAM)
+                if not linhas:
+                    break
+                for id_transacao, tipo, valor, origem, destino, data_hora in linhas:
+                    micros = segmentos.para_micros(data_hora)
+                    for conta in {origem, destino} - {None}:
+                        if shard is not None and shards.shard_da_conta(conta) != shard:
+                            continue
+                        faixas.setdefault(conta // por_segmento, []).append(
+                            (conta, micros, id_transacao, tipo, valor, origem or 0, destino or 0))
+        finally:
+            cursor.close()
+        return faixas
+
+    @staticmethod
+    def escrever_mes(mes, faixas, shard=None):
+        # Uma execução interrompida deixa segmentos de um mês que ainda não conta
+        # como arquivado; eles são refeitos do zero.
+        pasta = pasta_do_mes(mes, shard)
+        shutil.rmtree(pasta, ignore_errors=True)
+        os.makedirs(pasta)
+        linhas = 0
+        for faixa, linhas_da_faixa in sorted(faixas.items()):
+            linhas += segmentos.escrever_segmento(
+                caminho_do_segmento(mes, faixa, shard), linhas_da_faixa,
+                {"mes": mes.isoformat(), "faixa": faixa}, Config.ARQUIVO_LINHAS_POR_BLOCO)
+        diretorio = os.open(pasta, os.O_RDONLY)
+        try:
+            os.fsync(diretorio)
+        finally:
+            os.close(diretorio)
+        return linhas
+
+    @staticmethod
+    def limpar_banco(conexao, limite, meses=()):
+        # Roda depois de o limite ser gravado: a essa altura nenhuma leitura usa mais
+        # as linhas abaixo dele em transacoes. Repetível até terminar.
+        cursor = conexao.cursor()
+        try:
+            if get_backend().nome == "mysql":
+                # Partição do mês inteira abaixo do limite: TRUNCATE devolve o espaço em disco na hora.
+                particionados = set(ParticoesService.meses_particionados(cursor))
+                for mes in meses:
+                    if mes in particionados:
+                        cursor.execute(f"ALTER TABLE transacoes TRUNCATE PARTITION {nome_particao(mes)}")
+                for mes, tabela in ArquivoService.tabelas_desanexadas(cursor).items():
+                    if inicio_do_mes_em(somar_meses(mes, 1)) <= limite:
+                        cursor.execute(f"DROP TABLE {tabela}")
+
+            while True:
+                cursor.execute(
+                    "SELECT id FROM transacoes WHERE data_hora < %s ORDER BY data_hora LIMIT %s",
+                    (limite, TAMANHO_LOTE_EXCLUSAO))
+                ids = [id_transacao for id_transacao, in cursor.fetchall()]
+                if not ids:
+                    break
+                marcadores = ", ".join(["%s"] * len(ids))
+                cursor.execute(
+                    f"DELETE FROM transacoes WHERE data_hora < %s AND id IN ({marcadores})", (limite, *ids))
+                conexao.commit()
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def arquivar(hoje=None, shard=None):
+        if Config.ARQUIVO_HORIZONTE_MESES <= 0:
+            raise Exception("Arquivamento desligado: defina ARQUIVO_HORIZONTE_MESES.")
+        hoje = hoje or date.today()
+        pasta = pasta_do_shard(shard)
+        os.makedirs(pasta, exist_ok=True)
+
+        trava = open(os.path.join(pasta, ARQUIVO_TRAVA), "w")
+        try:
+            try:
+                fcntl.flock(trava, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise Exception("Já existe um arquivamento em andamento.")
+
+            estado = ler_estado(shard)
+            meses_arquivados = list(estado["meses"]) if estado else []
+            # A faixa de contas de cada segmento não pode mudar depois do primeiro mês.
+            por_segmento = estado["contas_por_segmento"] if estado else Config.ARQUIVO_CONTAS_POR_SEGMENTO
+
+            conexao = get_backend(shard).abrir_conexao()
+            try:
+                cursor = conexao.cursor()
+                try:
+                    meses = ArquivoService.meses_a_arquivar(cursor, hoje, shard)
+                    desanexadas = ArquivoService.tabelas_desanexadas(cursor)
+                finally:
+                    cursor.close()
+
+                resultado = []
+                for mes in meses:
+                    faixas = ArquivoService.ler_mes(conexao, mes, desanexadas.get(mes), por_segmento, shard)
+                    linhas = ArquivoService.escrever_mes(mes, faixas, shard) if faixas else 0
+                    if faixas:
+                        meses_arquivados.append(mes)
+                    else:
+                        shutil.rmtree(pasta_do_mes(mes, shard), ignore_errors=True)
+
+                    limite = somar_meses(mes, 1)
+                    gravar_estado(limite, meses_arquivados, por_segmento, shard)
+                    ArquivoService.limpar_banco(conexao, inicio_do_mes_em(limite), [mes])
+                    logger.info("Mês %s arquivado: %s linha(s) em %s segmento(s)", f"{mes:%Y-%m}", linhas, len(faixas))
+                    resultado.append({"mes": f"{mes:%Y-%m}", "linhas": linhas, "segmentos": len(faixas)})
+
+                # Sobras de uma execução interrompida logo após gravar o limite.
+                estado = ler_estado(shard)
+                if estado is not None and not meses:
+                    ArquivoService.limpar_banco(conexao, estado["arquivado_ate"])
+                return resultado
+            finally:
+                conexao.close()
+        finally:
+            trava.close()
@@ -1,24 +1,48 @@
-from app.database import get_conexão_db
+from app.database import get_conexão_db, get_conexão_leitura, conexoes_abertas, ErroBanco
 from app.config import Config
 from flask_bcrypt import Bcrypt
 from datetime import datetime, timedelta
 from jose import jwt, JWTError
-from flask import Blueprint, request, jsonify
-import mysql.connector
+from flask import Blueprint, g, request, jsonify
+import hashlib
+import threading
+import time
+from app.cache import CacheLRU
+from app import cache_contas, eventos, shards
+from app.services.senha_service import SenhaService, SobrecargaError
+from app.services.fatias_service import FatiasService, SUBCONSULTA_SALDO_FATIAS
 
 bcrypt = Bcrypt()
 
+# Claims de tokens já verificados. O role vem do banco na verificação, e
+# revogar_tokens_usuario tira do cache (neste e, pelo canal, nos outros
+# processos) os tokens do usuário.
+cache_tokens = CacheLRU(Config.TOKEN_CACHE_TAMANHO, Config.TOKEN_CACHE_TTL_SEGUNDOS)
+# Uma verificação que começou antes de uma revogação não pode pôr o token no cache.
+_geracao_revogacoes = [0]
+_revogacoes_lock = threading.Lock()
+
+CONSULTA_CONTA = f"""
+    SELECT c.id, c.saldo, c.status, {SUBCONSULTA_SALDO_FATIAS} AS saldo_fatias
+    FROM contas c
+    WHERE c.id = %s
+"""
+
 class AuthService:
 
     @staticmethod
     def verificar_existencia_conta(id):
-        db = get_conexão_db()
+        # Leitura consultiva (404, cabeçalho do extrato): pode vir do cache de contas.
+        return cache_contas.obter(id, AuthService.buscar_conta_no_banco)
+
+    @staticmethod
+    def buscar_conta_no_banco(id):
+        db = get_conexão_db(id)
         cursor = db.cursor(dictionary=True)
         try:
-            cursor.execute("SELECT id, saldo FROM contas WHERE id = %s", (id,))
-            conta = cursor.fetchone()
-            return conta
-        except mysql.connector.Error as err:
+            cursor.execute(CONSULTA_CONTA, (id,))
+            return FatiasService.somar_fatias(cursor.fetchone())
+        except ErroBanco as err:
             db.rollback()
             raise err
         finally:
@@ -29,20 +53,25 @@ class AuthService:
         db = get_conexão_db()
         cursor = db.cursor(dictionary=True)
         try:
-            cursor.execute("SELECT id, senha_hash FROM usuarios WHERE username = %s", (username,))
+            cursor.execute("SELECT id, senha_hash, role FROM usuarios WHERE username = %s", (username,))
             usuario = cursor.fetchone()
             return usuario
-        except mysql.connector.Error as err:
+        except ErroBanco as err:
             raise err
         finally:
             cursor.close()
     @staticmethod
-    def criar_token_acesso(user_id:int):
-        expira_em = datetime.utcnow() + timedelta(minutes=Config.ACCESS_TOKEN_EXPIRE_MINUTES)
+    def criar_token_acesso(user_id:int, role:str = None):
+        agora = datetime.utcnow()
+        expira_em = agora + timedelta(minutes=Config.ACCESS_TOKEN_EXPIRE_MINUTES)
         payload = {
             "sub": str(user_id),
+            # Com fração de segundo: um login logo depois de uma revogação já vale.
+            "iat": time.time(),
             "exp": expira_em
         }
+        if role is not None:
+            payload["role"] = role
 
         token = jwt.encode(payload, Config.SECRET_KEY, algorithm=Config.ALGORITHM)
 
@@ -50,6 +79,11 @@ class AuthService:
     
     @staticmethod
     def confirmacao_admin(user_id):
+        # O role vem da verificação do token nesta requisição (lido do banco na
+        # primeira vez, depois do cache de tokens); fora dela, vai ao banco.
+        if g.get("usuario_id") == user_id and g.get("usuario_role") is not None:
+            return g.usuario_role == "admin"
+
         db = get_conexão_db()
         try:
             cursor = db.cursor(dictionary=True)
@@ -57,41 +91,107 @@ class AuthService:
             usuario = cursor.fetchone()
             cursor.close()
             return usuario and usuario["role"] == "admin"
-        except mysql.connector.Error as err:
+        except ErroBanco as err:
             db.rollback()
             raise err
         finally:
             cursor.close()
-    
+
     @staticmethod
-    def obter_usuario_atual(token:str):
+    def verificar_token(token:str):
+        chave = hashlib.sha256(token.encode("utf-8")).hexdigest()
+        claims = cache_tokens.obter(chave)
+        if claims is not None:
+            return claims
+
         try:
             payload = jwt.decode(token, Config.SECRET_KEY, algorithms=[Config.ALGORITHM])
             user_id = payload.get("sub")
             if user_id is None:
                 return None
-            return int(user_id)
-        except JWTError:
+            user_id = int(user_id)
+        except (JWTError, ValueError):
             return None
 
+        geracao = _geracao_revogacoes[0]
+        usuario = AuthService.buscar_acesso(user_id)
+        if usuario is None:
+            return None
+        revogado_em = usuario["tokens_revogados_em"]
+        if revogado_em is not None and payload.get("iat", 0) < revogado_em:
+            return None
+
+        claims = {"user_id": user_id, "role": usuario["role"]}
+        with _revogacoes_lock:
+            if geracao == _geracao_revogacoes[0]:
+                cache_tokens.definir(chave, claims, expira_em=payload["exp"])
+        return claims
+
+    @staticmethod
+    def buscar_acesso(user_id):
+        db = get_conexão_db()
+        cursor = db.cursor(dictionary=True)
+        try:
+            cursor.execute("SELECT role, tokens_revogados_em FROM usuarios WHERE id = %s", (user_id,))
+            return cursor.fetchone()
+        except ErroBanco as err:
+            db.rollback()
+            raise err
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def revogar_tokens_usuario(user_id):
+        # Chamar quando o role de um usuário muda ou o acesso dele é revogado:
+        # tokens emitidos até agora deixam de ser aceitos em todos os processos.
+        db = get_conexão_db()
+        cursor = db.cursor()
+        try:
+            cursor.execute("UPDATE usuarios SET tokens_revogados_em = %s WHERE id = %s", (time.time(), user_id))
+            revogou = cursor.rowcount == 1
+            db.commit()
+        except ErroBanco as err:
+            db.rollback()
+            raise err
+        finally:
+            cursor.close()
+        AuthService.esquecer_tokens([user_id])
+        cache_contas.invalidar_usuarios(user_id)
+        return revogou
+
+    @staticmethod
+    def esquecer_tokens(usuarios):
+        # usuarios None: o canal pode ter perdido avisos, então nenhum token em cache vale.
+        with _revogacoes_lock:
+            _geracao_revogacoes[0] += 1
+            if usuarios is None:
+                cache_tokens.limpar()
+                return
+            usuarios = {int(usuario) for usuario in usuarios}
+            cache_tokens.invalidar_se(lambda claims: claims["user_id"] in usuarios)
+
+    
+    @staticmethod
+    def obter_usuario_atual(token:str):
+        claims = AuthService.verificar_token(token)
+        return claims["user_id"] if claims else None
+
     @staticmethod
     def autenticar_usuario():
         token = request.headers.get("Authorization")
         if not token or not token.startswith("Bearer "):
             return None
         token = token.split(" ")[1]
-        try:
-            payload = jwt.decode(token, Config.SECRET_KEY, algorithms=[Config.ALGORITHM])
-            user_id = payload.get("sub")
-            if user_id is None:
-                return None
-            return int(user_id)
-        except JWTError:
+        claims = AuthService.verificar_token(token)
+        if claims is None:
             return None
+        g.usuario_id = claims["user_id"]
+        g.usuario_role = claims["role"]
+        return claims["user_id"]
     
     @staticmethod
     def obter_data_de_criacao_por_id(user_id):
-        db = get_conexão_db()
+        db = get_conexão_leitura()
         try:
             cursor = db.cursor()
             cursor.execute("SELECT username, criado_em FROM usuarios WHERE id = %s", (user_id,))
@@ -100,7 +200,7 @@ class AuthService:
                 "username" : usuario[0],
                 "criado_em" : usuario[1].isoformat()
             }
-        except mysql.connector.Error as err:
+        except ErroBanco as err:
             db.rollback()
             raise err
         finally:
@@ -108,12 +208,33 @@ class AuthService:
 
     @staticmethod
     def encode_password(senha):
-        senha_hash = bcrypt.generate_password_hash(senha).decode('utf-8')
-        return senha_hash
+        return SenhaService.gerar_hash(senha)
     
     @staticmethod
     def verificar_senha(senha_hash, senha_digitada):
-        return bcrypt.check_password_hash(senha_hash, senha_digitada)
+        return SenhaService.verificar(senha_hash, senha_digitada)
+
+    @staticmethod
+    def atualizar_hash_se_necessario(user_id, senha_hash, senha_digitada):
+        # Rehash transparente quando BCRYPT_LOG_ROUNDS muda; se o pool estiver
+        # cheio o login segue normalmente e a troca fica para o próximo.
+        if not SenhaService.precisa_rehash(senha_hash):
+            return
+        try:
+            novo_hash = SenhaService.gerar_hash(senha_digitada)
+        except SobrecargaError:
+            return
+
+        db = get_conexão_db()
+        try:
+            cursor = db.cursor()
+            cursor.execute("UPDATE usuarios SET senha_hash = %s WHERE id = %s", (novo_hash, user_id))
+            db.commit()
+        except ErroBanco as err:
+            db.rollback()
+            raise err
+        finally:
+            cursor.close()
           
     @staticmethod
     def formatar_resposta_token(token):
@@ -133,7 +254,7 @@ class AuthService:
             )
             
             return cursor.lastrowid
-        except mysql.connector.Error as err:
+        except ErroBanco as err:
             db.rollback()
             raise err
         finally:
@@ -141,24 +262,60 @@ class AuthService:
 
     @staticmethod
     def inserir_conta_na_db(nome, usuario_id):
+        if shards.ativo():
+            return AuthService.inserir_conta_em_shard(nome, usuario_id)
         db = get_conexão_db()
         try:
             cursor = db.cursor()
             cursor.execute("INSERT INTO contas (nome_titular, usuario_id) VALUES(%s,%s)",(nome,usuario_id))
-        except mysql.connector.Error as err:
+            return cursor.lastrowid
+        except ErroBanco as err:
             db.rollback()
             raise err
         finally:
             cursor.close()
-    
+
     @staticmethod
-    def commitar_na_db():
+    def inserir_conta_em_shard(nome, usuario_id):
+        # O id sai do diretório, único entre todos os shards, e decide em qual
+        # shard a linha da conta é gravada.
         db = get_conexão_db()
         try:
             cursor = db.cursor()
-            db.commit()
-        except mysql.connector.Error as err:
+            cursor.execute("INSERT INTO contas_diretorio (usuario_id) VALUES (%s)", (usuario_id,))
+            conta_id = cursor.lastrowid
+        except ErroBanco as err:
             db.rollback()
             raise err
         finally:
             cursor.close()
+
+        db = get_conexão_db(conta_id)
+        try:
+            cursor = db.cursor()
+            cursor.execute(
+                "INSERT INTO contas (id, nome_titular, usuario_id) VALUES (%s,%s,%s)", (conta_id, nome, usuario_id))
+            return conta_id
+        except ErroBanco as err:
+            db.rollback()
+            raise err
+        finally:
+            cursor.close()
+    
+    @staticmethod
+    def commitar_na_db():
+        # Commita todos os bancos usados na requisição, o principal primeiro: no
+        # cadastro com shards, um id de conta só é usado depois de gravado no diretório.
+        conexoes = conexoes_abertas()
+        try:
+            for db in conexoes:
+                db.commit()
+            cache_contas.aplicar_pendentes()
+            eventos.publicar_pendentes()
+        except ErroBanco as err:
+            for db in conexoes:
+                db.rollback()
+            raise err
+
+
+cache_contas.registrar_ouvinte_usuarios(AuthService.esquecer_tokens)
@@ -1,54 +1,239 @@
-from app.database import get_conexão_db
+from app.database import get_conexão_db, get_conexão_leitura, ErroBanco
+from app.services.totais_service import TotaisService
+from app.services.group_commit import get_group_commit
+from app.services.auth_service import AuthService
+from app.services.fatias_service import FatiasService, SUBCONSULTA_SALDO_FATIAS, SUBCONSULTAS_TOTAIS_FATIAS
+from app.services.arquivo_service import ArquivoService
+from app.services.transferencias_service import (
+    TransferenciasService,
+    TRANSFERENCIA_OK,
+    TRANSFERENCIA_ORIGEM_INEXISTENTE,
+    TRANSFERENCIA_DESTINO_INEXISTENTE,
+    TRANSFERENCIA_SALDO_INSUFICIENTE,
+    TRANSFERENCIA_ABORTADA,
+)
+from app import cache_contas, eventos, shards
+from app.serializacao import Linhas
 from app.config import Config
 from flask_bcrypt import Bcrypt
 from datetime import datetime, timedelta
 from jose import jwt, JWTError
 from flask import Blueprint, request, jsonify
-import mysql.connector
+from itertools import islice
+import base64
+import hashlib
 
 bcrypt = Bcrypt()
 
+# Mensagens dos itens recusados de um lote, por resultado de transferência.
+ERROS_LOTE = {
+    TRANSFERENCIA_ORIGEM_INEXISTENTE: "Usuário de origem não encontrado.",
+    TRANSFERENCIA_DESTINO_INEXISTENTE: "Conta de destino não encontrada.",
+    TRANSFERENCIA_SALDO_INSUFICIENTE: "Saldo insuficiente.",
+    TRANSFERENCIA_ABORTADA: "A transferência não pôde ser concluída e foi desfeita.",
+}
+
+# Nomes das colunas na ordem do SELECT de montar_consulta_extrato.
+CAMPOS_EXTRATO = ("tipo", "valor", "data_hora", "conta_destino_id", "id")
+
+# Deadlock (1213) e lock wait timeout (1205) podem ser repetidos com segurança,
+# pois a transação inteira já foi desfeita pelo servidor.
+ERROS_REPETIVEIS = (1213, 1205)
+TRANSFERENCIA_MAX_TENTATIVAS = 3
+
+CONSULTA_VERSAO_EXTRATO = f"""
+    SELECT c.id, c.saldo, t.ultima_transacao_id, t.quantidade_transacoes, {SUBCONSULTA_SALDO_FATIAS} AS saldo_fatias,
+        {SUBCONSULTAS_TOTAIS_FATIAS}
+    FROM contas c
+    LEFT JOIN totais_conta t ON t.conta_id = c.id
+    WHERE c.id = %s
+"""
+
 class ContaService():
     @staticmethod
-    def pegar_dados_do_extrato(id):
-        db = get_conexão_db()
+    def codificar_cursor_extrato(data_hora, id_transacao):
+        bruto = f"{data_hora.isoformat()}|{id_transacao}".encode("utf-8")
+        return base64.urlsafe_b64encode(bruto).decode("ascii").rstrip("=")
+
+    @staticmethod
+    def decodificar_cursor_extrato(cursor_extrato):
+        try:
+            preenchido = cursor_extrato + "=" * (-len(cursor_extrato) % 4)
+            data_hora, id_transacao = base64.urlsafe_b64decode(preenchido).decode("utf-8").split("|")
+            return datetime.fromisoformat(data_hora), int(id_transacao)
+        except (ValueError, UnicodeDecodeError):
+            raise Exception("Cursor de paginação inválido.")
+
+    @staticmethod
+    def validar_parametros_extrato(args):
+        try:
+            limite = int(args.get("limit", Config.EXTRATO_LIMITE_PADRAO))
+        except ValueError:
+            raise Exception("O parâmetro 'limit' precisa ser um número inteiro.")
+        if limite <= 0 or limite > Config.EXTRATO_LIMITE_MAX:
+            raise Exception(f"O parâmetro 'limit' precisa estar entre 1 e {Config.EXTRATO_LIMITE_MAX}.")
+
+        apos = args.get("after")
+        apos = ContaService.decodificar_cursor_extrato(apos) if apos else None
+
+        datas = {}
+        for campo in ("de", "ate"):
+            valor = args.get(campo)
+            try:
+                datas[campo] = datetime.fromisoformat(valor) if valor else None
+            except ValueError:
+                raise Exception(f"O parâmetro '{campo}' precisa ser uma data ISO 8601.")
+
+        formato = args.get("formato", "json").lower()
+        if formato not in ("json", "stream", "ndjson"):
+            raise Exception("Formato inválido. Use 'json', 'stream' ou 'ndjson'.")
+
+        return {"limite": limite, "apos": apos, "de": datas["de"], "ate": datas["ate"], "formato": formato}
+
+    @staticmethod
+    def linha_extrato_para_dict(linha):
+        return dict(zip(CAMPOS_EXTRATO, linha))
+
+    @staticmethod
+    def montar_consulta_extrato(id, limite=None, apos=None, de=None, ate=None):
+        # Cada ramo do UNION usa seu próprio índice (conta_id, data_hora, id) ou
+        # (conta_destino_id, data_hora, id); o OR original obrigava a varrer a tabela.
+        filtros = ""
+        parametros_filtro = []
+        if de is not None:
+            filtros += " AND data_hora >= %s"
+            parametros_filtro.append(de)
+        if ate is not None:
+            filtros += " AND data_hora < %s"
+            parametros_filtro.append(ate)
+        if apos is not None:
+            # O "data_hora <= %s" é redundante com o OR, mas é o que deixa o MySQL
+            # descartar as partições mensais mais novas que o cursor.
+            filtros += " AND data_hora <= %s AND (data_hora < %s OR (data_hora = %s AND id < %s))"
+            parametros_filtro.extend([apos[0], apos[0], apos[0], apos[1]])
+
+        limite_sql = " LIMIT %s" if limite is not None else ""
+        parametros_limite = [limite] if limite is not None else []
+
+        consulta = f"""
+            SELECT * FROM (
+                SELECT tipo, valor, data_hora, conta_destino_id, id
+                FROM transacoes
+                WHERE conta_id = %s{filtros}
+                ORDER BY data_hora DESC, id DESC{limite_sql}
+            ) AS enviadas
+            UNION ALL
+            SELECT * FROM (
+                SELECT tipo, valor, data_hora, conta_destino_id, id
+                FROM transacoes
+                WHERE conta_destino_id = %s AND (conta_id IS NULL OR conta_id <> %s){filtros}
+                ORDER BY data_hora DESC, id DESC{limite_sql}
+            ) AS recebidas
+            ORDER BY data_hora DESC, id DESC{limite_sql}
+            """
+        parametros = (
+            [id] + parametros_filtro + parametros_limite
+            + [id, id] + parametros_filtro + parametros_limite
+            + parametros_limite
+        )
+        return consulta, tuple(parametros)
+
+    @staticmethod
+    def paginar_extrato(linhas, limite):
+        # As linhas vêm com limite + 1: a sobra indica que há próxima página.
+        proximo_cursor = None
+        if len(linhas) > limite:
+            linhas = linhas[:limite]
+            ultima = linhas[-1]
+            proximo_cursor = ContaService.codificar_cursor_extrato(ultima[2], ultima[4])
+
+        return Linhas(CAMPOS_EXTRATO, linhas), proximo_cursor
+
+    @staticmethod
+    def pegar_dados_do_extrato(id, limite, apos=None, de=None, ate=None):
+        db = get_conexão_leitura(id)
         try:
             cursor = db.cursor()
-            cursor.execute("""
-            SELECT tipo, valor, data_hora, conta_destino_id
-            FROM transacoes
-            WHERE conta_id = %s OR conta_destino_id = %s
-            ORDER BY data_hora DESC
-            """, (id,id))
-            return cursor.fetchall()
-
-        except mysql.connector.Error as err:
+            consulta, parametros = ContaService.montar_consulta_extrato(
+                id, limite + 1, apos, ArquivoService.inicio_quente(id, de), ate)
+            cursor.execute(consulta, parametros)
+            linhas = ArquivoService.completar_extrato(id, cursor.fetchall(), limite + 1, apos, de, ate)
+
+            return ContaService.paginar_extrato(linhas, limite)
+
+        except ErroBanco as err:
             db.rollback()
             raise err
         finally:
             cursor.close()
 
     @staticmethod
-    def somas_totais(id):
-        db = get_conexão_db()
+    def iterar_extrato(id, apos=None, de=None, ate=None, limite=None):
+        # Percorre o histórico em páginas pela chave (data_hora, id), lendo cada
+        # página com um cursor não bufferizado; a memória usada fica constante.
+        db = get_conexão_leitura(id)
+        tamanho_pagina = Config.EXTRATO_TAMANHO_PAGINA_STREAM
+        restantes = limite
+        de_quente = ArquivoService.inicio_quente(id, de)
+        while restantes is None or restantes > 0:
+            pagina = tamanho_pagina if restantes is None else min(tamanho_pagina, restantes)
+            cursor = db.cursor(buffered=False)
+            try:
+                consulta, parametros = ContaService.montar_consulta_extrato(id, pagina, apos, de_quente, ate)
+                cursor.execute(consulta, parametros)
+                lidas = 0
+                while True:
+                    linhas = cursor.fetchmany(Config.EXTRATO_TAMANHO_BLOCO_STREAM)
+                    if not linhas:
+                        break
+                    for linha in linhas:
+                        lidas += 1
+                        apos = (linha[2], linha[4])
+                        yield linha
+            except ErroBanco as err:
+                db.rollback()
+                raise err
+            finally:
+                cursor.close()
+
+            if restantes is not None:
+                restantes -= lidas
+            if lidas < pagina:
+                break
+
+        # Acabaram as linhas do banco: o resto do histórico vem dos segmentos arquivados.
+        if de_quente != de and (restantes is None or restantes > 0):
+            arquivadas = ArquivoService.iterar_extrato(id, apos, de, ate)
+            yield from (arquivadas if restantes is None else islice(arquivadas, restantes))
+
+    @staticmethod
+    def versao_extrato(id):
+        # Uma leitura por chave primária, sempre no banco: é o que decide se o
+        # cliente pode reaproveitar o extrato que já tem (304). Vai para a mesma
+        # réplica das linhas e dos totais, para que a ETag descreva o corpo enviado.
+        db = get_conexão_leitura(id)
         try:
-            cursor = db.cursor()
-            cursor.execute("""
-            SELECT
-                SUM(CASE WHEN tipo = 'deposito' THEN valor ELSE 0 END) AS total_depositos,
-                SUM(CASE WHEN tipo = 'saque' THEN valor ELSE 0 END) AS total_saques,
-                SUM(CASE WHEN tipo = 'transferencia' AND conta_id = %s THEN valor ELSE 0 END) AS total_transferencias_enviadas,
-                SUM(CASE WHEN tipo = 'transferencia' AND conta_destino_id = %s THEN valor ELSE 0 END) AS total_transferencias_recebidas
-                FROM transacoes
-                WHERE conta_id = %s OR conta_destino_id = %s
-                """, (id,id,id,id))
-            return cursor.fetchone()
-        except mysql.connector.Error as err:
+            cursor = db.cursor(dictionary=True)
+            cursor.execute(CONSULTA_VERSAO_EXTRATO, (id,))
+            return FatiasService.somar_fatias(cursor.fetchone())
+        except ErroBanco as err:
             db.rollback()
             raise err
         finally:
             cursor.close()
 
+    @staticmethod
+    def etag_extrato(versao, args):
+        # Parâmetros diferentes (página, período, formato) geram corpos diferentes.
+        parametros = "&".join(f"{chave}={valor}" for chave, valor in sorted(args.items(multi=True)))
+        bruto = (f"{versao['id']}|{versao['ultima_transacao_id'] or 0}|{versao['quantidade_transacoes'] or 0}"
+                 f"|{versao['saldo']!r}|{parametros}")
+        return hashlib.sha256(bruto.encode("utf-8")).hexdigest()[:32]
+
+    @staticmethod
+    def somas_totais(id):
+        return TotaisService.buscar_totais(id)
+
     @staticmethod
     def retorno_extrato(conta, historico, totais, id):
         try:
@@ -67,14 +252,18 @@ class ContaService():
         
     @staticmethod
     def executar_deposito(deposito, id):
-        db = get_conexão_db()
+        db = get_conexão_db(id)
         try:
             cursor = db.cursor()
-            cursor.execute(
-            "UPDATE contas SET saldo = saldo + %s WHERE id = %s",
-            (deposito, id)
-        )
-        except mysql.connector.Error as err:
+            if FatiasService.esta_fatiada(id):
+                FatiasService.creditar(cursor, id, deposito)
+            else:
+                cursor.execute(
+                "UPDATE contas SET saldo = saldo + %s WHERE id = %s",
+                (deposito, id)
+            )
+            cache_contas.invalidar_apos_commit(id)
+        except ErroBanco as err:
             db.rollback()
             raise err
         finally:
@@ -82,29 +271,45 @@ class ContaService():
         
     @staticmethod
     def registrar_deposito(deposito, id):
-        db = get_conexão_db()
+        db = get_conexão_db(id)
         try:
             cursor = db.cursor()
             cursor.execute(
             "INSERT INTO transacoes (tipo,valor,conta_id) VALUES (%s,%s,%s)",
             ("deposito", deposito, id)
             )
-        except mysql.connector.Error as err:
+            eventos.registrar_apos_commit(cursor.lastrowid, id)
+            TotaisService.registrar_transacao(cursor, "deposito", deposito, id)
+        except ErroBanco as err:
             db.rollback()
             raise err
         finally:
             cursor.close()
 
+    @staticmethod
+    def enfileirar_operacao(tipo, valor, id):
+        # Modo group commit: a operação entra na fila e é aplicada junto com as
+        # demais do mesmo intervalo, em uma única transação.
+        return get_group_commit(shards.shard_da_conta(id)).submeter(tipo, valor, id, Config.GROUP_COMMIT_TIMEOUT_SEGUNDOS)
+
     @staticmethod
     def executar_saque(saque, id):
-        db = get_conexão_db()
+        db = get_conexão_db(id)
         try:
             cursor = db.cursor()
-            cursor.execute(
-            "UPDATE contas SET saldo = saldo - %s WHERE id = %s ",
-            (saque, id)
-        )
-        except mysql.connector.Error as err:
+            # O saldo é conferido pelo próprio UPDATE: a leitura feita antes pela rota
+            # pode vir do cache de contas e não serve para autorizar o saque.
+            if FatiasService.esta_fatiada(id):
+                sacou = FatiasService.debitar(cursor, id, saque)
+            else:
+                cursor.execute(
+                "UPDATE contas SET saldo = saldo - %s WHERE id = %s AND saldo >= %s",
+                (saque, id, saque)
+            )
+                sacou = cursor.rowcount == 1
+            cache_contas.invalidar_apos_commit(id)
+            return sacou
+        except ErroBanco as err:
             db.rollback()
             raise err
         finally:
@@ -112,14 +317,16 @@ class ContaService():
         
     @staticmethod
     def registrar_saque(saque, id):
-        db = get_conexão_db()
+        db = get_conexão_db(id)
         try:
             cursor = db.cursor()
             cursor.execute(
             "INSERT INTO transacoes (tipo, valor, conta_id) VALUES (%s,%s,%s)",
             ("saque", saque, id)
             )
-        except mysql.connector.Error as err:
+            eventos.registrar_apos_commit(cursor.lastrowid, id)
+            TotaisService.registrar_transacao(cursor, "saque", saque, id)
+        except ErroBanco as err:
             db.rollback()
             raise err
         finally:
@@ -127,16 +334,8 @@ class ContaService():
 
     @staticmethod
     def verificar_saldo_conta(id):
-        db = get_conexão_db()
-        try:
-            cursor = db.cursor(dictionary=True)
-            cursor.execute("SELECT saldo FROM contas WHERE id = %s", (id,))
-            return cursor.fetchone()
-        except mysql.connector.Error as err:
-            db.rollback()
-            raise err
-        finally:
-            cursor.close()
+        # Consultivo: serve do cache de contas, assim como verificar_existencia_conta.
+        return AuthService.verificar_existencia_conta(id)
 
     @staticmethod
     def validar_numero_positivo(valor, nome_do_campo):
@@ -149,8 +348,8 @@ class ContaService():
             raise Exception(f"O campo '{nome_do_campo}' precisa ser um número positivo.")
         
     @staticmethod
-    def iniciar_transacao():
-        db = get_conexão_db()
+    def iniciar_transacao(conta_id=None):
+        db = get_conexão_db(conta_id)
         try:
             cursor = db.cursor()
         
@@ -158,7 +357,7 @@ class ContaService():
                 db.rollback()
         
             db.start_transaction()
-        except mysql.connector.Error as err:
+        except ErroBanco as err:
             db.rollback()
             raise err
         finally:
@@ -166,45 +365,254 @@ class ContaService():
 
     @staticmethod
     def realizar_transferencias(valor, conta_origem, conta_destino):
-        db = get_conexão_db()
+        db = get_conexão_db(conta_origem)
         try:    
             cursor = db.cursor()
-            cursor.execute(
-            "UPDATE contas SET saldo = saldo - %s WHERE id = %s",
-            (valor,conta_origem))
+            if FatiasService.esta_fatiada(conta_origem) or FatiasService.esta_fatiada(conta_destino):
+                cache_contas.invalidar_apos_commit(conta_origem, conta_destino)
+                return ContaService.transferir_com_fatias(cursor, valor, conta_origem, conta_destino)
 
+            # Um único UPDATE debita e credita: o InnoDB percorre a chave primária
+            # em ordem crescente, então as duas linhas são sempre travadas na mesma
+            # ordem, e o débito só acontece se houver saldo.
             cursor.execute(
-            "UPDATE contas SET saldo = saldo + %s WHERE id = %s",
-            (valor,conta_destino))
-        except mysql.connector.Error as err:
+            """
+            UPDATE contas
+            SET saldo = CASE WHEN id = %s THEN saldo - %s ELSE saldo + %s END
+            WHERE id IN (%s, %s) AND (id <> %s OR saldo >= %s)
+            ORDER BY id
+            """,
+            (conta_origem, valor, valor, conta_origem, conta_destino, conta_origem, valor))
+            cache_contas.invalidar_apos_commit(conta_origem, conta_destino)
+            return cursor.rowcount == 2
+        except ErroBanco as err:
             db.rollback()
             raise err
         finally:
             cursor.close()
 
+    @staticmethod
+    def transferir_com_fatias(cursor, valor, conta_origem, conta_destino):
+        # Débito e crédito em passos separados; se o segundo falhar, quem chamou
+        # desfaz a transação inteira. As duas contas são travadas antes, em ordem
+        # crescente de id, para que transferências opostas não se cruzem.
+        cursor.execute(
+            "SELECT id FROM contas WHERE id IN (%s, %s) ORDER BY id FOR UPDATE",
+            (conta_origem, conta_destino))
+        cursor.fetchall()
+        if FatiasService.esta_fatiada(conta_origem):
+            debitou = FatiasService.debitar(cursor, conta_origem, valor)
+        else:
+            cursor.execute(
+                "UPDATE contas SET saldo = saldo - %s WHERE id = %s AND saldo >= %s",
+                (valor, conta_origem, valor))
+            debitou = cursor.rowcount == 1
+        if not debitou:
+            return False
+
+        if FatiasService.esta_fatiada(conta_destino):
+            return FatiasService.creditar(cursor, conta_destino, valor)
+        cursor.execute("UPDATE contas SET saldo = saldo + %s WHERE id = %s", (valor, conta_destino))
+        return cursor.rowcount == 1
+
     @staticmethod
     def registrar_transferencias(valor, conta_origem, conta_destino):
-        db = get_conexão_db()
+        db = get_conexão_db(conta_origem)
         try:    
             cursor = db.cursor()
 
             cursor.execute(
             "INSERT INTO transacoes (tipo, valor, conta_id, conta_destino_id) VALUES (%s,%s,%s,%s)",
             ("transferencia", -valor, conta_origem, conta_destino)) 
+            eventos.registrar_apos_commit(cursor.lastrowid, conta_origem, conta_destino)
+            TotaisService.registrar_transacao(cursor, "transferencia", -valor, conta_origem, conta_destino)
+
+        except ErroBanco as err:
+            db.rollback()
+            raise err
+        finally:
+            cursor.close()
 
-        except mysql.connector.Error as err:
+    @staticmethod
+    def diagnosticar_falha_transferencia(conta_origem, conta_destino):
+        db = get_conexão_db(conta_origem)
+        try:
+            cursor = db.cursor(dictionary=True)
+            cursor.execute("SELECT id, saldo FROM contas WHERE id IN (%s, %s)", (conta_origem, conta_destino))
+            contas = {conta["id"]: conta for conta in cursor.fetchall()}
+            if int(conta_origem) not in contas:
+                return TRANSFERENCIA_ORIGEM_INEXISTENTE
+            if int(conta_destino) not in contas:
+                return TRANSFERENCIA_DESTINO_INEXISTENTE
+            return TRANSFERENCIA_SALDO_INSUFICIENTE
+        except ErroBanco as err:
             db.rollback()
             raise err
         finally:
             cursor.close()
 
+    @staticmethod
+    def executar_transferencia(valor, conta_origem, conta_destino):
+        # Contas no mesmo shard (ou sem shards) continuam numa única transação.
+        if not shards.mesmo_shard(conta_origem, conta_destino):
+            return TransferenciasService.transferir(valor, int(conta_origem), int(conta_destino))
+
+        db = get_conexão_db(conta_origem)
+        for tentativa in range(TRANSFERENCIA_MAX_TENTATIVAS):
+            try:
+                ContaService.iniciar_transacao(conta_origem)
+
+                if not ContaService.realizar_transferencias(valor, conta_origem, conta_destino):
+                    db.rollback()
+                    return ContaService.diagnosticar_falha_transferencia(conta_origem, conta_destino)
+
+                ContaService.registrar_transferencias(valor, conta_origem, conta_destino)
+                db.commit()
+                cache_contas.aplicar_pendentes()
+                eventos.publicar_pendentes()
+                return TRANSFERENCIA_OK
+            except ErroBanco as err:
+                if getattr(err, "errno", None) not in ERROS_REPETIVEIS or tentativa == TRANSFERENCIA_MAX_TENTATIVAS - 1:
+                    raise err
+
+    @staticmethod
+    def validar_lote_transferencias(itens):
+        validos = []
+        resultados = [None] * len(itens)
+        for indice, item in enumerate(itens):
+            try:
+                if not isinstance(item, dict):
+                    raise Exception("Cada transferência precisa ser um objeto.")
+                conta_origem = item.get("conta_origem")
+                conta_destino = item.get("conta_destino")
+                valor = item.get("valor")
+                if not conta_origem or not conta_destino or not valor:
+                    raise Exception("É necessário preencher todos os campos.")
+                try:
+                    conta_origem = int(conta_origem)
+                    conta_destino = int(conta_destino)
+                except (TypeError, ValueError):
+                    raise Exception("As contas precisam ser identificadores numéricos.")
+                if conta_origem == conta_destino:
+                    raise Exception("A conta de origem e a de destino precisam ser diferentes.")
+                valor = ContaService.validar_numero_positivo(valor, "valor")
+                validos.append((indice, conta_origem, conta_destino, valor))
+            except Exception as err:
+                resultados[indice] = {"indice": indice, "status": "erro", "erro": str(err)}
+        return validos, resultados
+
+    @staticmethod
+    def aplicar_bloco_transferencias(bloco, resultados):
+        # Todas as contas do bloco estão no mesmo shard.
+        db = get_conexão_db(bloco[0][1])
+        try:
+            cursor = db.cursor()
+            ContaService.iniciar_transacao(bloco[0][1])
+
+            # Trava todas as contas do bloco de uma vez, em ordem crescente de id,
+            # para que lotes concorrentes nunca entrem em deadlock entre si.
+            ids = sorted({conta for _, origem, destino, _ in bloco for conta in (origem, destino)})
+            saldos = FatiasService.travar_saldos(cursor, ids)
+
+            deltas = {}
+            aceitas = []
+            for indice, origem, destino, valor in bloco:
+                if origem not in saldos:
+                    resultados[indice] = {"indice": indice, "status": "erro", "erro": ERROS_LOTE[TRANSFERENCIA_ORIGEM_INEXISTENTE]}
+                    continue
+                if destino not in saldos:
+                    resultados[indice] = {"indice": indice, "status": "erro", "erro": ERROS_LOTE[TRANSFERENCIA_DESTINO_INEXISTENTE]}
+                    continue
+                if valor > saldos[origem]:
+                    resultados[indice] = {"indice": indice, "status": "erro", "erro": ERROS_LOTE[TRANSFERENCIA_SALDO_INSUFICIENTE]}
+                    continue
+
+                saldos[origem] -= valor
+                saldos[destino] += valor
+                deltas[origem] = deltas.get(origem, 0) - valor
+                deltas[destino] = deltas.get(destino, 0) + valor
+                aceitas.append((indice, origem, destino, valor))
+
+            if aceitas:
+                cursor.executemany(
+                    "UPDATE contas SET saldo = saldo + %s WHERE id = %s",
+                    [(delta, id_conta) for id_conta, delta in sorted(deltas.items()) if delta])
+                ids = TotaisService.inserir_transacoes(
+                    cursor, [("transferencia", -valor, origem, destino) for _, origem, destino, valor in aceitas])
+
+                totais = {}
+                for id_transacao, (_, origem, destino, valor) in zip(ids, aceitas):
+                    TotaisService.somar_totais(totais, TotaisService.totais_de_transacao(
+                        "transferencia", -valor, origem, destino, id_transacao))
+                TotaisService.acumular_totais(cursor, totais)
+
+            db.commit()
+            cache_contas.invalidar(*deltas)
+            if aceitas:
+                eventos.publicar_sem_falhar(
+                    [(id_transacao, origem, destino) for id_transacao, (_, origem, destino, _) in zip(ids, aceitas)], db)
+            for indice, _, _, _ in aceitas:
+                resultados[indice] = {"indice": indice, "status": "ok"}
+        except ErroBanco as err:
+            db.rollback()
+            for indice, _, _, _ in bloco:
+                resultados[indice] = {"indice": indice, "status": "erro", "erro": f"Erro no banco de dados: {err}"}
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def executar_transferencias_em_lote(itens):
+        validos, resultados = ContaService.validar_lote_transferencias(itens)
+
+        # Com shards, cada bloco fica dentro de um shard; as transferências entre
+        # shards seguem uma a uma pelo protocolo em duas fases.
+        por_shard = {}
+        entre_shards = []
+        for item in validos:
+            _, origem, destino, _ = item
+            if shards.mesmo_shard(origem, destino):
+                por_shard.setdefault(shards.shard_da_conta(origem), []).append(item)
+            else:
+                entre_shards.append(item)
+
+        tamanho = Config.TRANSFERENCIA_LOTE_TAMANHO_BLOCO
+        for itens_do_shard in por_shard.values():
+            for inicio in range(0, len(itens_do_shard), tamanho):
+                ContaService.aplicar_bloco_transferencias(itens_do_shard[inicio:inicio + tamanho], resultados)
+
+        for indice, origem, destino, valor in entre_shards:
+            try:
+                resultado = TransferenciasService.transferir(valor, origem, destino)
+            except ErroBanco as err:
+                resultados[indice] = {"indice": indice, "status": "erro", "erro": f"Erro no banco de dados: {err}"}
+                continue
+            if resultado == TRANSFERENCIA_OK:
+                resultados[indice] = {"indice": indice, "status": "ok"}
+            else:
+                resultados[indice] = {"indice": indice, "status": "erro", "erro": ERROS_LOTE[resultado]}
+
+        return resultados
+
     @staticmethod
     def deletar_conta(id):
-        db = get_conexão_db()
+        db = get_conexão_db(id)
         try:
             cursor = db.cursor()
+            # Com transacoes particionada não há chave estrangeira para barrar a exclusão;
+            # uma transferência entre shards ainda em preparo também conta.
+            cursor.execute(
+                """
+                SELECT 1 FROM transacoes WHERE conta_id = %s
+                UNION ALL SELECT 1 FROM transacoes WHERE conta_destino_id = %s
+                UNION ALL SELECT 1 FROM transferencias_pendentes WHERE conta_id = %s AND estado = 'preparada'
+                LIMIT 1
+                """,
+                (id, id, id))
+            if cursor.fetchone() is not None or ArquivoService.conta_tem_transacoes(id):
+                raise Exception("Conta possui transações e não pode ser excluída.")
             cursor.execute("DELETE FROM contas WHERE id = %s",(id,))
-        except mysql.connector.Error as err:
+            cache_contas.invalidar_apos_commit(id)
+        except ErroBanco as err:
             db.rollback()
             raise err
         finally:
@@ -217,14 +625,15 @@ class ContaService():
         
     @staticmethod
     def mudar_status(novo_status, id):
-        db = get_conexão_db()
+        db = get_conexão_db(id)
         try:
             cursor = db.cursor()
             cursor.execute(
                 "UPDATE contas SET status = %s WHERE id = %s",
                 (novo_status, id)
             )
-        except mysql.connector.Error as err:
+            cache_contas.invalidar_apos_commit(id)
+        except ErroBanco as err:
             db.rollback()
             raise err
         finally:
@@ -0,0 +1,199 @@
+import logging
+import os
+import random
+import threading
+import time
+
+from app.config import Config
+from app.database import executar_em_transacao, ErroBanco
+from app.services.totais_service import TotaisService
+from app import cache_contas, metricas, shards
+
+logger = logging.getLogger("app.fatias")
+
+# Parte do saldo que está nas fatias; o saldo visível é contas.saldo mais esta soma.
+SUBCONSULTA_SALDO_FATIAS = "(SELECT SUM(f.saldo) FROM fatias_saldo f WHERE f.conta_id = c.id)"
+# O mesmo para os totais ainda não consolidados em totais_conta (ver TotaisService.acumular_totais).
+SUBCONSULTAS_TOTAIS_FATIAS = (
+    "(SELECT SUM(ft.quantidade_transacoes) FROM fatias_totais ft WHERE ft.conta_id = c.id) AS quantidade_fatias, "
+    "(SELECT MAX(ft.ultima_transacao_id) FROM fatias_totais ft WHERE ft.conta_id = c.id) AS ultima_transacao_fatias"
+)
+
+
+class FatiasService():
+    # Contas "quentes" (SALDO_FATIADO_CONTAS) têm parte do saldo espalhada em
+    # SALDO_FATIADO_FATIAS linhas de fatias_saldo. Créditos vão para uma fatia
+    # sorteada, em vez de todos esperarem pelo lock da mesma linha em contas.
+    @staticmethod
+    def esta_fatiada(id):
+        return int(id) in Config.SALDO_FATIADO_CONTAS
+
+    @staticmethod
+    def saldo_visivel(saldo, saldo_fatias):
+        # Somado aqui, e não no SQL: no MySQL, FLOAT + DOUBLE expõe o arredondamento
+        # da coluna (0.1 viraria 0.10000000149011612) mesmo em contas sem fatias.
+        return saldo + saldo_fatias if saldo_fatias else saldo
+
+    @staticmethod
+    def somar_fatias(conta):
+        if conta is not None:
+            conta["saldo"] = FatiasService.saldo_visivel(conta["saldo"], conta.pop("saldo_fatias"))
+            if "quantidade_fatias" in conta:
+                quantidade = conta.pop("quantidade_fatias")
+                ultima = conta.pop("ultima_transacao_fatias")
+                if quantidade:
+                    conta["quantidade_transacoes"] = (conta["quantidade_transacoes"] or 0) + int(quantidade)
+                    conta["ultima_transacao_id"] = max(conta["ultima_transacao_id"] or 0, ultima)
+        return conta
+
+    @staticmethod
+    def saldos_em_fatias(cursor):
+        cursor.execute("SELECT conta_id, SUM(saldo) FROM fatias_saldo GROUP BY conta_id HAVING SUM(saldo) <> 0")
+        return dict(cursor.fetchall())
+
+    @staticmethod
+    def criar_fatias(cursor, conta_id, quantidade):
+        fatias = [(conta_id, fatia) for fatia in range(quantidade)]
+        cursor.executemany(
+            "INSERT INTO fatias_saldo (conta_id, fatia, saldo) VALUES (%s, %s, 0) ON DUPLICATE KEY UPDATE saldo = saldo",
+            fatias)
+        cursor.executemany(
+            "INSERT INTO fatias_totais (conta_id, fatia) VALUES (%s, %s) "
+            "ON DUPLICATE KEY UPDATE quantidade_transacoes = quantidade_transacoes",
+            fatias)
+
+    @staticmethod
+    def creditar(cursor, conta_id, valor):
+        # Lock compartilhado na conta antes da fatia: créditos não esperam uns pelos
+        # outros, mas esperam quem trava a conta inteira (débitos, consolidação, lotes
+        # e a reconstrução dos totais), sempre na ordem conta -> fatias.
+        cursor.execute("SELECT id FROM contas WHERE id = %s LOCK IN SHARE MODE", (conta_id,))
+        if cursor.fetchone() is None:
+            return False
+        fatia = random.randrange(Config.SALDO_FATIADO_FATIAS)
+        cursor.execute(
+            "UPDATE fatias_saldo SET saldo = saldo + %s WHERE conta_id = %s AND fatia = %s",
+            (valor, conta_id, fatia))
+        if cursor.rowcount == 1:
+            return True
+        # Fatias ainda não criadas. Creditar a linha da conta exigiria trocar o lock
+        # compartilhado por um exclusivo, o que dá deadlock entre dois créditos.
+        FatiasService.criar_fatias(cursor, conta_id, Config.SALDO_FATIADO_FATIAS)
+        cursor.execute(
+            "UPDATE fatias_saldo SET saldo = saldo + %s WHERE conta_id = %s AND fatia = %s",
+            (valor, conta_id, fatia))
+        return cursor.rowcount == 1
+
+    @staticmethod
+    def debitar(cursor, conta_id, valor):
+        # A conta é travada antes de qualquer fatia, a mesma ordem de consolidar e travar_saldos.
+        cursor.execute("SELECT id FROM contas WHERE id = %s FOR UPDATE", (conta_id,))
+        if cursor.fetchone() is None:
+            return False
+        cursor.execute(
+            "UPDATE fatias_saldo SET saldo = saldo - %s WHERE conta_id = %s AND fatia = %s AND saldo >= %s",
+            (valor, conta_id, random.randrange(Config.SALDO_FATIADO_FATIAS), valor))
+        if cursor.rowcount == 1:
+            return True
+        cursor.execute("UPDATE contas SET saldo = saldo - %s WHERE id = %s AND saldo >= %s", (valor, conta_id, valor))
+        if cursor.rowcount == 1:
+            return True
+
+        # Nem a fatia sorteada nem a linha da conta cobrem o débito sozinhas:
+        # junta todas as fatias na conta e confere de novo contra o total.
+        metricas.somar("banco_saldo_fatiado_varreduras_total")
+        FatiasService.consolidar(cursor, conta_id)
+        cursor.execute("UPDATE contas SET saldo = saldo - %s WHERE id = %s AND saldo >= %s", (valor, conta_id, valor))
+        return cursor.rowcount == 1
+
+    @staticmethod
+    def consolidar(cursor, conta_id):
+        # Trava a conta antes das fatias, a mesma ordem usada pelos lotes.
+        cursor.execute("SELECT id FROM contas WHERE id = %s FOR UPDATE", (conta_id,))
+        if cursor.fetchone() is None:
+            return False
+        cursor.execute("SELECT saldo FROM fatias_saldo WHERE conta_id = %s ORDER BY fatia FOR UPDATE", (conta_id,))
+        soma = sum(saldo for saldo, in cursor.fetchall())
+        if soma:
+            cursor.execute("UPDATE fatias_saldo SET saldo = 0 WHERE conta_id = %s", (conta_id,))
+            cursor.execute("UPDATE contas SET saldo = saldo + %s WHERE id = %s", (soma, conta_id))
+        # Os totais vêm depois do saldo: fatias_saldo antes de fatias_totais, como nos créditos.
+        transacoes = TotaisService.consolidar_fatias(cursor, conta_id)
+        return bool(soma or transacoes)
+
+    @staticmethod
+    def travar_saldos(cursor, ids):
+        # Usado pelos caminhos em lote, que validam vários débitos contra saldos lidos
+        # uma vez só: as fatias também ficam travadas até o commit.
+        marcadores = ", ".join(["%s"] * len(ids))
+        cursor.execute(
+            f"SELECT id, saldo FROM contas WHERE id IN ({marcadores}) ORDER BY id FOR UPDATE",
+            tuple(ids))
+        saldos = {id_conta: saldo for id_conta, saldo in cursor.fetchall()}
+        cursor.execute(
+            f"SELECT conta_id, saldo FROM fatias_saldo WHERE conta_id IN ({marcadores}) ORDER BY conta_id, fatia FOR UPDATE",
+            tuple(ids))
+        for id_conta, saldo in cursor.fetchall():
+            saldos[id_conta] += saldo
+        return saldos
+
+    @staticmethod
+    def preparar():
+        criadas = 0
+        for conta_id in sorted(Config.SALDO_FATIADO_CONTAS):
+            try:
+                executar_em_transacao(FatiasService.criar_fatias, conta_id, Config.SALDO_FATIADO_FATIAS,
+                                      shard=shards.shard_da_conta(conta_id))
+                criadas += 1
+            except ErroBanco as err:
+                logger.warning("Não foi possível criar as fatias da conta %s: %s", conta_id, err)
+        return criadas
+
+    @staticmethod
+    def consolidar_todas(conta_id=None):
+        if conta_id is None:
+            contas = sorted({conta for shard in shards.indices()
+                             for consulta in (FatiasService.saldos_em_fatias, TotaisService.contas_com_totais_em_fatias)
+                             for conta in executar_em_transacao(consulta, shard=shard)})
+        else:
+            contas = [conta_id]
+
+        # Uma transação curta por conta: os créditos das outras contas não esperam.
+        consolidadas = 0
+        for id_conta in contas:
+            if executar_em_transacao(FatiasService.consolidar, id_conta, shard=shards.shard_da_conta(id_conta)):
+                cache_contas.invalidar(id_conta)
+                consolidadas += 1
+        metricas.somar("banco_saldo_fatiado_consolidacoes_total", (), consolidadas)
+        return consolidadas
+
+
+class Consolidador:
+    def __init__(self, intervalo):
+        self.intervalo = intervalo
+        self.thread = threading.Thread(target=self.executar, name="consolidador-fatias", daemon=True)
+        self.thread.start()
+
+    def executar(self):
+        while True:
+            time.sleep(self.intervalo)
+            try:
+                FatiasService.consolidar_todas()
+            except Exception:
+                logger.exception("Falha ao consolidar as fatias de saldo")
+
+
+_instancia = None
+_instancia_pid = None
+_lock = threading.Lock()
+
+
+def get_consolidador():
+    # Uma thread por processo; após um fork a instância do pai é ignorada.
+    global _instancia, _instancia_pid
+    if _instancia is None or _instancia_pid != os.getpid():
+        with _lock:
+            if _instancia is None or _instancia_pid != os.getpid():
+                _instancia = Consolidador(Config.SALDO_FATIADO_CONSOLIDAR_SEGUNDOS)
+                _instancia_pid = os.getpid()
+    return _instancia
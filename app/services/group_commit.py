@@ -0,0 +1,181 @@
+import os
+import queue
+import threading
+import time
+
+from app.config import Config
+from app.database import get_pool, ErroBanco
+from app.services.totais_service import TotaisService
+from app.services.fatias_service import FatiasService
+from app import cache_contas, eventos, metricas
+
+OPERACAO_OK = "ok"
+OPERACAO_CONTA_INEXISTENTE = "conta_inexistente"
+OPERACAO_SALDO_INSUFICIENTE = "saldo_insuficiente"
+# Retirada da fila antes de entrar em um lote: não foi aplicada e pode ser repetida.
+OPERACAO_EXPIRADA = "expirada"
+
+BUCKETS_LOTE = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class Pedido:
+    def __init__(self, tipo, valor, conta_id):
+        self.tipo = tipo
+        self.valor = valor
+        self.conta_id = int(conta_id)
+        self.evento = threading.Event()
+        self.resultado = None
+        self.erro = None
+        # Protegidos pelo lock do GroupCommit.
+        self.coletado = False
+        self.cancelado = False
+
+    def concluir(self, resultado=None, erro=None):
+        self.resultado = resultado
+        self.erro = erro
+        self.evento.set()
+
+
+class GroupCommit:
+    def __init__(self, janela_ms, tamanho_max, shard=None):
+        self.janela = janela_ms / 1000
+        self.tamanho_max = tamanho_max
+        self.shard = shard
+        self.fila = queue.Queue()
+        self.lock = threading.Lock()
+        nome = "group-commit" if shard is None else f"group-commit-{shard}"
+        self.thread = threading.Thread(target=self.executar, name=nome, daemon=True)
+        self.thread.start()
+
+    def submeter(self, tipo, valor, conta_id, timeout):
+        pedido = Pedido(tipo, valor, conta_id)
+        self.fila.put(pedido)
+        if not pedido.evento.wait(timeout):
+            with self.lock:
+                if not pedido.coletado:
+                    pedido.cancelado = True
+                    metricas.somar("banco_group_commit_expiradas_total")
+                    return OPERACAO_EXPIRADA
+            # Já está em um lote, que pode ser commitado a qualquer momento: desistir
+            # agora faria o cliente repetir uma operação aplicada.
+            pedido.evento.wait()
+        if pedido.erro is not None:
+            raise pedido.erro
+        return pedido.resultado
+
+    def reservar(self, pedido, lote):
+        # Sob o lock: ou o pedido entra no lote, ou quem o submeteu já desistiu dele.
+        with self.lock:
+            if pedido.cancelado:
+                return
+            pedido.coletado = True
+        lote.append(pedido)
+
+    def coletar_lote(self):
+        lote = []
+        while not lote:
+            self.reservar(self.fila.get(), lote)
+        limite = time.monotonic() + self.janela
+        while len(lote) < self.tamanho_max:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                self.reservar(self.fila.get(timeout=restante), lote)
+            except queue.Empty:
+                break
+        return lote
+
+    def executar(self):
+        while True:
+            lote = self.coletar_lote()
+            try:
+                self.aplicar(lote)
+            except Exception as err:
+                for pedido in lote:
+                    if not pedido.evento.is_set():
+                        pedido.concluir(erro=err)
+
+    def aplicar(self, lote):
+        metricas.observar("banco_group_commit_tamanho_lote", (), len(lote), BUCKETS_LOTE)
+        pool = get_pool(self.shard)
+        db = pool.obter()
+        descartar = False
+        try:
+            cursor = db.cursor()
+            try:
+                if db.in_transaction:
+                    db.rollback()
+                db.start_transaction()
+
+                ids = sorted({pedido.conta_id for pedido in lote})
+                saldos = FatiasService.travar_saldos(cursor, ids)
+
+                deltas = {}
+                aceitos = []
+                resultados = {}
+                for pedido in lote:
+                    if pedido.conta_id not in saldos:
+                        resultados[pedido] = OPERACAO_CONTA_INEXISTENTE
+                        continue
+                    variacao = pedido.valor if pedido.tipo == "deposito" else -pedido.valor
+                    if saldos[pedido.conta_id] + variacao < 0:
+                        resultados[pedido] = OPERACAO_SALDO_INSUFICIENTE
+                        continue
+                    saldos[pedido.conta_id] += variacao
+                    deltas[pedido.conta_id] = deltas.get(pedido.conta_id, 0) + variacao
+                    aceitos.append(pedido)
+                    resultados[pedido] = OPERACAO_OK
+
+                if aceitos:
+                    cursor.executemany(
+                        "UPDATE contas SET saldo = saldo + %s WHERE id = %s",
+                        [(delta, id_conta) for id_conta, delta in sorted(deltas.items()) if delta])
+                    ids = TotaisService.inserir_transacoes(
+                        cursor, [(pedido.tipo, pedido.valor, pedido.conta_id, None) for pedido in aceitos])
+
+                    totais = {}
+                    for id_transacao, pedido in zip(ids, aceitos):
+                        TotaisService.somar_totais(totais, TotaisService.totais_de_transacao(
+                            pedido.tipo, pedido.valor, pedido.conta_id, None, id_transacao))
+                    TotaisService.acumular_totais(cursor, totais)
+
+                # Os chamadores só recebem a resposta depois do commit durável.
+                db.commit()
+                cache_contas.invalidar(*deltas)
+                if aceitos:
+                    eventos.publicar_sem_falhar(
+                        [(id_transacao, pedido.conta_id, None) for id_transacao, pedido in zip(ids, aceitos)], db)
+            except ErroBanco:
+                descartar = True
+                try:
+                    db.rollback()
+                except ErroBanco:
+                    pass
+                raise
+            finally:
+                cursor.close()
+        finally:
+            pool.devolver(db, descartar=descartar)
+
+        for pedido, resultado in resultados.items():
+            pedido.concluir(resultado)
+
+
+_instancias = {}
+_instancias_pid = None
+_lock = threading.Lock()
+
+
+def get_group_commit(shard=None):
+    # Uma fila e uma thread por processo (e por shard, com DB_SHARDS); após um
+    # fork as instâncias do pai são ignoradas.
+    global _instancias, _instancias_pid
+    if _instancias_pid != os.getpid() or shard not in _instancias:
+        with _lock:
+            if _instancias_pid != os.getpid():
+                _instancias = {}
+                _instancias_pid = os.getpid()
+            if shard not in _instancias:
+                _instancias[shard] = GroupCommit(Config.GROUP_COMMIT_JANELA_MS, Config.GROUP_COMMIT_TAMANHO_MAX, shard)
+    return _instancias[shard]
@@ -0,0 +1,168 @@
+import logging
+from datetime import date, datetime
+
+from app.config import Config
+from app.backends import get_backend
+
+logger = logging.getLogger("app.particoes")
+
+PARTICAO_FUTURO = "pfuturo"
+MODOS_EXPIRACAO = ("apagar", "desanexar")
+
+
+def inicio_do_mes(dia):
+    return date(dia.year, dia.month, 1)
+
+
+def somar_meses(mes, meses):
+    total = mes.year * 12 + mes.month - 1 + meses
+    return date(total // 12, total % 12 + 1, 1)
+
+
+def nome_particao(mes):
+    return f"p{mes:%Y%m}"
+
+
+def nome_tabela_desanexada(mes):
+    return f"transacoes_arquivo_{mes:%Y%m}"
+
+
+def mes_da_particao(nome):
+    return datetime.strptime(nome[1:], "%Y%m").date()
+
+
+def definir_particoes(meses):
+    # Uma partição por mês, limitada pelo primeiro instante do mês seguinte. A
+    # pfuturo recebe o que chegar além da última partição criada.
+    definicoes = [
+        f"PARTITION {nome_particao(mes)} VALUES LESS THAN (UNIX_TIMESTAMP('{somar_meses(mes, 1):%Y-%m-%d} 00:00:00'))"
+        for mes in meses
+    ]
+    definicoes.append(f"PARTITION {PARTICAO_FUTURO} VALUES LESS THAN MAXVALUE")
+    return ", ".join(definicoes)
+
+
+def meses_entre(primeiro, ultimo):
+    meses = []
+    mes = primeiro
+    while mes <= ultimo:
+        meses.append(mes)
+        mes = somar_meses(mes, 1)
+    return meses
+
+
+class ParticoesService():
+    # transacoes é particionada por mês de data_hora (migração 0002 do MySQL). O
+    # job 'particoes manter' cria os meses seguintes antes de serem usados e tira
+    # os meses vencidos com DROP/EXCHANGE PARTITION, sem DELETE linha a linha.
+    @staticmethod
+    def listar_particoes(cursor):
+        cursor.execute("""
+            SELECT PARTITION_NAME, TABLE_ROWS
+            FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'transacoes' AND PARTITION_NAME IS NOT NULL
+            ORDER BY PARTITION_ORDINAL_POSITION
+        """)
+        return cursor.fetchall()
+
+    @staticmethod
+    def esta_particionada(cursor):
+        return bool(ParticoesService.listar_particoes(cursor))
+
+    @staticmethod
+    def tabela_existe(cursor, tabela):
+        cursor.execute(
+            "SELECT COUNT(*) FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+            (tabela,))
+        return cursor.fetchone()[0] > 0
+
+    @staticmethod
+    def tabelas_desanexadas(cursor):
+        # {mês: nome} das tabelas criadas pela expiração em modo desanexar.
+        cursor.execute("""
+            SELECT TABLE_NAME FROM information_schema.TABLES
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME LIKE 'transacoes\\_arquivo\\_%'
+        """)
+        return {datetime.strptime(nome[-6:], "%Y%m").date(): nome for nome, in cursor.fetchall()}
+
+    @staticmethod
+    def meses_particionados(cursor):
+        return [mes_da_particao(nome) for nome, _ in ParticoesService.listar_particoes(cursor) if nome != PARTICAO_FUTURO]
+
+    @staticmethod
+    def sql_particionar(primeiro_mes, ultimo_mes):
+        return (
+            "ALTER TABLE transacoes PARTITION BY RANGE (UNIX_TIMESTAMP(data_hora)) ("
+            + definir_particoes(meses_entre(primeiro_mes, ultimo_mes)) + ")"
+        )
+
+    @staticmethod
+    def criar_futuras(cursor, hoje, quantidade):
+        meses = ParticoesService.meses_particionados(cursor)
+        ultimo_desejado = somar_meses(inicio_do_mes(hoje), quantidade)
+        primeiro_novo = somar_meses(max(meses), 1) if meses else inicio_do_mes(hoje)
+        novos = meses_entre(primeiro_novo, ultimo_desejado)
+        if novos:
+            # Com a pfuturo vazia (o job roda antes do mês chegar), o REORGANIZE só mexe em metadados.
+            cursor.execute(
+                f"ALTER TABLE transacoes REORGANIZE PARTITION {PARTICAO_FUTURO} INTO ({definir_particoes(novos)})")
+        return [nome_particao(mes) for mes in novos]
+
+    @staticmethod
+    def expirar(cursor, hoje, retencao_meses, modo):
+        limite = somar_meses(inicio_do_mes(hoje), -retencao_meses)
+        expiradas = []
+        for mes in ParticoesService.meses_particionados(cursor):
+            if mes >= limite:
+                continue
+            nome = nome_particao(mes)
+            if modo == "desanexar":
+                ParticoesService.desanexar(cursor, nome, nome_tabela_desanexada(mes))
+            cursor.execute(f"ALTER TABLE transacoes DROP PARTITION {nome}")
+            expiradas.append(nome)
+        return expiradas
+
+    @staticmethod
+    def desanexar(cursor, nome, tabela):
+        # EXCHANGE PARTITION troca os dados da partição com uma tabela comum de mesma
+        # estrutura; a partição, agora vazia, é apagada em seguida.
+        if not ParticoesService.tabela_existe(cursor, tabela):
+            cursor.execute(f"CREATE TABLE {tabela} LIKE transacoes")
+            cursor.execute(f"ALTER TABLE {tabela} REMOVE PARTITIONING")
+
+        # Se uma execução anterior parou entre o EXCHANGE e o DROP, a partição já está vazia.
+        cursor.execute(f"SELECT 1 FROM transacoes PARTITION ({nome}) LIMIT 1")
+        if cursor.fetchone() is not None:
+            cursor.execute(f"ALTER TABLE transacoes EXCHANGE PARTITION {nome} WITH TABLE {tabela}")
+
+    @staticmethod
+    def manter(hoje=None, shard=None):
+        backend = get_backend(shard)
+        if backend.nome != "mysql":
+            raise Exception("O particionamento de transacoes só existe no backend MySQL.")
+        if Config.TRANSACOES_EXPIRACAO not in MODOS_EXPIRACAO:
+            raise Exception(f"TRANSACOES_EXPIRACAO inválido: '{Config.TRANSACOES_EXPIRACAO}'. Use 'apagar' ou 'desanexar'.")
+
+        hoje = hoje or date.today()
+        conexao = backend.conectar()
+        try:
+            cursor = conexao.cursor()
+            try:
+                if not ParticoesService.esta_particionada(cursor):
+                    raise Exception("A tabela transacoes não está particionada. Rode 'flask --app main db migrar'.")
+
+                criadas = ParticoesService.criar_futuras(cursor, hoje, Config.TRANSACOES_PARTICOES_FUTURAS)
+                expiradas = []
+                if Config.TRANSACOES_RETENCAO_MESES > 0:
+                    expiradas = ParticoesService.expirar(
+                        cursor, hoje, Config.TRANSACOES_RETENCAO_MESES, Config.TRANSACOES_EXPIRACAO)
+            finally:
+                cursor.close()
+        finally:
+            conexao.close()
+
+        for nome in criadas:
+            logger.info("Partição %s criada em transacoes", nome)
+        for nome in expiradas:
+            logger.info("Partição %s expirada em transacoes (%s)", nome, Config.TRANSACOES_EXPIRACAO)
+        return {"criadas": criadas, "expiradas": expiradas}
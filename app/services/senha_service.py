@@ -0,0 +1,111 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+from app.config import Config
+from app import metricas
+
+
+class SobrecargaError(Exception):
+    def __init__(self, retry_after):
+        super().__init__("Servidor ocupado processando senhas. Tente novamente em instantes.")
+        self.retry_after = retry_after
+
+
+def gerar_hash(senha, rounds):
+    return bcrypt.hashpw(senha.encode("utf-8"), bcrypt.gensalt(rounds)).decode("utf-8")
+
+
+def conferir_hash(senha_hash, senha):
+    try:
+        return bcrypt.checkpw(senha.encode("utf-8"), senha_hash.encode("utf-8"))
+    except ValueError:
+        return False
+
+
+_executor = None
+_executor_pid = None
+_vagas = None
+_lock = threading.Lock()
+
+
+def numero_de_workers():
+    return Config.BCRYPT_WORKERS or os.cpu_count() or 1
+
+
+def get_executor():
+    # O pool é recriado quando o processo muda (fork), nunca herdado do pai.
+    global _executor, _executor_pid, _vagas
+    if _executor is None or _executor_pid != os.getpid():
+        with _lock:
+            if _executor is None or _executor_pid != os.getpid():
+                workers = numero_de_workers()
+                _executor = ProcessPoolExecutor(
+                    max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+                _vagas = threading.BoundedSemaphore(workers + Config.BCRYPT_FILA_MAX)
+                _executor_pid = os.getpid()
+    return _executor, _vagas
+
+
+def encerrar_executor():
+    global _executor
+    with _lock:
+        if _executor is not None and _executor_pid == os.getpid():
+            _executor.shutdown(wait=True)
+        _executor = None
+
+
+class SenhaService:
+    @staticmethod
+    def executar(operacao, funcao, *args):
+        inicio = time.perf_counter()
+        try:
+            if not Config.BCRYPT_USAR_PROCESSOS:
+                return funcao(*args)
+
+            executor, vagas = get_executor()
+            if not vagas.acquire(blocking=False):
+                metricas.somar("banco_bcrypt_rejeicoes_total", (("operacao", operacao),))
+                raise SobrecargaError(Config.BCRYPT_RETRY_AFTER_SEGUNDOS)
+            try:
+                return executor.submit(funcao, *args).result()
+            finally:
+                vagas.release()
+        finally:
+            metricas.observar("banco_bcrypt_duracao_segundos", (("operacao", operacao),),
+                              time.perf_counter() - inicio, metricas.BUCKETS_BCRYPT)
+
+    @staticmethod
+    def gerar_hash(senha):
+        return SenhaService.executar("hash", gerar_hash, senha, Config.BCRYPT_LOG_ROUNDS)
+
+    @staticmethod
+    def verificar(senha_hash, senha):
+        return SenhaService.executar("verificar", conferir_hash, senha_hash, senha)
+
+    @staticmethod
+    def custo_do_hash(senha_hash):
+        try:
+            return int(senha_hash.split("$")[2])
+        except (IndexError, ValueError):
+            return None
+
+    @staticmethod
+    def precisa_rehash(senha_hash):
+        return SenhaService.custo_do_hash(senha_hash) != Config.BCRYPT_LOG_ROUNDS
+
+    @staticmethod
+    def aquecer():
+        # Sobe todos os processos do pool (o spawn é lento) e carrega o bcrypt neles
+        # antes do primeiro login; o custo baixo deixa o aquecimento rápido.
+        if not Config.BCRYPT_USAR_PROCESSOS:
+            gerar_hash("aquecimento", 4)
+            return
+        executor, _ = get_executor()
+        futuros = [executor.submit(gerar_hash, "aquecimento", 4) for _ in range(numero_de_workers())]
+        for futuro in futuros:
+            futuro.result()
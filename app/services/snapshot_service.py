@@ -0,0 +1,185 @@
+from datetime import date, datetime, timedelta
+
+from app.database import get_conexão_db, get_conexão_leitura, ErroBanco
+from app.config import Config
+from app.services.arquivo_service import ArquivoService
+from app import shards
+
+# Variação de saldo causada por cada linha de transacoes. Transferências são
+# gravadas com valor negativo: a origem soma o valor, o destino subtrai. Só contas
+# deste banco: com shards, uma transferência entre shards cita a conta do outro.
+CONSULTA_VARIACOES_DO_DIA = """
+    SELECT conta, SUM(variacao)
+    FROM (
+        SELECT conta_id AS conta,
+            CASE WHEN tipo = 'saque' THEN -valor ELSE valor END AS variacao
+        FROM transacoes
+        WHERE data_hora >= %s AND data_hora < %s AND conta_id IS NOT NULL
+        UNION ALL
+        SELECT conta_destino_id AS conta, -valor AS variacao
+        FROM transacoes
+        WHERE data_hora >= %s AND data_hora < %s AND conta_destino_id IS NOT NULL
+    ) AS movimentos
+    WHERE conta IN (SELECT id FROM contas)
+    GROUP BY conta
+"""
+
+CONSULTA_ULTIMO_SNAPSHOT = """
+    SELECT dia, saldo FROM saldos_diarios
+    WHERE conta_id = %s AND dia < %s
+    ORDER BY dia DESC LIMIT 1
+"""
+
+
+class SnapshotService:
+    @staticmethod
+    def inicio_do_dia(dia):
+        return datetime(dia.year, dia.month, dia.day)
+
+    @staticmethod
+    def ultimo_dia_processado(cursor, travar=False):
+        cursor.execute(
+            "SELECT ultimo_dia FROM snapshots_progresso WHERE id = 1" + (" FOR UPDATE" if travar else ""))
+        linha = cursor.fetchone()
+        return linha[0] if linha else None
+
+    @staticmethod
+    def primeiro_dia_com_transacoes(cursor):
+        cursor.execute("SELECT MIN(data_hora) FROM transacoes")
+        primeira = cursor.fetchone()[0]
+        if primeira is None:
+            return None
+        # O SQLite devolve agregados de TIMESTAMP como texto.
+        return date.fromisoformat(str(primeira)[:10])
+
+    @staticmethod
+    def processar_dia(cursor, dia):
+        inicio = SnapshotService.inicio_do_dia(dia)
+        fim = inicio + timedelta(days=1)
+        cursor.execute(CONSULTA_VARIACOES_DO_DIA, (inicio, fim, inicio, fim))
+        variacoes = cursor.fetchall()
+        if not variacoes:
+            return 0
+
+        # Saldo de fim do dia = último snapshot anterior da conta + variação do dia.
+        cursor.executemany(
+            """
+            INSERT INTO saldos_diarios (conta_id, dia, saldo)
+            SELECT %s, %s, COALESCE((
+                SELECT saldo FROM saldos_diarios
+                WHERE conta_id = %s AND dia < %s
+                ORDER BY dia DESC LIMIT 1
+            ), 0) + %s
+            ON DUPLICATE KEY UPDATE saldo = VALUES(saldo)
+            """,
+            [(conta, dia, conta, dia, variacao) for conta, variacao in variacoes]
+        )
+        return len(variacoes)
+
+    @staticmethod
+    def gerar_snapshots(ate_dia=None):
+        # Só fecha dias encerrados há mais que a margem, para que transações
+        # ainda não commitadas daquele dia não fiquem de fora do snapshot.
+        limite = (datetime.now() - timedelta(seconds=Config.SNAPSHOT_MARGEM_SEGUNDOS)).date() - timedelta(days=1)
+        ate_dia = min(ate_dia, limite) if ate_dia else limite
+
+        db = get_conexão_db()
+        cursor = db.cursor()
+        processados = []
+        try:
+            while True:
+                if db.in_transaction:
+                    db.rollback()
+                db.start_transaction()
+
+                ultimo = SnapshotService.ultimo_dia_processado(cursor, travar=True)
+                if ultimo is None:
+                    primeiro = SnapshotService.primeiro_dia_com_transacoes(cursor)
+                    if primeiro is None:
+                        db.rollback()
+                        break
+                    proximo = primeiro
+                else:
+                    proximo = ultimo + timedelta(days=1)
+
+                if proximo > ate_dia:
+                    db.rollback()
+                    break
+
+                contas = SnapshotService.processar_dia(cursor, proximo)
+                cursor.execute(
+                    """
+                    INSERT INTO snapshots_progresso (id, ultimo_dia) VALUES (1, %s)
+                    ON DUPLICATE KEY UPDATE ultimo_dia = VALUES(ultimo_dia)
+                    """, (proximo,))
+                db.commit()
+                processados.append({"dia": proximo.isoformat(), "contas": contas})
+            return processados
+        except ErroBanco as err:
+            db.rollback()
+            raise err
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def montar_consulta_variacao(id, inicio, fim):
+        filtro_inicio = " AND data_hora >= %s" if inicio is not None else ""
+        parametros_inicio = (inicio,) if inicio is not None else ()
+        consulta = f"""
+            SELECT
+                (SELECT COALESCE(SUM(CASE WHEN tipo = 'saque' THEN -valor ELSE valor END), 0)
+                FROM transacoes WHERE conta_id = %s{filtro_inicio} AND data_hora < %s)
+                +
+                (SELECT COALESCE(SUM(-valor), 0)
+                FROM transacoes WHERE conta_destino_id = %s{filtro_inicio} AND data_hora < %s)
+            """
+        return consulta, (id, *parametros_inicio, fim, id, *parametros_inicio, fim)
+
+    @staticmethod
+    def intervalo_arquivado(id, inicio, fim):
+        # Parte de [inicio, fim) que está nos segmentos arquivados, ou None.
+        limite = ArquivoService.limite_arquivado(shards.shard_da_conta(id))
+        if limite is None or (inicio is not None and inicio >= limite):
+            return None
+        return inicio, min(fim, limite)
+
+    @staticmethod
+    def variacao_no_intervalo(cursor, id, inicio, fim):
+        arquivado = SnapshotService.intervalo_arquivado(id, inicio, fim)
+        variacao = ArquivoService.variacao(id, *arquivado) if arquivado else 0
+        cursor.execute(*SnapshotService.montar_consulta_variacao(id, ArquivoService.inicio_quente(id, inicio), fim))
+        return variacao + (cursor.fetchone()[0] or 0)
+
+    @staticmethod
+    def ponto_de_partida(snapshot):
+        # Saldo do último snapshot anterior ao momento e o início do intervalo que falta somar.
+        if snapshot:
+            dia, saldo = snapshot
+            return saldo, SnapshotService.inicio_do_dia(dia) + timedelta(days=1)
+        return 0, None
+
+    @staticmethod
+    def saldo_em(id, momento):
+        db = get_conexão_leitura(id)
+        try:
+            cursor = db.cursor()
+            cursor.execute(CONSULTA_ULTIMO_SNAPSHOT, (id, momento.date()))
+            saldo, inicio = SnapshotService.ponto_de_partida(cursor.fetchone())
+
+            return saldo + SnapshotService.variacao_no_intervalo(cursor, id, inicio, momento)
+        except ErroBanco as err:
+            db.rollback()
+            raise err
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def validar_momento(valor, nome_do_campo, padrao=None):
+        if not valor:
+            if padrao is not None:
+                return padrao
+            raise Exception(f"O parâmetro '{nome_do_campo}' é obrigatório.")
+        try:
+            return datetime.fromisoformat(valor)
+        except ValueError:
+            raise Exception(f"O parâmetro '{nome_do_campo}' precisa ser uma data ISO 8601.")
@@ -0,0 +1,301 @@
+import random
+
+from app.config import Config
+from app.database import get_conexão_db, get_conexão_leitura, shard_atual, ErroBanco
+from app.services.arquivo_service import ArquivoService
+
+COLUNAS_TOTAIS = (
+    "total_depositos",
+    "total_saques",
+    "total_transferencias_enviadas",
+    "total_transferencias_recebidas",
+    "quantidade_transacoes",
+)
+
+# Mesma regra do antigo SUM(CASE ...) sobre transacoes: cada linha conta uma vez
+# para a conta de origem e uma vez para a de destino, com o valor gravado. Com
+# shards, a linha de uma transferência entre shards cita a conta do outro banco,
+# que fica de fora.
+CONSULTA_TOTAIS_CALCULADOS = """
+    SELECT
+        conta,
+        SUM(CASE WHEN tipo = 'deposito' THEN valor ELSE 0 END) AS total_depositos,
+        SUM(CASE WHEN tipo = 'saque' THEN valor ELSE 0 END) AS total_saques,
+        SUM(CASE WHEN tipo = 'transferencia' AND lado = 'origem' THEN valor ELSE 0 END) AS total_transferencias_enviadas,
+        SUM(CASE WHEN tipo = 'transferencia' AND lado = 'destino' THEN valor ELSE 0 END) AS total_transferencias_recebidas,
+        COUNT(*) AS quantidade_transacoes,
+        MAX(id) AS ultima_transacao_id
+    FROM (
+        SELECT conta_id AS conta, tipo, valor, id, 'origem' AS lado
+        FROM transacoes WHERE conta_id BETWEEN %s AND %s{filtro_data}
+        UNION ALL
+        SELECT conta_destino_id AS conta, tipo, valor, id, 'destino' AS lado
+        FROM transacoes WHERE conta_destino_id BETWEEN %s AND %s{filtro_data}
+    ) AS movimentos
+    WHERE conta IN (SELECT id FROM contas)
+    GROUP BY conta
+"""
+
+COLUNAS_TOTAIS_SQL = """total_depositos, total_saques, total_transferencias_enviadas,
+        total_transferencias_recebidas, quantidade_transacoes, ultima_transacao_id"""
+
+# Contas fatiadas também têm totais em fatias_totais, até a próxima consolidação.
+CONSULTA_TOTAIS_CONTA = f"""
+    SELECT SUM(total_depositos) AS total_depositos, SUM(total_saques) AS total_saques,
+        SUM(total_transferencias_enviadas) AS total_transferencias_enviadas,
+        SUM(total_transferencias_recebidas) AS total_transferencias_recebidas,
+        SUM(quantidade_transacoes) AS quantidade_transacoes, MAX(ultima_transacao_id) AS ultima_transacao_id
+    FROM (
+        SELECT {COLUNAS_TOTAIS_SQL} FROM totais_conta WHERE conta_id = %s
+        UNION ALL
+        SELECT {COLUNAS_TOTAIS_SQL} FROM fatias_totais WHERE conta_id = %s
+    ) AS totais
+"""
+
+ZERAR_TOTAIS_FATIAS = """
+    UPDATE fatias_totais SET total_depositos = 0, total_saques = 0, total_transferencias_enviadas = 0,
+        total_transferencias_recebidas = 0, quantidade_transacoes = 0, ultima_transacao_id = NULL
+    WHERE conta_id BETWEEN %s AND %s
+"""
+
+TOLERANCIA_TOTAIS = 0.005
+
+
+class TotaisService:
+    @staticmethod
+    def totais_de_transacao(tipo, valor, conta_id, conta_destino_id, id_transacao):
+        totais = {conta_id: [0, 0, 0, 0, 1, id_transacao]}
+        if tipo == "deposito":
+            totais[conta_id][0] = valor
+        elif tipo == "saque":
+            totais[conta_id][1] = valor
+        elif tipo == "transferencia":
+            totais[conta_id][2] = valor
+            if conta_destino_id is not None:
+                totais[conta_destino_id] = [0, 0, 0, valor, 1, id_transacao]
+        return totais
+
+    @staticmethod
+    def somar_totais(acumulado, novos):
+        for conta, valores in novos.items():
+            atual = acumulado.get(conta)
+            if atual is None:
+                acumulado[conta] = list(valores)
+                continue
+            for posicao in range(5):
+                atual[posicao] += valores[posicao]
+            atual[5] = max(atual[5], valores[5])
+        return acumulado
+
+    @staticmethod
+    def acumular_totais(cursor, totais):
+        # Deve rodar no mesmo cursor/transação que gravou as linhas em transacoes.
+        # Contas fatiadas somam numa linha sorteada de fatias_totais, para que os
+        # créditos não voltem a disputar a mesma linha em totais_conta.
+        comuns = {
+            conta: valores for conta, valores in totais.items()
+            if int(conta) not in Config.SALDO_FATIADO_CONTAS or not TotaisService.acumular_em_fatia(cursor, conta, valores)
+        }
+        if comuns:
+            TotaisService.acumular_em_totais_conta(cursor, comuns)
+
+    @staticmethod
+    def registrar_transacao(cursor, tipo, valor, conta_id, conta_destino_id=None):
+        TotaisService.acumular_totais(
+            cursor,
+            TotaisService.totais_de_transacao(tipo, valor, conta_id, conta_destino_id, cursor.lastrowid)
+        )
+
+    @staticmethod
+    def inserir_transacoes(cursor, linhas):
+        # Uma linha por INSERT: o mysql não garante ids consecutivos em um INSERT de
+        # várias linhas (innodb_autoinc_lock_mode=2, auto_increment_increment > 1).
+        ids = []
+        for tipo, valor, conta_id, conta_destino_id in linhas:
+            cursor.execute(
+                "INSERT INTO transacoes (tipo, valor, conta_id, conta_destino_id) VALUES (%s,%s,%s,%s)",
+                (tipo, valor, conta_id, conta_destino_id))
+            ids.append(cursor.lastrowid)
+        return ids
+
+    @staticmethod
+    def acumular_em_totais_conta(cursor, totais):
+        cursor.executemany(
+            """
+            INSERT INTO totais_conta
+                (conta_id, total_depositos, total_saques, total_transferencias_enviadas,
+                total_transferencias_recebidas, quantidade_transacoes, ultima_transacao_id)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                total_depositos = total_depositos + VALUES(total_depositos),
+                total_saques = total_saques + VALUES(total_saques),
+                total_transferencias_enviadas = total_transferencias_enviadas + VALUES(total_transferencias_enviadas),
+                total_transferencias_recebidas = total_transferencias_recebidas + VALUES(total_transferencias_recebidas),
+                quantidade_transacoes = quantidade_transacoes + VALUES(quantidade_transacoes),
+                ultima_transacao_id = GREATEST(ultima_transacao_id, VALUES(ultima_transacao_id))
+            """,
+            [(conta, *valores) for conta, valores in sorted(totais.items())]
+        )
+
+    @staticmethod
+    def acumular_em_fatia(cursor, conta_id, valores):
+        # False se as fatias da conta ainda não existem; quem chamou usa totais_conta.
+        cursor.execute(
+            """
+            UPDATE fatias_totais SET
+                total_depositos = total_depositos + %s,
+                total_saques = total_saques + %s,
+                total_transferencias_enviadas = total_transferencias_enviadas + %s,
+                total_transferencias_recebidas = total_transferencias_recebidas + %s,
+                quantidade_transacoes = quantidade_transacoes + %s,
+                ultima_transacao_id = GREATEST(COALESCE(ultima_transacao_id, 0), %s)
+            WHERE conta_id = %s AND fatia = %s
+            """,
+            (*valores, conta_id, random.randrange(Config.SALDO_FATIADO_FATIAS)))
+        return cursor.rowcount == 1
+
+    @staticmethod
+    def consolidar_fatias(cursor, conta_id):
+        # Leva os totais das fatias para totais_conta. Quem chama já travou a conta.
+        cursor.execute(
+            f"SELECT {COLUNAS_TOTAIS_SQL} FROM fatias_totais WHERE conta_id = %s ORDER BY fatia FOR UPDATE",
+            (conta_id,))
+        acumulado = {}
+        for linha in cursor.fetchall():
+            if linha[4]:
+                TotaisService.somar_totais(acumulado, {conta_id: linha})
+        if not acumulado:
+            return 0
+        cursor.execute(ZERAR_TOTAIS_FATIAS, (conta_id, conta_id))
+        TotaisService.acumular_em_totais_conta(cursor, acumulado)
+        return acumulado[conta_id][4]
+
+    @staticmethod
+    def contas_com_totais_em_fatias(cursor):
+        cursor.execute("SELECT DISTINCT conta_id FROM fatias_totais WHERE quantidade_transacoes <> 0")
+        return [conta for conta, in cursor.fetchall()]
+
+    @staticmethod
+    def totais_ou_zeros(totais):
+        # Sem nenhuma linha, as somas de CONSULTA_TOTAIS_CONTA vêm todas nulas.
+        if not totais or totais["quantidade_transacoes"] is None:
+            totais = {coluna: 0 for coluna in COLUNAS_TOTAIS}
+            totais["ultima_transacao_id"] = None
+        return totais
+
+    @staticmethod
+    def buscar_totais(id):
+        db = get_conexão_leitura(id)
+        try:
+            cursor = db.cursor(dictionary=True)
+            cursor.execute(CONSULTA_TOTAIS_CONTA, (id, id))
+            return TotaisService.totais_ou_zeros(cursor.fetchone())
+        except ErroBanco as err:
+            db.rollback()
+            raise err
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def calcular_totais(cursor, primeiro_id, ultimo_id):
+        # Linhas do banco a partir do limite do arquivo, mais os totais que os
+        # segmentos arquivados já guardam por conta. Roda no shard escolhido por quem chamou.
+        shard = shard_atual()
+        limite = ArquivoService.limite_arquivado(shard)
+        if limite is None:
+            cursor.execute(CONSULTA_TOTAIS_CALCULADOS.format(filtro_data=""),
+                           (primeiro_id, ultimo_id, primeiro_id, ultimo_id))
+        else:
+            cursor.execute(CONSULTA_TOTAIS_CALCULADOS.format(filtro_data=" AND data_hora >= %s"),
+                           (primeiro_id, ultimo_id, limite, primeiro_id, ultimo_id, limite))
+        calculados = {linha[0]: list(linha[1:]) for linha in cursor.fetchall()}
+        for conta, totais in ArquivoService.totais(primeiro_id, ultimo_id, shard):
+            TotaisService.somar_totais(calculados, {conta: totais})
+        return calculados
+
+    @staticmethod
+    def faixas_de_contas(cursor, tamanho_bloco, conta_id=None):
+        if conta_id is not None:
+            return [(conta_id, conta_id)]
+        cursor.execute("SELECT MIN(id), MAX(id) FROM contas")
+        menor, maior = cursor.fetchone()
+        if menor is None:
+            return []
+        return [(inicio, min(inicio + tamanho_bloco - 1, maior)) for inicio in range(menor, maior + 1, tamanho_bloco)]
+
+    @staticmethod
+    def reconstruir(conta_id=None, tamanho_bloco=500):
+        db = get_conexão_db()
+        cursor = db.cursor()
+        reconstruidas = 0
+        try:
+            for primeiro_id, ultimo_id in TotaisService.faixas_de_contas(cursor, tamanho_bloco, conta_id):
+                if db.in_transaction:
+                    db.rollback()
+                db.start_transaction()
+                # Travar as contas impede depósitos, saques e transferências de
+                # atualizarem os totais da faixa enquanto ela é recalculada: todos
+                # travam a linha da conta, inclusive os créditos em contas fatiadas
+                # (lock compartilhado, ver FatiasService.creditar).
+                cursor.execute(
+                    "SELECT id FROM contas WHERE id BETWEEN %s AND %s ORDER BY id FOR UPDATE",
+                    (primeiro_id, ultimo_id))
+                contas = [linha[0] for linha in cursor.fetchall()]
+                calculados = TotaisService.calcular_totais(cursor, primeiro_id, ultimo_id)
+
+                cursor.execute("DELETE FROM totais_conta WHERE conta_id BETWEEN %s AND %s", (primeiro_id, ultimo_id))
+                cursor.execute(ZERAR_TOTAIS_FATIAS, (primeiro_id, ultimo_id))
+                linhas = [(conta, *calculados[conta]) for conta in contas if conta in calculados]
+                if linhas:
+                    cursor.executemany(
+                        """
+                        INSERT INTO totais_conta
+                            (conta_id, total_depositos, total_saques, total_transferencias_enviadas,
+                            total_transferencias_recebidas, quantidade_transacoes, ultima_transacao_id)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s)
+                        """, linhas)
+                db.commit()
+                reconstruidas += len(linhas)
+            return reconstruidas
+        except ErroBanco as err:
+            db.rollback()
+            raise err
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def verificar(conta_id=None, tamanho_bloco=500):
+        db = get_conexão_db()
+        cursor = db.cursor()
+        divergencias = []
+        try:
+            for primeiro_id, ultimo_id in TotaisService.faixas_de_contas(cursor, tamanho_bloco, conta_id):
+                calculados = TotaisService.calcular_totais(cursor, primeiro_id, ultimo_id)
+                cursor.execute(
+                    f"""
+                    SELECT conta_id, SUM(total_depositos), SUM(total_saques), SUM(total_transferencias_enviadas),
+                        SUM(total_transferencias_recebidas), SUM(quantidade_transacoes)
+                    FROM (
+                        SELECT conta_id, {COLUNAS_TOTAIS_SQL} FROM totais_conta WHERE conta_id BETWEEN %s AND %s
+                        UNION ALL
+                        SELECT conta_id, {COLUNAS_TOTAIS_SQL} FROM fatias_totais WHERE conta_id BETWEEN %s AND %s
+                    ) AS totais
+                    GROUP BY conta_id
+                    """, (primeiro_id, ultimo_id, primeiro_id, ultimo_id))
+                armazenados = {linha[0]: linha[1:] for linha in cursor.fetchall()}
+
+                for conta in sorted(set(calculados) | set(armazenados)):
+                    esperado = calculados.get(conta, (0, 0, 0, 0, 0, None))[:5]
+                    atual = armazenados.get(conta, (0, 0, 0, 0, 0))
+                    if any(abs((a or 0) - (b or 0)) > TOLERANCIA_TOTAIS for a, b in zip(esperado, atual)):
+                        divergencias.append({
+                            "conta_id": conta,
+                            "esperado": dict(zip(COLUNAS_TOTAIS, esperado)),
+                            "armazenado": dict(zip(COLUNAS_TOTAIS, atual))
+                        })
+            return divergencias
+        except ErroBanco as err:
+            db.rollback()
+            raise err
+        finally:
+            cursor.close()
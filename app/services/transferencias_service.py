@@ -0,0 +1,335 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from app.config import Config
+from app.database import get_conexão_db, ErroBanco
+from app.services.totais_service import TotaisService
+from app.services.fatias_service import FatiasService
+from app import cache_contas, eventos, metricas
+
+logger = logging.getLogger("app.transferencias")
+
+TRANSFERENCIA_OK = "ok"
+TRANSFERENCIA_ORIGEM_INEXISTENTE = "origem_inexistente"
+TRANSFERENCIA_DESTINO_INEXISTENTE = "destino_inexistente"
+TRANSFERENCIA_SALDO_INSUFICIENTE = "saldo_insuficiente"
+TRANSFERENCIA_ABORTADA = "abortada"
+
+# Estados de transferencias_distribuidas (diretório) e transferencias_pendentes (shards).
+ESTADO_INICIADA = "iniciada"
+ESTADO_PREPARADA = "preparada"
+ESTADO_CONFIRMADA = "confirmada"
+ESTADO_ABORTADA = "abortada"
+
+PAPEL_ORIGEM = "origem"
+PAPEL_DESTINO = "destino"
+
+
+def iniciar(db):
+    if db.in_transaction:
+        db.rollback()
+    db.start_transaction()
+
+
+class TransferenciasService():
+    # Transferência entre contas de shards diferentes, em duas fases. O diretório
+    # registra a transferência e guarda a decisão; cada shard prepara o seu lado
+    # (a origem já debita, o destino só confere a conta) e depois aplica ou desfaz.
+    # Cada passo é uma transação curta em um único banco, repetível sem efeito duplo:
+    # se o processo cair no meio, o recuperador termina a transferência.
+    @staticmethod
+    def transferir(valor, conta_origem, conta_destino):
+        id_transferencia = TransferenciasService.registrar(valor, conta_origem, conta_destino)
+        try:
+            resultado = TransferenciasService.preparar_origem(id_transferencia, conta_origem, valor)
+            if resultado == TRANSFERENCIA_OK:
+                resultado = TransferenciasService.preparar_destino(id_transferencia, conta_destino, valor)
+        except ErroBanco:
+            # Não se sabe se o passo chegou a ser commitado; desistir é sempre seguro.
+            TransferenciasService.abortar_sem_falhar(id_transferencia, conta_origem, conta_destino, valor)
+            raise
+
+        estado = TransferenciasService.decidir(
+            id_transferencia, ESTADO_CONFIRMADA if resultado == TRANSFERENCIA_OK else ESTADO_ABORTADA)
+        metricas.somar("banco_transferencias_distribuidas_total", (("estado", estado),))
+        try:
+            TransferenciasService.concluir(id_transferencia, conta_origem, conta_destino, valor, estado)
+        except ErroBanco as err:
+            # A decisão já está gravada no diretório: o recuperador aplica o que faltou.
+            logger.warning("Transferência %s decidida (%s), conclusão adiada: %s", id_transferencia, estado, err)
+
+        if estado == ESTADO_ABORTADA and resultado == TRANSFERENCIA_OK:
+            # O recuperador desistiu da transferência antes da decisão (tempo esgotado).
+            return TRANSFERENCIA_ABORTADA
+        return resultado
+
+    @staticmethod
+    def registrar(valor, conta_origem, conta_destino):
+        db = get_conexão_db()
+        try:
+            cursor = db.cursor()
+            agora = datetime.now()
+            cursor.execute(
+                """
+                INSERT INTO transferencias_distribuidas
+                    (conta_origem, conta_destino, valor, estado, criada_em, atualizada_em)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                """, (conta_origem, conta_destino, valor, ESTADO_INICIADA, agora, agora))
+            id_transferencia = cursor.lastrowid
+            db.commit()
+            return id_transferencia
+        except ErroBanco as err:
+            db.rollback()
+            raise err
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def pendente_existe(cursor, id_transferencia, papel):
+        # Uma linha já existente (mesmo 'abortada', deixada pelo recuperador) impede o preparo.
+        cursor.execute(
+            "SELECT estado FROM transferencias_pendentes WHERE transferencia_id = %s AND papel = %s FOR UPDATE",
+            (id_transferencia, papel))
+        return cursor.fetchone() is not None
+
+    @staticmethod
+    def inserir_pendente(cursor, id_transferencia, papel, conta_id, valor, estado=ESTADO_PREPARADA):
+        cursor.execute(
+            """
+            INSERT INTO transferencias_pendentes (transferencia_id, papel, conta_id, valor, estado, atualizada_em)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            """, (id_transferencia, papel, conta_id, valor, estado, datetime.now()))
+
+    @staticmethod
+    def debitar(cursor, conta_id, valor):
+        if FatiasService.esta_fatiada(conta_id):
+            return FatiasService.debitar(cursor, conta_id, valor)
+        cursor.execute(
+            "UPDATE contas SET saldo = saldo - %s WHERE id = %s AND saldo >= %s", (valor, conta_id, valor))
+        return cursor.rowcount == 1
+
+    @staticmethod
+    def creditar(cursor, conta_id, valor):
+        if FatiasService.esta_fatiada(conta_id):
+            return FatiasService.creditar(cursor, conta_id, valor)
+        cursor.execute("UPDATE contas SET saldo = saldo + %s WHERE id = %s", (valor, conta_id))
+        return cursor.rowcount == 1
+
+    @staticmethod
+    def preparar_origem(id_transferencia, conta_id, valor):
+        # O débito acontece já no preparo: o valor fica reservado até a decisão.
+        db = get_conexão_db(conta_id)
+        try:
+            cursor = db.cursor()
+            iniciar(db)
+            if TransferenciasService.pendente_existe(cursor, id_transferencia, PAPEL_ORIGEM):
+                db.rollback()
+                return TRANSFERENCIA_ABORTADA
+            if not TransferenciasService.debitar(cursor, conta_id, valor):
+                cursor.execute("SELECT id FROM contas WHERE id = %s", (conta_id,))
+                existe = cursor.fetchone() is not None
+                db.rollback()
+                return TRANSFERENCIA_SALDO_INSUFICIENTE if existe else TRANSFERENCIA_ORIGEM_INEXISTENTE
+            TransferenciasService.inserir_pendente(cursor, id_transferencia, PAPEL_ORIGEM, conta_id, valor)
+            db.commit()
+            cache_contas.invalidar(conta_id)
+            return TRANSFERENCIA_OK
+        except ErroBanco as err:
+            db.rollback()
+            raise err
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def preparar_destino(id_transferencia, conta_id, valor):
+        db = get_conexão_db(conta_id)
+        try:
+            cursor = db.cursor()
+            iniciar(db)
+            if TransferenciasService.pendente_existe(cursor, id_transferencia, PAPEL_DESTINO):
+                db.rollback()
+                return TRANSFERENCIA_ABORTADA
+            cursor.execute("SELECT id FROM contas WHERE id = %s FOR UPDATE", (conta_id,))
+            if cursor.fetchone() is None:
+                db.rollback()
+                return TRANSFERENCIA_DESTINO_INEXISTENTE
+            TransferenciasService.inserir_pendente(cursor, id_transferencia, PAPEL_DESTINO, conta_id, valor)
+            db.commit()
+            return TRANSFERENCIA_OK
+        except ErroBanco as err:
+            db.rollback()
+            raise err
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def decidir(id_transferencia, estado):
+        # Só sai de 'iniciada' uma vez: se o recuperador decidiu antes, vale a decisão dele.
+        db = get_conexão_db()
+        try:
+            cursor = db.cursor()
+            iniciar(db)
+            cursor.execute(
+                "UPDATE transferencias_distribuidas SET estado = %s, atualizada_em = %s WHERE id = %s AND estado = %s",
+                (estado, datetime.now(), id_transferencia, ESTADO_INICIADA))
+            if cursor.rowcount != 1:
+                cursor.execute("SELECT estado FROM transferencias_distribuidas WHERE id = %s", (id_transferencia,))
+                estado = cursor.fetchone()[0]
+            db.commit()
+            return estado
+        except ErroBanco as err:
+            db.rollback()
+            raise err
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def concluir(id_transferencia, conta_origem, conta_destino, valor, estado):
+        for papel, conta_id in ((PAPEL_ORIGEM, conta_origem), (PAPEL_DESTINO, conta_destino)):
+            TransferenciasService.concluir_no_shard(
+                id_transferencia, papel, conta_id, conta_origem, conta_destino, valor, estado)
+
+        db = get_conexão_db()
+        try:
+            cursor = db.cursor()
+            iniciar(db)
+            cursor.execute(
+                "UPDATE transferencias_distribuidas SET concluida_em = %s WHERE id = %s",
+                (datetime.now(), id_transferencia))
+            db.commit()
+        except ErroBanco as err:
+            db.rollback()
+            raise err
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def concluir_no_shard(id_transferencia, papel, conta_id, conta_origem, conta_destino, valor, estado):
+        db = get_conexão_db(conta_id)
+        id_transacao = None
+        try:
+            cursor = db.cursor()
+            iniciar(db)
+            cursor.execute(
+                "SELECT estado FROM transferencias_pendentes WHERE transferencia_id = %s AND papel = %s FOR UPDATE",
+                (id_transferencia, papel))
+            linha = cursor.fetchone()
+            if linha is None:
+                if estado == ESTADO_CONFIRMADA:
+                    raise Exception(f"Transferência {id_transferencia} confirmada sem o preparo do lado {papel}.")
+                # Lado nunca preparado: a linha 'abortada' barra um preparo que ainda esteja a caminho.
+                TransferenciasService.inserir_pendente(cursor, id_transferencia, papel, conta_id, valor, ESTADO_ABORTADA)
+                db.commit()
+                return
+            if linha[0] != ESTADO_PREPARADA:
+                db.rollback()
+                return
+
+            cursor.execute(
+                "UPDATE transferencias_pendentes SET estado = %s, atualizada_em = %s WHERE transferencia_id = %s AND papel = %s",
+                (estado, datetime.now(), id_transferencia, papel))
+            if estado == ESTADO_CONFIRMADA:
+                if papel == PAPEL_DESTINO:
+                    TransferenciasService.creditar(cursor, conta_id, valor)
+                # Cada shard grava a sua cópia da linha; os totais só contam a conta local.
+                cursor.execute(
+                    "INSERT INTO transacoes (tipo, valor, conta_id, conta_destino_id) VALUES (%s,%s,%s,%s)",
+                    ("transferencia", -valor, conta_origem, conta_destino))
+                id_transacao = cursor.lastrowid
+                totais = TotaisService.totais_de_transacao("transferencia", -valor, conta_origem, conta_destino, id_transacao)
+                TotaisService.acumular_totais(cursor, {conta_id: totais[conta_id]})
+            elif papel == PAPEL_ORIGEM:
+                # Devolve o valor reservado no preparo.
+                TransferenciasService.creditar(cursor, conta_id, valor)
+            db.commit()
+        except ErroBanco as err:
+            db.rollback()
+            raise err
+        finally:
+            cursor.close()
+
+        cache_contas.invalidar(conta_id)
+        if id_transacao is not None:
+            eventos.publicar_sem_falhar([(
+                id_transacao,
+                conta_origem if papel == PAPEL_ORIGEM else None,
+                conta_destino if papel == PAPEL_DESTINO else None,
+            )], db)
+
+    @staticmethod
+    def abortar_sem_falhar(id_transferencia, conta_origem, conta_destino, valor):
+        try:
+            estado = TransferenciasService.decidir(id_transferencia, ESTADO_ABORTADA)
+            TransferenciasService.concluir(id_transferencia, conta_origem, conta_destino, valor, estado)
+        except Exception as err:
+            logger.warning("Transferência %s ficou para o recuperador: %s", id_transferencia, err)
+
+    @staticmethod
+    def recuperar(agora=None):
+        # Transferências paradas há mais que o timeout: as ainda não decididas são
+        # abortadas, e as decididas são concluídas nos shards que faltam.
+        limite = (agora or datetime.now()) - timedelta(seconds=Config.SHARD_TIMEOUT_TRANSFERENCIA_SEGUNDOS)
+        db = get_conexão_db()
+        try:
+            cursor = db.cursor()
+            cursor.execute(
+                """
+                SELECT id, conta_origem, conta_destino, valor, estado FROM transferencias_distribuidas
+                WHERE concluida_em IS NULL AND atualizada_em < %s
+                ORDER BY id
+                """, (limite,))
+            paradas = cursor.fetchall()
+            db.commit()
+        except ErroBanco as err:
+            db.rollback()
+            raise err
+        finally:
+            cursor.close()
+
+        recuperadas = {ESTADO_CONFIRMADA: 0, ESTADO_ABORTADA: 0}
+        for id_transferencia, conta_origem, conta_destino, valor, estado in paradas:
+            if estado == ESTADO_INICIADA:
+                estado = TransferenciasService.decidir(id_transferencia, ESTADO_ABORTADA)
+            TransferenciasService.concluir(id_transferencia, conta_origem, conta_destino, valor, estado)
+            recuperadas[estado] += 1
+            metricas.somar("banco_transferencias_distribuidas_recuperadas_total", (("estado", estado),))
+            logger.info("Transferência %s recuperada (%s)", id_transferencia, estado)
+        return recuperadas
+
+
+class Recuperador:
+    def __init__(self, app, intervalo):
+        self.app = app
+        self.intervalo = intervalo
+        self.thread = threading.Thread(target=self.executar, name="recuperador-transferencias", daemon=True)
+        self.thread.start()
+
+    def executar(self):
+        while True:
+            time.sleep(self.intervalo)
+            try:
+                # O contexto da aplicação dá ao recuperador as mesmas conexões por
+                # banco de uma requisição, devolvidas ao pool no fim de cada rodada.
+                with self.app.app_context():
+                    TransferenciasService.recuperar()
+            except Exception:
+                logger.exception("Falha ao recuperar transferências entre shards")
+
+
+_instancia = None
+_instancia_pid = None
+_lock = threading.Lock()
+
+
+def get_recuperador(app):
+    # Uma thread por processo; após um fork a instância do pai é ignorada.
+    global _instancia, _instancia_pid
+    if _instancia is None or _instancia_pid != os.getpid():
+        with _lock:
+            if _instancia is None or _instancia_pid != os.getpid():
+                _instancia = Recuperador(app, Config.SHARD_RECUPERACAO_SEGUNDOS)
+                _instancia_pid = os.getpid()
+    return _instancia
@@ -0,0 +1,34 @@
+from app.config import Config
+
+# Com DB_SHARDS preenchido, contas e transacoes ficam espalhadas por vários bancos,
+# escolhidos pelo id da conta. O banco principal (DB_HOST/DB_NAME ou SQLITE_PATH)
+# vira o diretório: guarda usuarios, distribui os ids de conta e registra as
+# transferências entre shards.
+
+
+def ativo():
+    return bool(Config.DB_SHARDS)
+
+
+def quantidade():
+    return len(Config.DB_SHARDS)
+
+
+def shard_da_conta(conta_id):
+    # None quando não há shards: a conta está no banco principal.
+    if not ativo():
+        return None
+    return int(conta_id) % quantidade()
+
+
+def mesmo_shard(conta_a, conta_b):
+    return shard_da_conta(conta_a) == shard_da_conta(conta_b)
+
+
+def indices():
+    # Bancos que guardam contas.
+    return list(range(quantidade())) if ativo() else [None]
+
+
+def todos_os_bancos():
+    return [None] + list(range(quantidade())) if ativo() else [None]
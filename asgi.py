@@ -0,0 +1,7 @@
+from main import create_app
+from app.assincrono.aplicacao import AplicacaoASGI
+
+def create_asgi_app():
+    return AplicacaoASGI(create_app())
+
+app = create_asgi_app()
@@ -0,0 +1,191 @@
+import argparse
+import http.client
+import json
+import random
+import threading
+import time
+import uuid
+from urllib.parse import urlparse
+
+from bench.resultados import percentis, salvar_resultado
+
+MIXES = {
+    "padrao": {"depositar": 25, "sacar": 15, "transferir": 30, "extrato": 30},
+    "escrita": {"depositar": 40, "sacar": 20, "transferir": 40},
+    "leitura": {"extrato": 90, "depositar": 10},
+    "transferencias": {"transferir": 100},
+}
+
+
+class Cliente:
+    def __init__(self, url, timeout):
+        destino = urlparse(url)
+        self.host = destino.hostname
+        self.porta = destino.port or 80
+        self.timeout = timeout
+        self.conexao = None
+
+    def requisitar(self, metodo, caminho, corpo=None, token=None):
+        cabecalhos = {"Content-Type": "application/json"}
+        if token:
+            cabecalhos["Authorization"] = f"Bearer {token}"
+        dados = json.dumps(corpo) if corpo is not None else None
+
+        for tentativa in range(2):
+            if self.conexao is None:
+                self.conexao = http.client.HTTPConnection(self.host, self.porta, timeout=self.timeout)
+            try:
+                self.conexao.request(metodo, caminho, body=dados, headers=cabecalhos)
+                resposta = self.conexao.getresponse()
+                conteudo = resposta.read()
+                return resposta.status, conteudo
+            except (http.client.HTTPException, OSError):
+                self.conexao.close()
+                self.conexao = None
+                if tentativa == 1:
+                    raise
+
+
+def semear(url, quantidade, saldo_inicial, timeout):
+    cliente = Cliente(url, timeout)
+    prefixo = uuid.uuid4().hex[:8]
+    usuarios = []
+    for indice in range(quantidade):
+        username = f"carga_{prefixo}_{indice}"
+        senha = "senha-carga"
+        status, corpo = cliente.requisitar("POST", "/auth/registrar", {
+            "username": username, "nome": f"Carga {indice}", "senha": senha})
+        if status != 201:
+            raise SystemExit(f"Falha ao registrar {username}: {status} {corpo[:200]!r}")
+        conta_id = json.loads(corpo)["conta_id"]
+
+        status, corpo = cliente.requisitar("POST", "/auth/login", {"username": username, "senha": senha})
+        if status != 200:
+            raise SystemExit(f"Falha no login de {username}: {status} {corpo[:200]!r}")
+        token = json.loads(corpo)["access_token"]
+
+        if saldo_inicial:
+            cliente.requisitar("PUT", f"/conta/conta/{conta_id}/depositar", {"deposito": saldo_inicial}, token)
+        usuarios.append({"conta_id": conta_id, "token": token})
+    return usuarios
+
+
+def escolher_conta(usuarios, aleatorio, quentes, fracao_quente):
+    if quentes and aleatorio.random() < fracao_quente:
+        return usuarios[aleatorio.randrange(quentes)]
+    return usuarios[aleatorio.randrange(len(usuarios))]
+
+
+def executar_operacao(cliente, operacao, usuarios, aleatorio, quentes, fracao_quente):
+    usuario = usuarios[aleatorio.randrange(len(usuarios))]
+    conta_id = usuario["conta_id"]
+    if operacao == "depositar":
+        return cliente.requisitar("PUT", f"/conta/conta/{conta_id}/depositar",
+                                  {"deposito": aleatorio.randint(1, 100)}, usuario["token"])
+    if operacao == "sacar":
+        return cliente.requisitar("PUT", f"/conta/conta/{conta_id}/sacar",
+                                  {"saque": aleatorio.randint(1, 20)}, usuario["token"])
+    if operacao == "transferir":
+        # Com distribuição enviesada, o destino tende a cair nas contas "quentes".
+        destino = escolher_conta(usuarios, aleatorio, quentes, fracao_quente)
+        while destino["conta_id"] == conta_id and len(usuarios) > 1:
+            destino = escolher_conta(usuarios, aleatorio, quentes, fracao_quente)
+        return cliente.requisitar("POST", "/conta/conta/transferir", {
+            "conta_origem": conta_id,
+            "conta_destino": destino["conta_id"],
+            "valor": aleatorio.randint(1, 10)}, usuario["token"])
+    if operacao == "extrato":
+        return cliente.requisitar("GET", f"/conta/conta/{conta_id}/extrato?limit=50", token=usuario["token"])
+    raise ValueError(f"Operação desconhecida: {operacao}")
+
+
+def trabalhador(args, usuarios, operacoes, pesos, fim, semente, latencias, erros, lock):
+    cliente = Cliente(args.url, args.timeout)
+    aleatorio = random.Random(semente)
+    locais = {operacao: [] for operacao in operacoes}
+    erros_locais = {operacao: 0 for operacao in operacoes}
+    while time.perf_counter() < fim:
+        operacao = aleatorio.choices(operacoes, pesos)[0]
+        inicio = time.perf_counter()
+        try:
+            status, _ = executar_operacao(cliente, operacao, usuarios, aleatorio, args.contas_quentes, args.fracao_quente)
+        except (http.client.HTTPException, OSError):
+            status = 0
+        locais[operacao].append(time.perf_counter() - inicio)
+        if status == 0 or status >= 500:
+            erros_locais[operacao] += 1
+    with lock:
+        for operacao in operacoes:
+            latencias[operacao].extend(locais[operacao])
+            erros[operacao] += erros_locais[operacao]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gerador de carga para a API do simulador bancário.")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--usuarios", type=int, default=50, help="Usuários/contas criados antes da carga.")
+    parser.add_argument("--saldo-inicial", type=float, default=10000)
+    parser.add_argument("--concorrencia", type=int, default=16)
+    parser.add_argument("--duracao", type=float, default=30, help="Segundos de carga.")
+    parser.add_argument("--mix", choices=sorted(MIXES), default="padrao")
+    parser.add_argument("--contas-quentes", type=int, default=0,
+                        help="Quantas contas recebem a fração quente das transferências (0 = uniforme).")
+    parser.add_argument("--fracao-quente", type=float, default=0.8)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--saida", default="bench/resultados", help="Diretório dos resultados em JSON.")
+    args = parser.parse_args()
+
+    print(f"Semeando {args.usuarios} usuários em {args.url}...")
+    usuarios = semear(args.url, args.usuarios, args.saldo_inicial, args.timeout)
+
+    mix = MIXES[args.mix]
+    operacoes = list(mix)
+    pesos = [mix[operacao] for operacao in operacoes]
+    latencias = {operacao: [] for operacao in operacoes}
+    erros = {operacao: 0 for operacao in operacoes}
+    lock = threading.Lock()
+
+    print(f"Carga '{args.mix}' com {args.concorrencia} clientes por {args.duracao}s...")
+    inicio = time.perf_counter()
+    fim = inicio + args.duracao
+    threads = [
+        threading.Thread(target=trabalhador,
+                         args=(args, usuarios, operacoes, pesos, fim, args.semente + indice, latencias, erros, lock))
+        for indice in range(args.concorrencia)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    decorrido = time.perf_counter() - inicio
+
+    rotas = {}
+    for operacao in operacoes:
+        amostras = latencias[operacao]
+        rotas[operacao] = {
+            "requisicoes": len(amostras),
+            "erros": erros[operacao],
+            "por_segundo": round(len(amostras) / decorrido, 2),
+            **percentis(amostras),
+        }
+    total = sum(rota["requisicoes"] for rota in rotas.values())
+
+    resultado = {
+        "tipo": "carga",
+        "parametros": {chave: valor for chave, valor in vars(args).items() if chave != "saida"},
+        "duracao_s": round(decorrido, 3),
+        "requisicoes": total,
+        "por_segundo": round(total / decorrido, 2),
+        "rotas": rotas,
+    }
+    caminho = salvar_resultado(resultado, args.saida, "carga")
+
+    print(f"\n{'rota':<12} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'erros':>7}")
+    for operacao, rota in rotas.items():
+        print(f"{operacao:<12} {rota['por_segundo']:>9} {rota['p50_ms']:>9} {rota['p95_ms']:>9} {rota['p99_ms']:>9} {rota['erros']:>7}")
+    print(f"\nTotal: {resultado['por_segundo']} req/s. Resultado salvo em {caminho}")
+
+
+if __name__ == "__main__":
+    main()
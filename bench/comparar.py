@@ -0,0 +1,56 @@
+import argparse
+import json
+import sys
+
+
+def carregar(caminho):
+    with open(caminho, encoding="utf-8") as arquivo:
+        return json.load(arquivo)
+
+
+def metricas_comparaveis(resultado):
+    # Para cada métrica: (valor, True se maior é melhor).
+    metricas = {}
+    if resultado.get("tipo") == "micro":
+        for nome, dados in resultado["benchmarks"].items():
+            metricas[f"{nome} op/s"] = (dados["por_segundo"], True)
+    else:
+        metricas["total req/s"] = (resultado["por_segundo"], True)
+        for rota, dados in resultado["rotas"].items():
+            metricas[f"{rota} req/s"] = (dados["por_segundo"], True)
+            for percentil in ("p50_ms", "p95_ms", "p99_ms"):
+                if dados.get(percentil) is not None:
+                    metricas[f"{rota} {percentil}"] = (dados[percentil], False)
+    return metricas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara dois resultados de benchmark em JSON.")
+    parser.add_argument("base")
+    parser.add_argument("novo")
+    parser.add_argument("--tolerancia", type=float, default=0.10,
+                        help="Piora relativa aceita antes de acusar regressão (padrão 10%%).")
+    args = parser.parse_args()
+
+    base, novo = carregar(args.base), carregar(args.novo)
+    metricas_base, metricas_novo = metricas_comparaveis(base), metricas_comparaveis(novo)
+
+    print(f"base: {base.get('commit')}  novo: {novo.get('commit')}\n")
+    regressoes = 0
+    for nome in sorted(set(metricas_base) & set(metricas_novo)):
+        (antes, maior_melhor), (depois, _) = metricas_base[nome], metricas_novo[nome]
+        if not antes:
+            continue
+        variacao = (depois - antes) / antes
+        piora = -variacao if maior_melhor else variacao
+        marca = "REGRESSÃO" if piora > args.tolerancia else ""
+        regressoes += bool(marca)
+        print(f"{nome:<45} {antes:>12} -> {depois:>12} ({variacao:+.1%}) {marca}")
+
+    if regressoes:
+        print(f"\n{regressoes} regressão(ões) acima de {args.tolerancia:.0%}.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("SECRET_KEY", "chave-de-benchmark")
+
+from flask import jsonify
+
+from bench.resultados import salvar_resultado
+
+
+def medir(nome, funcao, repeticoes, aquecimento=None):
+    for _ in range(aquecimento if aquecimento is not None else max(1, repeticoes // 10)):
+        funcao()
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        funcao()
+    decorrido = time.perf_counter() - inicio
+    resultado = {
+        "repeticoes": repeticoes,
+        "total_s": round(decorrido, 6),
+        "por_operacao_us": round(decorrido / repeticoes * 1e6, 3),
+        "por_segundo": round(repeticoes / decorrido, 2),
+    }
+    print(f"{nome:<40} {resultado['por_operacao_us']:>12} µs/op {resultado['por_segundo']:>14} op/s")
+    return resultado
+
+
+def historico_sintetico(quantidade):
+    agora = datetime(2024, 1, 1)
+    tipos = ("deposito", "saque", "transferencia")
+    return [
+        (tipos[indice % 3], float(indice % 500) + 0.5, agora - timedelta(minutes=indice), (indice % 7) or None, indice)
+        for indice in range(quantidade)
+    ]
+
+
+def benchmarks_auth(app, repeticoes):
+    from app.services.auth_service import AuthService, cache_tokens
+
+    resultados = {}
+    resultados["criar_token_acesso"] = medir(
+        "criar_token_acesso", lambda: AuthService.criar_token_acesso(1, "cliente"), repeticoes)
+
+    token = AuthService.criar_token_acesso(1, "cliente")
+
+    def verificar_sem_cache():
+        cache_tokens.limpar()
+        AuthService.verificar_token(token)
+
+    resultados["verificar_token_sem_cache"] = medir("verificar_token (sem cache)", verificar_sem_cache, repeticoes)
+    resultados["verificar_token_com_cache"] = medir(
+        "verificar_token (com cache)", lambda: AuthService.verificar_token(token), repeticoes)
+
+    with app.test_request_context(headers={"Authorization": f"Bearer {token}"}):
+        resultados["autenticar_usuario"] = medir("autenticar_usuario", AuthService.autenticar_usuario, repeticoes)
+    return resultados
+
+
+def benchmarks_extrato(app, tamanhos):
+    from app.serializacao import Linhas
+    from app.services.conta_service import ContaService, CAMPOS_EXTRATO
+
+    resultados = {}
+    for tamanho in tamanhos:
+        historico = Linhas(CAMPOS_EXTRATO, historico_sintetico(tamanho))
+        totais = {"total_depositos": 1.0, "total_saques": 2.0,
+                  "total_transferencias_enviadas": 3.0, "total_transferencias_recebidas": 4.0}
+        repeticoes = max(3, 200000 // tamanho)
+
+        def serializar():
+            extrato = ContaService.retorno_extrato({"saldo": 10.0}, historico, totais, 1)
+            jsonify(extrato).get_data()
+
+        with app.test_request_context():
+            resultados[f"serializar_extrato_{tamanho}"] = medir(
+                f"serializar extrato ({tamanho} linhas)", serializar, repeticoes, aquecimento=1)
+    return resultados
+
+
+def benchmarks_transferencia(app, repeticoes):
+    from app.database import get_conexão_db
+    from app.services.conta_service import ContaService, TRANSFERENCIA_OK
+
+    with app.app_context():
+        db = get_conexão_db()
+        cursor = db.cursor()
+        cursor.execute("INSERT INTO contas (nome_titular, saldo) VALUES (%s, %s)", ("Bench A", 1e9))
+        conta_a = cursor.lastrowid
+        cursor.execute("INSERT INTO contas (nome_titular, saldo) VALUES (%s, %s)", ("Bench B", 1e9))
+        conta_b = cursor.lastrowid
+        db.commit()
+        cursor.close()
+
+        sentido = [conta_a, conta_b]
+
+        def transferir():
+            sentido.reverse()
+            if ContaService.executar_transferencia(1.0, sentido[0], sentido[1]) != TRANSFERENCIA_OK:
+                raise RuntimeError("Transferência de benchmark falhou.")
+
+        return {"executar_transferencia": medir("executar_transferencia (MySQL)", transferir, repeticoes)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks das funções quentes dos serviços.")
+    parser.add_argument("--repeticoes", type=int, default=5000)
+    parser.add_argument("--tamanhos-extrato", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--mysql", action="store_true",
+                        help="Inclui o caminho de transferência contra o MySQL configurado em Config.")
+    parser.add_argument("--repeticoes-transferencia", type=int, default=500)
+    parser.add_argument("--saida", default="bench/resultados")
+    args = parser.parse_args()
+
+    from main import create_app
+    app = create_app()
+
+    benchmarks = {}
+    benchmarks.update(benchmarks_auth(app, args.repeticoes))
+    benchmarks.update(benchmarks_extrato(app, args.tamanhos_extrato))
+    if args.mysql:
+        benchmarks.update(benchmarks_transferencia(app, args.repeticoes_transferencia))
+
+    caminho = salvar_resultado({"tipo": "micro", "parametros": vars(args), "benchmarks": benchmarks},
+                               args.saida, "micro")
+    print(f"\nResultado salvo em {caminho}")
+
+
+if __name__ == "__main__":
+    main()
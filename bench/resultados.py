@@ -0,0 +1,45 @@
+import json
+import os
+import platform
+import subprocess
+import time
+
+
+def percentis(amostras):
+    if not amostras:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+    ordenadas = sorted(amostras)
+
+    def percentil(fracao):
+        indice = min(len(ordenadas) - 1, int(round(fracao * (len(ordenadas) - 1))))
+        return round(ordenadas[indice] * 1000, 3)
+
+    return {
+        "p50_ms": percentil(0.50),
+        "p95_ms": percentil(0.95),
+        "p99_ms": percentil(0.99),
+        "max_ms": round(ordenadas[-1] * 1000, 3),
+    }
+
+
+def commit_atual():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def salvar_resultado(resultado, diretorio, prefixo):
+    resultado = dict(resultado)
+    resultado["commit"] = commit_atual()
+    resultado["data"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    resultado["python"] = platform.python_version()
+    resultado["maquina"] = platform.node()
+
+    os.makedirs(diretorio, exist_ok=True)
+    nome = f"{prefixo}-{resultado['commit'] or 'sem-commit'}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    caminho = os.path.join(diretorio, nome)
+    with open(caminho, "w", encoding="utf-8") as arquivo:
+        json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+    return caminho
@@ -2,21 +2,29 @@ from flask import Flask
 from app.routes.auth import auth_bp
 from app.routes.admin import admin_bp
 from app.routes.conta import conta_bp
+from app.routes.saude import saude_bp
 from app.config import Config
-from app import database
+from app import database, ciclo_de_vida
+from app.serializacao import ProvedorJSON
+from app.comandos import registrar_comandos
 
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
+    app.json = ProvedorJSON(app)
 
-    database.get_conexão_db()
+    database.init_app(app)
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(admin_bp)
     app.register_blueprint(conta_bp)
+    app.register_blueprint(saude_bp)
+
+    registrar_comandos(app)
 
     return app
 
 if __name__ == "__main__":
     app = create_app()
-    app.run(debug=True)
\ No newline at end of file
+    ciclo_de_vida.aquecer(app)
+    app.run(debug=True)
@@ -0,0 +1,49 @@
+from datetime import date
+
+from app.config import Config
+from app.services.particoes_service import ParticoesService, inicio_do_mes, somar_meses
+
+INDICES_TRANSACOES = (
+    ("idx_transacoes_conta_data", "conta_id, data_hora, id"),
+    ("idx_transacoes_destino_data", "conta_destino_id, data_hora, id"),
+    ("idx_transacoes_data", "data_hora"),
+)
+
+
+def aplicar(cursor):
+    if ParticoesService.esta_particionada(cursor):
+        return
+
+    # O MySQL não aceita chaves estrangeiras em tabelas particionadas; a integridade
+    # com contas passa a ser garantida pelos serviços (ver ContaService.deletar_conta).
+    cursor.execute("""
+        SELECT CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS
+        WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME = 'transacoes'
+    """)
+    for nome, in cursor.fetchall():
+        cursor.execute(f"ALTER TABLE transacoes DROP FOREIGN KEY `{nome}`")
+
+    # Bancos criados antes dos índices compostos só tinham os índices das chaves estrangeiras.
+    cursor.execute("""
+        SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'transacoes'
+    """)
+    existentes = {nome for nome, in cursor.fetchall()}
+    faltando = [f"ADD INDEX {nome} ({colunas})" for nome, colunas in INDICES_TRANSACOES if nome not in existentes]
+    if faltando:
+        cursor.execute("ALTER TABLE transacoes " + ", ".join(faltando))
+
+    # Toda chave única de uma tabela particionada precisa conter a coluna de particionamento.
+    cursor.execute("""
+        ALTER TABLE transacoes
+            MODIFY data_hora TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            DROP PRIMARY KEY,
+            ADD PRIMARY KEY (id, data_hora)
+    """)
+
+    cursor.execute("SELECT MIN(data_hora) FROM transacoes")
+    mais_antiga = cursor.fetchone()[0]
+    mes_atual = inicio_do_mes(date.today())
+    primeiro_mes = inicio_do_mes(mais_antiga) if mais_antiga else mes_atual
+    cursor.execute(ParticoesService.sql_particionar(
+        primeiro_mes, somar_meses(mes_atual, Config.TRANSACOES_PARTICOES_FUTURAS)))
@@ -0,0 +1,51 @@
+# Tabelas usadas com DB_SHARDS. O schema é o mesmo em todos os bancos: o diretório
+# usa contas_diretorio e transferencias_distribuidas, os shards usam
+# transferencias_pendentes.
+TABELAS = (
+    """
+    CREATE TABLE IF NOT EXISTS contas_diretorio (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        usuario_id INT,
+        criada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS transferencias_distribuidas (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        conta_origem INT NOT NULL,
+        conta_destino INT NOT NULL,
+        valor DOUBLE NOT NULL,
+        estado VARCHAR(20) NOT NULL,
+        criada_em TIMESTAMP NOT NULL,
+        atualizada_em TIMESTAMP NOT NULL,
+        concluida_em TIMESTAMP NULL DEFAULT NULL,
+        INDEX idx_transferencias_pendencias (concluida_em, estado, atualizada_em)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS transferencias_pendentes (
+        transferencia_id INT NOT NULL,
+        papel VARCHAR(10) NOT NULL,
+        conta_id INT NOT NULL,
+        valor DOUBLE NOT NULL,
+        estado VARCHAR(20) NOT NULL,
+        atualizada_em TIMESTAMP NOT NULL,
+        PRIMARY KEY (transferencia_id, papel)
+    )
+    """,
+)
+
+
+def aplicar(cursor):
+    # Com shards, usuarios fica no diretório e contas nos shards; transacoes já
+    # perdeu as chaves estrangeiras na 0002, e uma transferência entre shards grava
+    # em cada lado uma linha que cita a conta do outro.
+    cursor.execute("""
+        SELECT CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS
+        WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME = 'contas' AND REFERENCED_TABLE_NAME = 'usuarios'
+    """)
+    for nome, in cursor.fetchall():
+        cursor.execute(f"ALTER TABLE contas DROP FOREIGN KEY `{nome}`")
+
+    for tabela in TABELAS:
+        cursor.execute(tabela)
@@ -0,0 +1,14 @@
+-- Totais das contas fatiadas: cada transação soma os seus totais em uma linha
+-- sorteada, e a consolidação das fatias leva a soma para totais_conta.
+CREATE TABLE IF NOT EXISTS fatias_totais (
+    conta_id INT NOT NULL,
+    fatia INT NOT NULL,
+    total_depositos DOUBLE NOT NULL DEFAULT 0,
+    total_saques DOUBLE NOT NULL DEFAULT 0,
+    total_transferencias_enviadas DOUBLE NOT NULL DEFAULT 0,
+    total_transferencias_recebidas DOUBLE NOT NULL DEFAULT 0,
+    quantidade_transacoes INT NOT NULL DEFAULT 0,
+    ultima_transacao_id INT,
+    PRIMARY KEY (conta_id, fatia),
+    FOREIGN KEY (conta_id) REFERENCES contas(id) ON DELETE CASCADE
+);
@@ -0,0 +1,3 @@
+-- Tokens com iat anterior a este instante (segundos desde a época) são recusados;
+-- ver AuthService.revogar_tokens_usuario.
+ALTER TABLE usuarios ADD COLUMN tokens_revogados_em DOUBLE NULL;
@@ -0,0 +1,65 @@
+-- Equivalente SQLite de migracoes/mysql/0001_schema_inicial.sql.
+
+CREATE TABLE IF NOT EXISTS usuarios (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username VARCHAR(255) UNIQUE NOT NULL,
+    senha_hash TEXT NOT NULL,
+    role VARCHAR(50) DEFAULT 'cliente',
+    criado_em TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE TABLE IF NOT EXISTS contas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    nome_titular VARCHAR(255) NOT NULL,
+    saldo FLOAT DEFAULT 0,
+    status VARCHAR(50) DEFAULT 'ativo',
+    usuario_id INT,
+    FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
+);
+
+CREATE TABLE IF NOT EXISTS transacoes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tipo VARCHAR(50) NOT NULL,
+    valor FLOAT NOT NULL,
+    data_hora TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    conta_id INT,
+    conta_destino_id INT,
+    FOREIGN KEY (conta_id) REFERENCES contas(id),
+    FOREIGN KEY (conta_destino_id) REFERENCES contas(id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_transacoes_conta_data ON transacoes (conta_id, data_hora, id);
+CREATE INDEX IF NOT EXISTS idx_transacoes_destino_data ON transacoes (conta_destino_id, data_hora, id);
+CREATE INDEX IF NOT EXISTS idx_transacoes_data ON transacoes (data_hora);
+
+CREATE TABLE IF NOT EXISTS totais_conta (
+    conta_id INTEGER PRIMARY KEY,
+    total_depositos DOUBLE NOT NULL DEFAULT 0,
+    total_saques DOUBLE NOT NULL DEFAULT 0,
+    total_transferencias_enviadas DOUBLE NOT NULL DEFAULT 0,
+    total_transferencias_recebidas DOUBLE NOT NULL DEFAULT 0,
+    quantidade_transacoes INT NOT NULL DEFAULT 0,
+    ultima_transacao_id INT,
+    FOREIGN KEY (conta_id) REFERENCES contas(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS saldos_diarios (
+    conta_id INT NOT NULL,
+    dia DATE NOT NULL,
+    saldo DOUBLE NOT NULL,
+    PRIMARY KEY (conta_id, dia),
+    FOREIGN KEY (conta_id) REFERENCES contas(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS snapshots_progresso (
+    id TINYINT PRIMARY KEY,
+    ultimo_dia DATE NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS fatias_saldo (
+    conta_id INT NOT NULL,
+    fatia INT NOT NULL,
+    saldo DOUBLE NOT NULL DEFAULT 0,
+    PRIMARY KEY (conta_id, fatia),
+    FOREIGN KEY (conta_id) REFERENCES contas(id) ON DELETE CASCADE
+);
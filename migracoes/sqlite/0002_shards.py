@@ -0,0 +1,76 @@
+# Equivalente SQLite de migracoes/mysql/0003_shards.py. O SQLite não remove uma
+# chave estrangeira com ALTER TABLE: contas e transacoes são reconstruídas sem as
+# que não valem entre bancos (contas -> usuarios, transacoes -> contas).
+RECONSTRUCOES = (
+    ("contas", """
+        CREATE TABLE contas_nova (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome_titular VARCHAR(255) NOT NULL,
+            saldo FLOAT DEFAULT 0,
+            status VARCHAR(50) DEFAULT 'ativo',
+            usuario_id INT
+        )
+    """, "id, nome_titular, saldo, status, usuario_id"),
+    ("transacoes", """
+        CREATE TABLE transacoes_nova (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo VARCHAR(50) NOT NULL,
+            valor FLOAT NOT NULL,
+            data_hora TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+            conta_id INT,
+            conta_destino_id INT
+        )
+    """, "id, tipo, valor, data_hora, conta_id, conta_destino_id"),
+)
+
+INDICES = (
+    "CREATE INDEX IF NOT EXISTS idx_transacoes_conta_data ON transacoes (conta_id, data_hora, id)",
+    "CREATE INDEX IF NOT EXISTS idx_transacoes_destino_data ON transacoes (conta_destino_id, data_hora, id)",
+    "CREATE INDEX IF NOT EXISTS idx_transacoes_data ON transacoes (data_hora)",
+)
+
+TABELAS = (
+    """
+    CREATE TABLE IF NOT EXISTS contas_diretorio (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        usuario_id INT,
+        criada_em TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS transferencias_distribuidas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        conta_origem INT NOT NULL,
+        conta_destino INT NOT NULL,
+        valor DOUBLE NOT NULL,
+        estado VARCHAR(20) NOT NULL,
+        criada_em TIMESTAMP NOT NULL,
+        atualizada_em TIMESTAMP NOT NULL,
+        concluida_em TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_transferencias_pendencias ON transferencias_distribuidas (concluida_em, estado, atualizada_em)",
+    """
+    CREATE TABLE IF NOT EXISTS transferencias_pendentes (
+        transferencia_id INT NOT NULL,
+        papel VARCHAR(10) NOT NULL,
+        conta_id INT NOT NULL,
+        valor DOUBLE NOT NULL,
+        estado VARCHAR(20) NOT NULL,
+        atualizada_em TIMESTAMP NOT NULL,
+        PRIMARY KEY (transferencia_id, papel)
+    )
+    """,
+)
+
+
+def aplicar(cursor):
+    # Precisa rodar fora de transação; o backend religa as chaves depois da migração.
+    cursor.execute("PRAGMA foreign_keys=OFF")
+    for tabela, criar, colunas in RECONSTRUCOES:
+        cursor.execute(criar)
+        cursor.execute(f"INSERT INTO {tabela}_nova ({colunas}) SELECT {colunas} FROM {tabela}")
+        cursor.execute(f"DROP TABLE {tabela}")
+        cursor.execute(f"ALTER TABLE {tabela}_nova RENAME TO {tabela}")
+    for comando in INDICES + TABELAS:
+        cursor.execute(comando)
@@ -0,0 +1,14 @@
+-- Equivalente SQLite de migracoes/mysql/0004_fatias_totais.sql.
+
+CREATE TABLE IF NOT EXISTS fatias_totais (
+    conta_id INT NOT NULL,
+    fatia INT NOT NULL,
+    total_depositos DOUBLE NOT NULL DEFAULT 0,
+    total_saques DOUBLE NOT NULL DEFAULT 0,
+    total_transferencias_enviadas DOUBLE NOT NULL DEFAULT 0,
+    total_transferencias_recebidas DOUBLE NOT NULL DEFAULT 0,
+    quantidade_transacoes INT NOT NULL DEFAULT 0,
+    ultima_transacao_id INT,
+    PRIMARY KEY (conta_id, fatia),
+    FOREIGN KEY (conta_id) REFERENCES contas(id) ON DELETE CASCADE
+);
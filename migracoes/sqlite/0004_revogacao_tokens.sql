@@ -0,0 +1,3 @@
+-- Equivalente SQLite de migracoes/mysql/0005_revogacao_tokens.sql.
+
+ALTER TABLE usuarios ADD COLUMN tokens_revogados_em DOUBLE NULL;
@@ -1,30 +0,0 @@
-CREATE DATABASE IF NOT EXISTS banco_simulador;
-USE banco_simulador;
-
-CREATE TABLE IF NOT EXISTS usuarios (
-    id INT AUTO_INCREMENT PRIMARY KEY,
-    username VARCHAR(255) UNIQUE NOT NULL,
-    senha_hash TEXT NOT NULL,
-    role VARCHAR(50) DEFAULT 'cliente',
-    criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
-
-CREATE TABLE IF NOT EXISTS contas (
-    id INT AUTO_INCREMENT PRIMARY KEY,
-    nome_titular VARCHAR(255) NOT NULL,
-    saldo FLOAT DEFAULT 0,
-    status VARCHAR(50) DEFAULT 'ativo',
-    usuario_id INT,
-    FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
-);
-
-CREATE TABLE IF NOT EXISTS transacoes (
-    id INT AUTO_INCREMENT PRIMARY KEY,
-    tipo VARCHAR(50) NOT NULL,
-    valor FLOAT NOT NULL,
-    data_hora TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    conta_id INT,
-    conta_destino_id INT,
-    FOREIGN KEY (conta_id) REFERENCES contas(id),
-    FOREIGN KEY (conta_destino_id) REFERENCES contas(id)
-);
@@ -0,0 +1,65 @@
+import signal
+
+from gunicorn.app.base import BaseApplication
+
+from main import create_app
+from app.config import Config
+from app import ciclo_de_vida, database
+
+
+def post_fork(server, worker):
+    database.reiniciar_apos_fork()
+
+
+def post_worker_init(worker):
+    # O gunicorn só começa a aceitar conexões neste worker depois deste hook:
+    # o aquecimento acontece antes do primeiro cliente.
+    ciclo_de_vida.aquecer(worker.wsgi)
+
+    # No SIGTERM, a readiness passa a responder 503 enquanto o worker drena as requisições.
+    anterior = signal.getsignal(signal.SIGTERM)
+    def ao_receber_sigterm(signum, frame):
+        ciclo_de_vida.marcar_encerrando()
+        if callable(anterior):
+            anterior(signum, frame)
+    signal.signal(signal.SIGTERM, ao_receber_sigterm)
+
+
+def worker_exit(server, worker):
+    ciclo_de_vida.encerrar(Config.SERVIDOR_TIMEOUT_ENCERRAMENTO)
+
+
+class Servidor(BaseApplication):
+    def __init__(self, app, opcoes):
+        self.app = app
+        self.opcoes = opcoes
+        super().__init__()
+
+    def load_config(self):
+        for chave, valor in self.opcoes.items():
+            self.cfg.set(chave, valor)
+
+    def load(self):
+        return self.app
+
+
+def main():
+    opcoes = {
+        "bind": Config.SERVIDOR_BIND,
+        "workers": Config.SERVIDOR_WORKERS,
+        "threads": Config.SERVIDOR_THREADS,
+        "worker_class": "gthread",
+        "timeout": Config.SERVIDOR_TIMEOUT,
+        "graceful_timeout": Config.SERVIDOR_TIMEOUT_ENCERRAMENTO,
+        # A aplicação é carregada uma vez no processo mestre e herdada pelos workers;
+        # pools, threads e processos auxiliares só nascem depois do fork.
+        "preload_app": True,
+        "post_fork": post_fork,
+        "post_worker_init": post_worker_init,
+        "worker_exit": worker_exit,
+    }
+    Servidor(create_app(), opcoes).run()
+
+
+if __name__ == "__main__":
+    main()
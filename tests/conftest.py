@@ -0,0 +1,141 @@
+import itertools
+import os
+import sqlite3
+import tempfile
+
+import pytest
+
+# A Config lê o ambiente na importação: o banco de teste precisa estar definido antes.
+PASTA = tempfile.mkdtemp(prefix="banco_simulador_testes_")
+PRIMARIO = os.path.join(PASTA, "primario.db")
+REPLICA = os.path.join(PASTA, "replica.db")
+os.environ.update(
+    SECRET_KEY="chave-de-teste",
+    DB_BACKEND="sqlite",
+    SQLITE_PATH=PRIMARIO,
+    DB_REPLICAS=REPLICA,
+    BCRYPT_USAR_PROCESSOS="false",
+    BCRYPT_LOG_ROUNDS="4",
+    ARQUIVO_PASTA=os.path.join(PASTA, "arquivo"),
+)
+
+import main  # noqa: E402
+
+
+def _copiar_para_replica():
+    origem = sqlite3.connect(PRIMARIO)
+    destino = sqlite3.connect(REPLICA)
+    try:
+        origem.backup(destino)
+    finally:
+        destino.close()
+        origem.close()
+
+
+_nomes = itertools.count()
+
+
+def _registrar(cliente, prefixo="usuario"):
+    # Cria usuário e conta e devolve (username, conta_id, cabeçalhos com o token).
+    username = f"{prefixo}{next(_nomes)}"
+    resposta = cliente.post("/auth/registrar", json={"username": username, "nome": username, "senha": "x"})
+    assert resposta.status_code == 201, resposta.get_json()
+    token = cliente.post("/auth/login", json={"username": username, "senha": "x"}).get_json()["access_token"]
+    return username, resposta.get_json()["conta_id"], {"Authorization": f"Bearer {token}"}
+
+
+def _tornar_admin(username, role="admin"):
+    conexao = sqlite3.connect(PRIMARIO)
+    try:
+        conexao.execute("UPDATE usuarios SET role = ? WHERE username = ?", (role, username))
+        conexao.commit()
+    finally:
+        conexao.close()
+
+
+@pytest.fixture(scope="session")
+def app():
+    app = main.create_app()
+    # Primeira conexão cria o schema no primário; a réplica começa como cópia dele.
+    app.test_client().get("/saude/vivo")
+    with app.app_context():
+        from app import database
+        database.get_conexão_db()
+    _copiar_para_replica()
+    return app
+
+
+@pytest.fixture
+def cliente(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def copiar_para_replica():
+    return _copiar_para_replica
+
+
+@pytest.fixture
+def tornar_admin():
+    return _tornar_admin
+
+
+@pytest.fixture
+def registrar():
+    return _registrar
+
+
+@pytest.fixture
+def consultar_primario():
+    # Consulta (ou altera) direto no arquivo do primário, sem passar pela aplicação.
+    def consultar(sql, parametros=()):
+        conexao = sqlite3.connect(PRIMARIO)
+        try:
+            linhas = conexao.execute(sql, parametros).fetchall()
+            conexao.commit()
+            return linhas
+        finally:
+            conexao.close()
+    return consultar
+
+
+@pytest.fixture
+def contador():
+    # Valor atual de uma série de /metrics, somando todas as threads.
+    from app import metricas
+
+    def valor(nome, **rotulos):
+        serie = nome + metricas.formatar_rotulos(tuple(rotulos.items())) + " "
+        for linha in metricas.coletar().splitlines():
+            if linha.startswith(serie):
+                return float(linha[len(serie):])
+        return 0
+    return valor
+
+
+@pytest.fixture
+def bancos_em_shards(app, monkeypatch, tmp_path):
+    # Troca, só durante o teste, o banco principal por um diretório novo com dois
+    # shards (DB_SHARDS) e sem réplicas. Devolve consultar(banco, sql, parametros),
+    # com banco None para o diretório ou a posição do shard.
+    from app import cache_contas, database
+    from app.config import Config
+
+    caminhos = {None: str(tmp_path / "diretorio.db"), 0: str(tmp_path / "shard0.db"), 1: str(tmp_path / "shard1.db")}
+    monkeypatch.setattr(Config, "SQLITE_PATH", caminhos[None])
+    monkeypatch.setattr(Config, "DB_SHARDS", [caminhos[0], caminhos[1]])
+    monkeypatch.setattr(Config, "DB_REPLICAS", [])
+    monkeypatch.setattr(database, "_backends", {})
+    monkeypatch.setattr(database, "_pools", {})
+    cache_contas.cache_contas.limpar()
+
+    def consultar(banco, sql, parametros=()):
+        conexao = sqlite3.connect(caminhos[banco])
+        try:
+            return conexao.execute(sql, parametros).fetchall()
+        finally:
+            conexao.close()
+
+    yield consultar
+    database.fechar_pool()
+    cache_contas.cache_contas.limpar()
@@ -0,0 +1,131 @@
+from datetime import date
+
+# Com réplicas configuradas, os módulos que passaram a ler delas continuam
+# escrevendo no primário: um caminho de escrita de cada um. O contador
+# banco_db_leituras_total mostra qual conexão serviu cada leitura.
+
+SERIES = (
+    ("replica", None),
+    ("primario", "sessao"),
+    ("primario", "conta"),
+)
+
+
+def leituras(contador):
+    return {
+        (destino, motivo): contador("banco_db_leituras_total", destino=destino, **({"motivo": motivo} if motivo else {}))
+        for destino, motivo in SERIES
+    }
+
+
+def diferenca(antes, depois):
+    return {serie: depois[serie] - antes[serie] for serie in antes if depois[serie] != antes[serie]}
+
+
+def test_auth_service_registra_e_le_o_perfil(app, cliente, registrar, contador, copiar_para_replica):
+    username, _, cabecalhos = registrar(cliente)
+
+    # Logo após o registro a réplica ainda não tem o usuário: o cookie da escrita
+    # manda a leitura ao primário.
+    antes = leituras(contador)
+    resposta = cliente.get("/auth/perfil", headers=cabecalhos)
+    assert resposta.status_code == 200
+    assert resposta.get_json()["username"] == username
+    assert diferenca(antes, leituras(contador)) == {("primario", "sessao"): 1}
+
+    # Sem o cookie, e com a réplica em dia, a mesma leitura vai à réplica.
+    copiar_para_replica()
+    antes = leituras(contador)
+    resposta = app.test_client().get("/auth/perfil", headers=cabecalhos)
+    assert resposta.get_json()["username"] == username
+    assert diferenca(antes, leituras(contador)) == {("replica", None): 1}
+
+
+def test_conta_e_totais_service_gravam_deposito_e_saque(app, cliente, registrar, contador, consultar_primario):
+    _, conta_id, cabecalhos = registrar(cliente)
+    antes = leituras(contador)
+    assert cliente.put(f"/conta/conta/{conta_id}/depositar", json={"deposito": 50}, headers=cabecalhos).status_code == 200
+    assert cliente.put(f"/conta/conta/{conta_id}/sacar", json={"saque": 20}, headers=cabecalhos).status_code == 200
+    # As escritas não abrem conexão de leitura.
+    assert diferenca(antes, leituras(contador)) == {}
+    assert consultar_primario("SELECT saldo FROM contas WHERE id = ?", (conta_id,)) == [(30,)]
+    assert consultar_primario(
+        "SELECT tipo, valor FROM transacoes WHERE conta_id = ? ORDER BY id", (conta_id,)) == [("deposito", 50), ("saque", 20)]
+
+    # O cookie da escrita manda a leitura seguinte desta sessão ao primário.
+    extrato = cliente.get(f"/conta/conta/{conta_id}/extrato").get_json()
+    assert extrato["saldo_atual"] == 30
+    assert extrato["total_depositos"] == 50
+    assert extrato["total_saques"] == 20
+    assert set(diferenca(antes, leituras(contador))) == {("primario", "sessao")}
+
+    # Outra sessão também lê do primário enquanto a conta está marcada como escrita.
+    antes = leituras(contador)
+    assert app.test_client().get(f"/conta/conta/{conta_id}/extrato").get_json()["saldo_atual"] == 30
+    assert set(diferenca(antes, leituras(contador))) == {("primario", "conta")}
+
+
+def test_conta_service_grava_transferencia(cliente, registrar, contador, consultar_primario):
+    _, origem, cabecalhos = registrar(cliente)
+    _, destino, _ = registrar(cliente)
+    cliente.put(f"/conta/conta/{origem}/depositar", json={"deposito": 10}, headers=cabecalhos)
+    antes = leituras(contador)
+    resposta = cliente.post("/conta/conta/transferir",
+                            json={"conta_origem": origem, "conta_destino": destino, "valor": 4}, headers=cabecalhos)
+    assert resposta.status_code == 200, resposta.get_json()
+    assert diferenca(antes, leituras(contador)) == {}
+    assert consultar_primario(
+        "SELECT id, saldo FROM contas WHERE id IN (?, ?) ORDER BY id", (origem, destino)) == [(origem, 6), (destino, 4)]
+    assert consultar_primario(
+        "SELECT tipo, valor, conta_destino_id FROM transacoes WHERE conta_id = ? AND tipo = 'transferencia'",
+        (origem,)) == [("transferencia", -4, destino)]
+
+
+def test_admin_service_cria_administrador(app, cliente, registrar, tornar_admin, copiar_para_replica, contador,
+                                         consultar_primario):
+    username, _, _ = registrar(cliente)
+    tornar_admin(username)
+    token = cliente.post("/auth/login", json={"username": username, "senha": "x"}).get_json()["access_token"]
+    cabecalhos = {"Authorization": f"Bearer {token}"}
+
+    resposta = cliente.post("/admin/criar", json={"username": f"{username}_admin", "senha": "x"}, headers=cabecalhos)
+    assert resposta.status_code == 201, resposta.get_json()
+    assert consultar_primario("SELECT role FROM usuarios WHERE username = ?", (f"{username}_admin",)) == [("admin",)]
+
+    # A listagem não cita uma conta: com a réplica em dia e sem o cookie, ela é servida pela réplica.
+    copiar_para_replica()
+    antes = leituras(contador)
+    contas = app.test_client().get("/admin/contas", headers=cabecalhos)
+    assert contas.status_code == 200
+    assert diferenca(antes, leituras(contador)) == {("replica", None): 1}
+
+
+def test_snapshot_service_gera_snapshots(app, cliente, registrar, consultar_primario):
+    from app.services.snapshot_service import SnapshotService
+    _, conta_id, cabecalhos = registrar(cliente)
+    cliente.put(f"/conta/conta/{conta_id}/depositar", json={"deposito": 50}, headers=cabecalhos)
+    cliente.put(f"/conta/conta/{conta_id}/sacar", json={"saque": 20}, headers=cabecalhos)
+    # Só dias já encerrados viram snapshot: as transações passam para dias anteriores.
+    consultar_primario(
+        "UPDATE transacoes SET data_hora = datetime(data_hora, CASE tipo WHEN 'deposito' THEN '-3 days' ELSE '-2 days' END) "
+        "WHERE conta_id = ?", (conta_id,))
+    dias = [dia for dia, in consultar_primario("SELECT date(data_hora) FROM transacoes WHERE conta_id = ? ORDER BY id", (conta_id,))]
+
+    with app.app_context():
+        processados = SnapshotService.gerar_snapshots(date.today())
+
+    assert [dia["dia"] for dia in processados][:2] == dias
+    assert consultar_primario(
+        "SELECT dia, saldo FROM saldos_diarios WHERE conta_id = ? ORDER BY dia", (conta_id,)) == [(dias[0], 50), (dias[1], 30)]
+    assert consultar_primario("SELECT ultimo_dia FROM snapshots_progresso WHERE id = 1") == [(processados[-1]["dia"],)]
+    assert processados[-1]["dia"] >= dias[1]
+
+
+def test_cache_contas_marca_conta_escrita(cliente, registrar):
+    from app import cache_contas, replicas
+    _, conta_id, cabecalhos = registrar(cliente)
+    cliente.put(f"/conta/conta/{conta_id}/depositar", json={"deposito": 1}, headers=cabecalhos)
+    assert replicas.conta_escrita_recentemente(conta_id)
+
+    cache_contas.invalidar(conta_id + 1000)
+    assert replicas.conta_escrita_recentemente(conta_id + 1000)
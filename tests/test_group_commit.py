@@ -0,0 +1,91 @@
+import threading
+import time
+
+import pytest
+
+from app.config import Config
+from app.services import group_commit
+from app.services.group_commit import GroupCommit, OPERACAO_OK, OPERACAO_EXPIRADA
+
+
+@pytest.fixture
+def lotes(monkeypatch):
+    # Group commit ligado, com uma janela larga o bastante para juntar as
+    # requisições concorrentes; guarda a composição de cada lote aplicado.
+    monkeypatch.setattr(Config, "GROUP_COMMIT_ATIVO", True)
+    monkeypatch.setattr(Config, "GROUP_COMMIT_JANELA_MS", 50)
+    monkeypatch.setattr(group_commit, "_instancias", {})
+    aplicados = []
+    aplicar = GroupCommit.aplicar
+
+    def registrar_lote(self, lote):
+        aplicados.append([(pedido.tipo, pedido.valor) for pedido in lote])
+        aplicar(self, lote)
+    monkeypatch.setattr(GroupCommit, "aplicar", registrar_lote)
+    return aplicados
+
+
+def test_depositos_e_saques_concorrentes(app, registrar, consultar_primario, lotes):
+    cliente = app.test_client()
+    _, conta_id, cabecalhos = registrar(cliente, "lote")
+    assert cliente.put(f"/conta/conta/{conta_id}/depositar", json={"deposito": 1000}, headers=cabecalhos).status_code == 200
+
+    operacoes = [("depositar", "deposito", 5)] * 12 + [("sacar", "saque", 20)] * 12 + [("sacar", "saque", 100000)]
+    largada = threading.Barrier(len(operacoes))
+    respostas = [None] * len(operacoes)
+
+    def enviar(posicao, rota, campo, valor):
+        cliente_thread = app.test_client()
+        largada.wait()
+        respostas[posicao] = cliente_thread.put(
+            f"/conta/conta/{conta_id}/{rota}", json={campo: valor}, headers=cabecalhos).status_code
+
+    threads = [threading.Thread(target=enviar, args=(posicao, *operacao)) for posicao, operacao in enumerate(operacoes)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # O saque sem saldo é recusado sozinho; os demais pedidos do mesmo lote valem.
+    assert respostas[:-1] == [200] * (len(operacoes) - 1)
+    assert respostas[-1] == 400
+    assert any(("saque", 100000) in lote and len(lote) > 1 for lote in lotes)
+
+    assert consultar_primario("SELECT saldo FROM contas WHERE id = ?", (conta_id,)) == [(1000 + 12 * 5 - 12 * 20,)]
+    # Uma linha por operação confirmada: o depósito inicial e as 24 aceitas.
+    assert consultar_primario(
+        "SELECT tipo, COUNT(*), SUM(valor) FROM transacoes WHERE conta_id = ? GROUP BY tipo ORDER BY tipo",
+        (conta_id,)) == [("deposito", 13, 1060), ("saque", 12, 240)]
+    assert consultar_primario(
+        "SELECT total_depositos, total_saques, quantidade_transacoes FROM totais_conta WHERE conta_id = ?",
+        (conta_id,)) == [(1060, 240, 25)]
+    assert consultar_primario(
+        "SELECT ultima_transacao_id FROM totais_conta WHERE conta_id = ?", (conta_id,)
+    ) == consultar_primario("SELECT MAX(id) FROM transacoes WHERE conta_id = ?", (conta_id,))
+
+
+def test_pedido_que_expira_na_fila_nao_e_aplicado(app, registrar, consultar_primario):
+    cliente = app.test_client()
+    _, conta_id, _ = registrar(cliente, "lote")
+    instancia = GroupCommit(5, 10)
+    aplicar = instancia.aplicar
+
+    def aplicar_devagar(lote):
+        time.sleep(0.5)
+        aplicar(lote)
+    instancia.aplicar = aplicar_devagar
+
+    resultados = {}
+    primeiro = threading.Thread(target=lambda: resultados.setdefault(
+        "no_lote", instancia.submeter("deposito", 5, conta_id, 0.1)))
+    primeiro.start()
+    time.sleep(0.05)
+    # O segundo pedido fica na fila enquanto o lote do primeiro demora.
+    resultados["na_fila"] = instancia.submeter("deposito", 7, conta_id, 0.1)
+    primeiro.join()
+
+    # Quem já estava no lote espera o commit em vez de desistir no timeout.
+    assert resultados == {"no_lote": OPERACAO_OK, "na_fila": OPERACAO_EXPIRADA}
+    time.sleep(0.6)
+    assert consultar_primario("SELECT saldo FROM contas WHERE id = ?", (conta_id,)) == [(5,)]
+    assert consultar_primario("SELECT valor FROM transacoes WHERE conta_id = ?", (conta_id,)) == [(5,)]
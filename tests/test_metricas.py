@@ -0,0 +1,32 @@
+import threading
+
+from app import metricas
+
+
+def contador(texto, nome):
+    for linha in texto.splitlines():
+        if linha.startswith(nome + " "):
+            return float(linha.split()[-1])
+    return 0
+
+
+def test_threads_encerradas_nao_acumulam_acumuladores():
+    antes = contador(metricas.coletar(), "banco_teste_threads_total")
+
+    def trabalhar():
+        metricas.somar("banco_teste_threads_total")
+        metricas.observar("banco_teste_threads_segundos", (), 0.01)
+
+    for _ in range(5):
+        threads = [threading.Thread(target=trabalhar) for _ in range(40)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    texto = metricas.coletar()
+    # Os números das 200 threads continuam na coleta, mas a lista só tem as vivas.
+    assert contador(texto, "banco_teste_threads_total") == antes + 200
+    assert contador(texto, "banco_teste_threads_segundos_count") >= 200
+    vivas = {thread.ident for thread in threading.enumerate()}
+    assert len(metricas._acumuladores) <= len(vivas)
@@ -0,0 +1,51 @@
+from app.services.auth_service import AuthService, cache_tokens
+
+
+def logar(cliente, username):
+    token = cliente.post("/auth/login", json={"username": username, "senha": "x"}).get_json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def tokens_em_cache(usuario_id):
+    return [claims for claims, _ in list(cache_tokens._itens.values()) if claims["user_id"] == usuario_id]
+
+
+def test_role_vem_do_banco_e_nao_do_token(cliente, registrar, tornar_admin):
+    username, _, cabecalhos = registrar(cliente, "token")
+    # Token emitido como cliente; o role atual é lido na primeira verificação.
+    tornar_admin(username)
+    assert cliente.get("/admin/pool", headers=cabecalhos).status_code == 200
+
+
+def test_revogar_derruba_admin_rebaixado(app, cliente, registrar, tornar_admin, consultar_primario):
+    username, _, _ = registrar(cliente, "token")
+    tornar_admin(username)
+    cabecalhos = logar(cliente, username)
+    assert cliente.get("/admin/pool", headers=cabecalhos).status_code == 200
+
+    tornar_admin(username, "cliente")
+    with app.app_context():
+        assert AuthService.revogar_tokens_usuario(consultar_primario("SELECT id FROM usuarios WHERE username = ?", (username,))[0][0])
+
+    assert cliente.get("/admin/pool", headers=cabecalhos).status_code == 401
+    # Um login novo vale, já com o role rebaixado.
+    novo = logar(cliente, username)
+    assert cliente.get("/auth/perfil", headers=novo).status_code == 200
+    assert cliente.get("/admin/pool", headers=novo).status_code == 403
+
+
+def test_aviso_de_outro_processo_tira_tokens_do_cache(cliente, registrar, tornar_admin, consultar_primario):
+    from app import cache_contas
+    username, _, _ = registrar(cliente, "token")
+    tornar_admin(username)
+    cabecalhos = logar(cliente, username)
+    assert cliente.get("/admin/pool", headers=cabecalhos).status_code == 200
+    usuario_id = consultar_primario("SELECT id FROM usuarios WHERE username = ?", (username,))[0][0]
+    assert tokens_em_cache(usuario_id)
+
+    # Outro processo rebaixou o usuário e publicou a revogação no canal.
+    tornar_admin(username, "cliente")
+    cache_contas.avisar_ouvintes_usuarios([usuario_id])
+
+    assert not tokens_em_cache(usuario_id)
+    assert cliente.get("/admin/pool", headers=cabecalhos).status_code == 403
@@ -0,0 +1,113 @@
+import itertools
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from app.config import Config
+from app.services import fatias_service
+from app.services.fatias_service import FatiasService
+from app.services.totais_service import TotaisService
+
+
+@pytest.fixture
+def conta_fatiada(app, registrar, monkeypatch):
+    cliente = app.test_client()
+    _, conta_id, cabecalhos = registrar(cliente, "fatia")
+    monkeypatch.setattr(Config, "SALDO_FATIADO_CONTAS", {conta_id})
+    monkeypatch.setattr(Config, "SALDO_FATIADO_FATIAS", 4)
+    return cliente, conta_id, cabecalhos
+
+
+def saldo_total(consultar_primario, conta_id):
+    # O saldo visível é a linha da conta mais as fatias.
+    (saldo,), = consultar_primario("SELECT saldo FROM contas WHERE id = ?", (conta_id,))
+    (fatias,), = consultar_primario("SELECT COALESCE(SUM(saldo), 0) FROM fatias_saldo WHERE conta_id = ?", (conta_id,))
+    return saldo + fatias
+
+
+def totais(consultar_primario, conta_id):
+    return consultar_primario(
+        """
+        SELECT SUM(total_depositos), SUM(total_saques), SUM(quantidade_transacoes), MAX(ultima_transacao_id)
+        FROM (SELECT * FROM totais_conta WHERE conta_id = ?
+              UNION ALL
+              SELECT conta_id, total_depositos, total_saques, total_transferencias_enviadas,
+                     total_transferencias_recebidas, quantidade_transacoes, ultima_transacao_id
+              FROM fatias_totais WHERE conta_id = ?)
+        """, (conta_id, conta_id))[0]
+
+
+def test_creditos_debitos_e_consolidacao_concorrentes(app, conta_fatiada, consultar_primario):
+    cliente, conta_id, cabecalhos = conta_fatiada
+    assert cliente.put(f"/conta/conta/{conta_id}/depositar", json={"deposito": 500}, headers=cabecalhos).status_code == 200
+
+    operacoes = [("depositar", "deposito", 10)] * 15 + [("sacar", "saque", 20)] * 15
+    largada = threading.Barrier(len(operacoes) + 1)
+    respostas = [None] * len(operacoes)
+
+    def enviar(posicao, rota, campo, valor):
+        cliente_thread = app.test_client()
+        largada.wait()
+        respostas[posicao] = cliente_thread.put(
+            f"/conta/conta/{conta_id}/{rota}", json={campo: valor}, headers=cabecalhos).status_code
+
+    def consolidar():
+        largada.wait()
+        with app.app_context():
+            for _ in range(5):
+                FatiasService.consolidar_todas(conta_id)
+
+    threads = [threading.Thread(target=enviar, args=(posicao, *operacao)) for posicao, operacao in enumerate(operacoes)]
+    threads.append(threading.Thread(target=consolidar))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Saldo suficiente para todos os saques, seja qual for a ordem.
+    assert respostas == [200] * len(operacoes)
+    assert saldo_total(consultar_primario, conta_id) == 500 + 15 * 10 - 15 * 20
+    (ultimo_id,), = consultar_primario("SELECT MAX(id) FROM transacoes WHERE conta_id = ?", (conta_id,))
+    assert totais(consultar_primario, conta_id) == (650, 300, 31, ultimo_id)
+    with app.app_context():
+        assert TotaisService.verificar(conta_id) == []
+
+    with app.app_context():
+        FatiasService.consolidar_todas(conta_id)
+    assert consultar_primario("SELECT saldo FROM contas WHERE id = ?", (conta_id,)) == [(350,)]
+    assert consultar_primario("SELECT SUM(saldo) FROM fatias_saldo WHERE conta_id = ?", (conta_id,)) == [(0,)]
+    assert consultar_primario(
+        "SELECT total_depositos, total_saques, quantidade_transacoes FROM totais_conta WHERE conta_id = ?",
+        (conta_id,)) == [(650, 300, 31)]
+
+
+def test_debito_que_precisa_da_varredura(conta_fatiada, consultar_primario, contador, monkeypatch):
+    cliente, conta_id, cabecalhos = conta_fatiada
+    # Fatias sorteadas em ordem: cada depósito cai numa fatia diferente.
+    fatias = itertools.count()
+    monkeypatch.setattr(fatias_service, "random", SimpleNamespace(randrange=lambda quantidade: next(fatias) % quantidade))
+
+    def depositar_em_cada_fatia():
+        for _ in range(4):
+            assert cliente.put(f"/conta/conta/{conta_id}/depositar", json={"deposito": 10}, headers=cabecalhos).status_code == 200
+
+    depositar_em_cada_fatia()
+    assert consultar_primario("SELECT saldo FROM contas WHERE id = ?", (conta_id,)) == [(0,)]
+    varreduras = contador("banco_saldo_fatiado_varreduras_total")
+
+    # Nenhuma fatia nem a linha da conta cobrem 30 sozinhas; as quatro juntas, sim.
+    assert cliente.put(f"/conta/conta/{conta_id}/sacar", json={"saque": 30}, headers=cabecalhos).status_code == 200
+    assert contador("banco_saldo_fatiado_varreduras_total") == varreduras + 1
+    assert consultar_primario("SELECT saldo FROM contas WHERE id = ?", (conta_id,)) == [(10,)]
+    assert consultar_primario("SELECT SUM(saldo) FROM fatias_saldo WHERE conta_id = ?", (conta_id,)) == [(0,)]
+
+    # Com 50 no total, um saque de 60 é recusado depois da varredura e nada muda.
+    depositar_em_cada_fatia()
+    antes = consultar_primario("SELECT fatia, saldo FROM fatias_saldo WHERE conta_id = ? ORDER BY fatia", (conta_id,))
+    assert antes == [(0, 10), (1, 10), (2, 10), (3, 10)]
+    assert cliente.put(f"/conta/conta/{conta_id}/sacar", json={"saque": 60}, headers=cabecalhos).status_code == 400
+    assert contador("banco_saldo_fatiado_varreduras_total") == varreduras + 2
+    assert consultar_primario("SELECT saldo FROM contas WHERE id = ?", (conta_id,)) == [(10,)]
+    assert consultar_primario("SELECT fatia, saldo FROM fatias_saldo WHERE conta_id = ? ORDER BY fatia", (conta_id,)) == antes
+    assert totais(consultar_primario, conta_id)[:3] == (80, 30, 9)
@@ -0,0 +1,128 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.config import Config
+from app.services.transferencias_service import (
+    TransferenciasService,
+    TRANSFERENCIA_OK,
+    TRANSFERENCIA_DESTINO_INEXISTENTE,
+    TRANSFERENCIA_ABORTADA,
+    ESTADO_CONFIRMADA,
+    ESTADO_ABORTADA,
+    PAPEL_ORIGEM,
+    PAPEL_DESTINO,
+)
+
+# Com dois shards, a conta 1 fica no shard 1 e a conta 2 no shard 0.
+ORIGEM, DESTINO = 1, 2
+SHARD_ORIGEM, SHARD_DESTINO = 1, 0
+
+
+@pytest.fixture
+def contas(app, cliente, registrar, bancos_em_shards):
+    _, origem, cabecalhos = registrar(cliente, "shard")
+    _, destino, _ = registrar(cliente, "shard")
+    assert (origem, destino) == (ORIGEM, DESTINO)
+    assert cliente.put(f"/conta/conta/{ORIGEM}/depositar", json={"deposito": 100}, headers=cabecalhos).status_code == 200
+    return bancos_em_shards
+
+
+def saldo(consultar, shard, conta):
+    return consultar(shard, "SELECT saldo FROM contas WHERE id = ?", (conta,))[0][0]
+
+
+def pendentes(consultar, shard):
+    return consultar(shard, "SELECT transferencia_id, papel, conta_id, valor, estado FROM transferencias_pendentes ORDER BY transferencia_id")
+
+
+def totais(consultar, shard, conta):
+    linhas = consultar(shard, """
+        SELECT total_depositos, total_saques, total_transferencias_enviadas,
+            total_transferencias_recebidas, quantidade_transacoes
+        FROM totais_conta WHERE conta_id = ?""", (conta,))
+    return linhas[0] if linhas else None
+
+
+def diretorio(consultar, id_transferencia):
+    return consultar(None, "SELECT estado, concluida_em IS NOT NULL FROM transferencias_distribuidas WHERE id = ?",
+                     (id_transferencia,))[0]
+
+
+def depois_do_timeout():
+    return datetime.now() + timedelta(seconds=Config.SHARD_TIMEOUT_TRANSFERENCIA_SEGUNDOS + 1)
+
+
+def test_transferencia_confirmada_nos_dois_shards(app, contas):
+    with app.app_context():
+        assert TransferenciasService.transferir(30.0, ORIGEM, DESTINO) == TRANSFERENCIA_OK
+
+    assert saldo(contas, SHARD_ORIGEM, ORIGEM) == 70
+    assert saldo(contas, SHARD_DESTINO, DESTINO) == 30
+    assert pendentes(contas, SHARD_ORIGEM) == [(1, PAPEL_ORIGEM, ORIGEM, 30, ESTADO_CONFIRMADA)]
+    assert pendentes(contas, SHARD_DESTINO) == [(1, PAPEL_DESTINO, DESTINO, 30, ESTADO_CONFIRMADA)]
+    assert diretorio(contas, 1) == (ESTADO_CONFIRMADA, 1)
+    # Cada shard grava a sua cópia da transação e só conta a conta local.
+    assert totais(contas, SHARD_ORIGEM, ORIGEM) == (100, 0, -30, 0, 2)
+    assert totais(contas, SHARD_DESTINO, DESTINO) == (0, 0, 0, -30, 1)
+
+
+def test_destino_inexistente_devolve_o_valor_a_origem(app, contas):
+    with app.app_context():
+        assert TransferenciasService.transferir(30.0, ORIGEM, 1000) == TRANSFERENCIA_DESTINO_INEXISTENTE
+
+    assert saldo(contas, SHARD_ORIGEM, ORIGEM) == 100
+    assert pendentes(contas, SHARD_ORIGEM) == [(1, PAPEL_ORIGEM, ORIGEM, 30, ESTADO_ABORTADA)]
+    assert pendentes(contas, SHARD_DESTINO) == [(1, PAPEL_DESTINO, 1000, 30, ESTADO_ABORTADA)]
+    assert diretorio(contas, 1) == (ESTADO_ABORTADA, 1)
+    assert totais(contas, SHARD_ORIGEM, ORIGEM) == (100, 0, 0, 0, 1)
+    assert totais(contas, SHARD_DESTINO, DESTINO) is None
+
+
+def test_recuperar_aborta_transferencia_parada_em_iniciada(app, contas):
+    with app.app_context():
+        id_transferencia = TransferenciasService.registrar(30.0, ORIGEM, DESTINO)
+        assert TransferenciasService.preparar_origem(id_transferencia, ORIGEM, 30.0) == TRANSFERENCIA_OK
+        assert saldo(contas, SHARD_ORIGEM, ORIGEM) == 70
+
+        # O processo caiu antes de preparar o destino e decidir.
+        assert TransferenciasService.recuperar(depois_do_timeout()) == {ESTADO_CONFIRMADA: 0, ESTADO_ABORTADA: 1}
+
+        assert saldo(contas, SHARD_ORIGEM, ORIGEM) == 100
+        assert pendentes(contas, SHARD_ORIGEM) == [(id_transferencia, PAPEL_ORIGEM, ORIGEM, 30, ESTADO_ABORTADA)]
+        assert pendentes(contas, SHARD_DESTINO) == [(id_transferencia, PAPEL_DESTINO, DESTINO, 30, ESTADO_ABORTADA)]
+        assert diretorio(contas, id_transferencia) == (ESTADO_ABORTADA, 1)
+
+        # Um preparo atrasado esbarra na linha 'abortada' e não mexe em saldo nenhum.
+        assert TransferenciasService.preparar_destino(id_transferencia, DESTINO, 30.0) == TRANSFERENCIA_ABORTADA
+        assert TransferenciasService.preparar_origem(id_transferencia, ORIGEM, 30.0) == TRANSFERENCIA_ABORTADA
+
+    assert saldo(contas, SHARD_ORIGEM, ORIGEM) == 100
+    assert saldo(contas, SHARD_DESTINO, DESTINO) == 0
+    assert totais(contas, SHARD_ORIGEM, ORIGEM) == (100, 0, 0, 0, 1)
+    assert totais(contas, SHARD_DESTINO, DESTINO) is None
+
+
+def test_recuperar_conclui_transferencia_confirmada_em_um_shard_so(app, contas):
+    with app.app_context():
+        id_transferencia = TransferenciasService.registrar(30.0, ORIGEM, DESTINO)
+        assert TransferenciasService.preparar_origem(id_transferencia, ORIGEM, 30.0) == TRANSFERENCIA_OK
+        assert TransferenciasService.preparar_destino(id_transferencia, DESTINO, 30.0) == TRANSFERENCIA_OK
+        assert TransferenciasService.decidir(id_transferencia, ESTADO_CONFIRMADA) == ESTADO_CONFIRMADA
+        # Só a origem concluiu antes de o processo cair.
+        TransferenciasService.concluir_no_shard(
+            id_transferencia, PAPEL_ORIGEM, ORIGEM, ORIGEM, DESTINO, 30.0, ESTADO_CONFIRMADA)
+        assert saldo(contas, SHARD_DESTINO, DESTINO) == 0
+
+        assert TransferenciasService.recuperar(depois_do_timeout()) == {ESTADO_CONFIRMADA: 1, ESTADO_ABORTADA: 0}
+        # Uma segunda rodada não encontra nada, e repetir a conclusão não credita de novo.
+        assert TransferenciasService.recuperar(depois_do_timeout()) == {ESTADO_CONFIRMADA: 0, ESTADO_ABORTADA: 0}
+        TransferenciasService.concluir(id_transferencia, ORIGEM, DESTINO, 30.0, ESTADO_CONFIRMADA)
+
+    assert saldo(contas, SHARD_ORIGEM, ORIGEM) == 70
+    assert saldo(contas, SHARD_DESTINO, DESTINO) == 30
+    assert pendentes(contas, SHARD_ORIGEM) == [(id_transferencia, PAPEL_ORIGEM, ORIGEM, 30, ESTADO_CONFIRMADA)]
+    assert pendentes(contas, SHARD_DESTINO) == [(id_transferencia, PAPEL_DESTINO, DESTINO, 30, ESTADO_CONFIRMADA)]
+    assert diretorio(contas, id_transferencia) == (ESTADO_CONFIRMADA, 1)
+    assert totais(contas, SHARD_ORIGEM, ORIGEM) == (100, 0, -30, 0, 2)
+    assert totais(contas, SHARD_DESTINO, DESTINO) == (0, 0, 0, -30, 1)